@@ -0,0 +1,128 @@
+# bench/delta_bench.py
+# Delta transfer (BProto.send_file delta=True) lewat loopback: penerima punya
+# versi lama file, pengirim versi baru dengan sebagian blok 64 KiB ditimpa
+# data acak (default 1%) ditambah satu sisipan di tengah. Dibandingkan
+# dengan kirim penuh: waktu signature, waktu total, dan byte literal. Di
+# loopback kirim penuh hampir selalu lebih cepat; angka "impas" menunjukkan
+# kecepatan link di bawah mana delta lebih cepat.
+# Exit 1 jika ada transfer yang gagal atau hasilnya beda.
+#
+#   python bench/delta_bench.py [ukuran MiB] [persen berubah]
+import os
+import sys
+import time
+import random
+import shutil
+import socket
+import hashlib
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bproto import BProto
+from bproto.delta import DeltaSignature
+
+MIB = 1024 * 1024
+REGION = 64 * 1024
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(MIB)
+            if not chunk: break
+            h.update(chunk)
+    return h.hexdigest()
+
+def make_files(old_path, new_path, size_mib, percent):
+    """Tulis file lama + versi baru; return jumlah byte yang diubah"""
+    size = size_mib * MIB
+    regions = max(1, int(size * percent / 100) // REGION)
+    rng = random.Random(1)
+    marks = sorted(rng.randrange(0, size - REGION) for _ in range(regions))
+    insert_at = size // 2
+    changed = 0
+    with open(old_path, 'wb') as old, open(new_path, 'wb') as new:
+        for start in range(0, size, MIB):
+            block = os.urandom(MIB)
+            old.write(block)
+            edited = bytearray(block)
+            for mark in marks:
+                if start <= mark < start + MIB:
+                    lo = mark - start
+                    edited[lo:lo + REGION] = os.urandom(len(edited[lo:lo + REGION]))
+                    changed += REGION
+            if start <= insert_at < start + MIB:
+                # Sisipan menggeser sisa file: blok setelahnya tidak lagi sejajar
+                edited[insert_at - start:insert_at - start] = os.urandom(4096 + 123)
+            new.write(edited)
+    return changed
+
+def timed_send(sender, path, delta):
+    start = time.perf_counter()
+    ok = sender.send_file("127.0.0.1", path, delta=delta)
+    return ok, time.perf_counter() - start
+
+def main():
+    size_mib = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    percent = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+
+    workdir = tempfile.mkdtemp(prefix="bproto-bench-")
+    receiver = sender = None
+    try:
+        old_path = os.path.join(workdir, "old.bin")
+        src = os.path.join(workdir, "send", "payload.bin")
+        os.makedirs(os.path.dirname(src))
+        changed = make_files(old_path, src, size_mib, percent)
+        new_size = os.path.getsize(src)
+        expected = sha256(src)
+
+        port = free_port()
+        receiver = BProto("bench-recv", save_dir=os.path.join(workdir, "recv"), port=port, app_id="bench",
+                          durability="none", metrics_port=0)
+        receiver.start()
+        sender = BProto("bench-send", save_dir=os.path.join(workdir, "out"), port=free_port(), app_id="bench",
+                        auto_tune=False, metrics_port=0)
+        sender.discovery.peers["127.0.0.1"] = {"name": "bench-recv", "port": port, "proto": 3}
+        received = os.path.join(receiver.save_dir, "payload.bin")
+        literal = []
+        sender.events.on("log", lambda msg: msg.startswith("Delta ") and literal.append(int(msg.split()[2])))
+
+        print(f"{size_mib} MiB, {changed / MIB:.1f} MiB diubah ({percent:g}%) + 1 sisipan")
+        start = time.perf_counter()
+        DeltaSignature.from_file(old_path)
+        sig_time = time.perf_counter() - start
+
+        os.makedirs(receiver.save_dir, exist_ok=True)
+        shutil.copyfile(old_path, received)
+        ok, delta_time = timed_send(sender, src, True)
+        if not ok or not literal or sha256(received) != expected:
+            print("GAGAL: delta transfer")
+            return 1
+
+        os.remove(received)  # Kirim penuh tanpa versi lama (dan tanpa dedup ke file yang sama)
+        ok, full_time = timed_send(sender, src, False)
+        if not ok or sha256(received) != expected:
+            print("GAGAL: kirim penuh")
+            return 1
+
+        print(f"signature file lama : {sig_time:7.2f} s")
+        print(f"delta (total)       : {delta_time:7.2f} s, literal {literal[0] / MIB:.1f} MiB "
+              f"({literal[0] / new_size * 100:.2f}% file)")
+        print(f"kirim penuh         : {full_time:7.2f} s")
+        # Delta menang jika new_size / link > delta_time (+ literal / link)
+        saved = new_size - literal[0]
+        if delta_time > full_time and saved > 0:
+            print(f"impas pada link ~{saved / MIB / delta_time:.0f} MiB/s; di bawah itu delta lebih cepat")
+        return 0
+    finally:
+        if sender: sender.stop()
+        if receiver: receiver.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+# bench/frame_bench.py
+# Micro-benchmark header kontrol: JSON V2 vs frame biner V3 (bproto/frame.py).
+# Mengukur ukuran wire dan waktu encode / decode per pesan untuk header yang
+# paling sering lewat (FILE_INIT, OK + resume, PING).
+#
+#   python bench/frame_bench.py [jumlah]
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bproto import frame
+
+HEADERS = {
+    "FILE_INIT": {"type": "FILE_INIT", "auth": {"auth_mode": "TOKEN", "data": "5f2c9a0e7b41"}, "keepalive": True,
+                  "file": {"name": "IMG_20240101_120000.jpg", "size": 4823112, "kind": "file",
+                           "checksum": "9b" * 32, "trailer": True, "resume": True, "compression": "adaptive",
+                           "compressed": False, "encrypted": False, "dedup": True, "ack": True}},
+    "OK_RESUME": {"status": "OK", "resume_offset": 1048576, "resume_digest": "c4" * 32, "compression": "adaptive",
+                  "keepalive": True, "ack": True},
+    "PING": {"type": "PING"},
+}
+
+def bench(fn, number):
+    """Waktu terbaik per panggilan (mikrodetik) dari 5 ulangan"""
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{'header':<10} {'versi':<5} {'byte':>6} {'encode us':>10} {'decode us':>10}")
+    for name, header in HEADERS.items():
+        for version in (frame.VERSION_V2, frame.VERSION_V3):
+            wire = frame.encode_message(header, version)
+            assert frame.decode_message(wire) == (header, version)
+            enc = bench(lambda: frame.encode_message(header, version), number)
+            dec = bench(lambda: frame.decode_message(wire), number)
+            print(f"{name:<10} V{version:<4} {len(wire):>6} {enc:>10.2f} {dec:>10.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# bench/frame_fuzz.py
+# Fuzz decoder frame kontrol (bproto/frame.py). Input acak dan mutasi pesan
+# valid hanya boleh gagal dengan ValueError (FrameError / JSON rusak), tidak
+# pernah exception lain atau hang. Pesan valid harus kembali utuh (round trip).
+#
+#   python bench/frame_fuzz.py [iterasi] [seed]
+import os
+import sys
+import random
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bproto import frame
+
+SAMPLES = [
+    {"type": "FILE_INIT", "auth": {"auth_mode": "TOKEN", "data": "a1b2c3"}, "keepalive": True,
+     "file": {"name": "foto_001.jpg", "size": 4823112, "kind": "file", "checksum": "ab" * 32,
+              "trailer": True, "resume": True, "compression": "adaptive", "encrypted": False, "ack": True}},
+    {"status": "OK", "resume_offset": 1048576, "resume_digest": "cd" * 32, "compression": "off", "keepalive": True},
+    {"status": "CHALLENGE", "nonce": "9f8e7d6c"},
+    {"type": "MESSAGE", "content": "halo 👋", "ack": True},
+    {"status": "BUSY", "retry_after": 1.5},
+    {"range": {"id": "x" * 32, "index": 3, "count": 8, "offset": -1, "length": 2 ** 40}, "entries": [None, 0.25, b"\x00"]},
+]
+
+def random_value(rng, depth=0):
+    kind = rng.randrange(8 if depth < 4 else 5)
+    if kind == 0: return None
+    if kind == 1: return rng.random() < 0.5
+    if kind == 2: return rng.randrange(-2 ** 63, 2 ** 64)
+    if kind == 3: return rng.choice(frame.VALUES + ("", "ä€𝄞", "x" * rng.randrange(300)))
+    if kind == 4: return rng.random() * 1e6
+    if kind == 5: return bytes(rng.randrange(256) for _ in range(rng.randrange(40)))
+    if kind == 6: return [random_value(rng, depth + 1) for _ in range(rng.randrange(5))]
+    return {rng.choice(frame.KEYS + ("custom", "k" * 20)): random_value(rng, depth + 1) for _ in range(rng.randrange(6))}
+
+def mutate(rng, data):
+    data = bytearray(data)
+    for _ in range(rng.randrange(1, 5)):
+        op = rng.randrange(4)
+        if op == 0 and data:
+            data[rng.randrange(len(data))] = rng.randrange(256)
+        elif op == 1 and data:
+            del data[rng.randrange(len(data)):]
+        elif op == 2:
+            data[rng.randrange(len(data) + 1):0] = bytes(rng.randrange(256) for _ in range(rng.randrange(1, 8)))
+        elif data:
+            pos = rng.randrange(len(data))
+            data[pos:pos + 1] = b""
+    return bytes(data)
+
+def decode_any(data):
+    """Seperti penerima: byte pertama menentukan V2 / V3"""
+    if not data:
+        raise ValueError("kosong")
+    need = frame.message_need(data)
+    if need:
+        raise ValueError(f"kurang {need} byte")
+    return frame.decode_message(data)
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else int(time.time())
+    rng = random.Random(seed)
+    rejected = 0
+    start = time.perf_counter()
+
+    for i in range(iterations):
+        value = rng.choice(SAMPLES) if i % 2 else random_value(rng)
+        if not isinstance(value, dict):
+            value = {"data": value}
+        # Round trip pesan valid (V3; V2 hanya untuk yang bisa jadi JSON)
+        encoded = frame.encode_message(value, frame.VERSION_V3)
+        assert decode_any(encoded) == (value, frame.VERSION_V3), f"round trip gagal (seed {seed}, iterasi {i})"
+
+        if rng.random() < 0.1:
+            data = bytes(rng.randrange(256) for _ in range(rng.randrange(64)))
+        else:
+            data = mutate(rng, encoded if rng.random() < 0.8 else frame.encode_message(rng.choice(SAMPLES[:4])))
+        try:
+            decode_any(data)
+        except ValueError:
+            rejected += 1  # FrameError, JSONDecodeError, UnicodeDecodeError
+        except Exception as e:
+            print(f"GAGAL: {type(e).__name__}: {e} (seed {seed}, iterasi {i}, input {data.hex()})")
+            return 1
+
+    elapsed = time.perf_counter() - start
+    print(f"{iterations} iterasi OK dalam {elapsed:.1f}s (seed {seed}, {rejected} input ditolak)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+# bench/message_rate.py
+# Pesan chat per detik (BProto.send_message) ke satu peer lewat loopback:
+#   tanpa pool  -> tiap pesan connect + handshake baru (perilaku sebelum pool)
+#   pool        -> koneksi keep-alive dipakai ulang
+#   mux         -> stream kontrol di satu sesi mux
+# Pesan dikirim berurutan; latensi per pesan dicetak sebagai p50/p99.
+# RTT > 0 memasang DelayProxy (parallel_scaling.py) di antara kedua sisi;
+# connect ke proxy sendiri tidak ditunda, jadi biaya TCP handshake tidak ikut.
+# Exit 1 jika ada pesan yang gagal atau tidak sampai.
+#
+#   python bench/message_rate.py [jumlah pesan] [RTT ms]
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bproto import BProto
+from bproto import core as core_module
+from bench.parallel_scaling import DelayProxy, free_port
+
+MODES = (
+    # label, pool_size, mux
+    ("tanpa pool", 0, False),
+    ("pool", 2, False),
+    ("mux", 2, True),
+)
+
+def run_mode(workdir, port, count, pool_size, mux, inbox):
+    # mux_session memilih jalur dari flag modul ini (sama seperti config)
+    core_module.ENABLE_MUX = mux
+    sender = BProto("bench-send", save_dir=os.path.join(workdir, "out"), port=free_port(), app_id="bench",
+                    pool_size=pool_size, metrics_port=0)
+    sender.discovery.peers["127.0.0.1"] = {"name": "bench-recv", "port": port, "proto": 3}
+    try:
+        # Pesan pertama membuka koneksi/sesi & handshake, tidak ikut diukur
+        if not sender.send_message("127.0.0.1", "warmup"):
+            return None
+        time.sleep(0.2)  # Warmup sampai di penerima sebelum hitungan di-reset
+        inbox['count'] = 0
+        latencies = []
+        start = time.perf_counter()
+        for i in range(count):
+            sent = time.perf_counter()
+            if not sender.send_message("127.0.0.1", f"msg {i}"):
+                return None
+            latencies.append(time.perf_counter() - sent)
+        elapsed = time.perf_counter() - start
+        if not inbox['done'].wait(10) or inbox['count'] < count:
+            return None
+        latencies.sort()
+        return count / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+    finally:
+        sender.stop()
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rtt_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    workdir = tempfile.mkdtemp(prefix="bproto-bench-")
+    receiver = proxy = None
+    inbox = {'count': 0, 'done': threading.Event()}
+
+    def on_message(*_):
+        inbox['count'] += 1
+        if inbox['count'] >= count:
+            inbox['done'].set()
+
+    try:
+        port = free_port()
+        receiver = BProto("bench-recv", save_dir=os.path.join(workdir, "recv"), port=port, app_id="bench",
+                          metrics_port=0)
+        receiver.events.on("message", on_message)
+        receiver.start()
+        if rtt_ms:
+            proxy = DelayProxy(("127.0.0.1", port), rtt_ms / 2000, 1024 * 1024)
+            port = proxy.port
+
+        print(f"{count} pesan berurutan, RTT {rtt_ms:g} ms")
+        print(f"{'mode':<12} {'pesan/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        base = None
+        for label, pool_size, mux in MODES:
+            inbox['done'].clear()
+            result = run_mode(workdir, port, count, pool_size, mux, inbox)
+            if result is None:
+                print(f"GAGAL: mode {label}")
+                return 1
+            rate, p50, p99 = result
+            base = base or rate
+            print(f"{label:<12} {rate:>9.0f} {p50 * 1000:>8.2f} {p99 * 1000:>8.2f}  x{rate / base:.1f}")
+        return 0
+    finally:
+        if proxy: proxy.close()
+        if receiver: receiver.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
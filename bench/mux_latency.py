@@ -0,0 +1,110 @@
+# bench/mux_latency.py
+# Latensi chat di sesi mux (bproto/mux.py) saat transfer file besar sedang
+# berjalan di koneksi yang sama. Pesan prioritas kontrol tidak boleh
+# menunggu file selesai: gagal (exit 1) jika p99 melewati batas.
+#
+#   python bench/mux_latency.py [ukuran MiB] [limit MiB/s] [batas p99 ms]
+import os
+import sys
+import time
+import socket
+import shutil
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bproto.events import EventManager
+from bproto.transfer import TransferManager
+from bproto.cache import ChecksumCache, ContentIndex
+from bproto.shaping import Shaper
+from bproto.mux import MuxSession, MuxServer
+
+def tcp_pair():
+    """Koneksi TCP loopback (buffer kernel realistis, bukan socketpair)"""
+    serv = socket.socket()
+    serv.bind(("127.0.0.1", 0))
+    serv.listen(1)
+    client = socket.create_connection(serv.getsockname())
+    conn, _ = serv.accept()
+    serv.close()
+    return client, conn
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def chat_rtts(session, stop, interval=0.02):
+    rtts = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        resp = session.send_message("ping")
+        if not (resp and resp.get('ok')):
+            raise RuntimeError(f"Pesan gagal: {resp}")
+        rtts.append((time.perf_counter() - start) * 1000)
+        time.sleep(interval)
+    return rtts
+
+def main():
+    size_mib = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    limit_mib = float(sys.argv[2]) if len(sys.argv) > 2 else 32
+    max_p99 = float(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    workdir = tempfile.mkdtemp(prefix="bproto-bench-")
+    try:
+        events = EventManager()
+        transfer = TransferManager(os.path.join(workdir, "recv"), events, checksum_cache=ChecksumCache(None),
+                                   content_index=ContentIndex(None))
+        os.makedirs(transfer.save_dir)
+        src = os.path.join(workdir, "bulk.bin")
+        with open(src, 'wb') as f:
+            for _ in range(size_mib):
+                f.write(os.urandom(1024 * 1024))
+
+        client, conn = tcp_pair()
+        threading.Thread(target=MuxServer(conn, "127.0.0.1", transfer, events).serve, daemon=True).start()
+        session = MuxSession(client, "127.0.0.1", events)
+
+        # Baseline tanpa transfer
+        idle = []
+        for _ in range(50):
+            start = time.perf_counter()
+            session.send_message("ping")
+            idle.append((time.perf_counter() - start) * 1000)
+
+        # Bulk dibatasi supaya transfer berlangsung cukup lama (mensimulasikan link)
+        shaper = Shaper()
+        shaper.set_limit(int(limit_mib * 1024 * 1024))
+        result = {}
+        stop = threading.Event()
+
+        def bulk():
+            try:
+                with shaper.flow("127.0.0.1") as flow:
+                    result.update(session.send_file(src, throttle=flow))
+            finally:
+                stop.set()
+
+        started = time.perf_counter()
+        worker = threading.Thread(target=bulk)
+        worker.start()
+        busy = chat_rtts(session, stop)
+        worker.join()
+        elapsed = time.perf_counter() - started
+        session.close()
+
+        if not result.get('ok'):
+            print(f"GAGAL: transfer bulk gagal: {result}")
+            return 1
+        print(f"bulk {size_mib} MiB dalam {elapsed:.1f}s ({size_mib / elapsed:.1f} MiB/s)")
+        print(f"chat idle : p50 {percentile(idle, 50):.2f} ms, p99 {percentile(idle, 99):.2f} ms")
+        print(f"chat bulk : p50 {percentile(busy, 50):.2f} ms, p99 {percentile(busy, 99):.2f} ms "
+              f"({len(busy)} pesan)")
+        if percentile(busy, 99) > max_p99:
+            print(f"GAGAL: p99 selama transfer melewati {max_p99} ms")
+            return 1
+        return 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+# bench/parallel_scaling.py
+# Scaling transfer paralel (BProto.send_file streams=N) dari 1 sampai 8
+# koneksi lewat loopback dengan latensi buatan. Proxy TCP di tengah menahan
+# data `delay` detik per arah dan antrean per koneksi dibatasi `window` byte,
+# jadi satu koneksi mentok di ~window/delay seperti link dengan RTT tinggi.
+# Exit 1 jika ada transfer yang gagal.
+#
+#   python bench/parallel_scaling.py [ukuran MiB] [RTT ms] [window KiB]
+import os
+import sys
+import time
+import socket
+import shutil
+import tempfile
+import threading
+import collections
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bproto import BProto
+
+MIB = 1024 * 1024
+STREAMS = (1, 2, 4, 8)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class DelayProxy:
+    """Proxy TCP ke upstream dengan delay per arah dan antrean maksimal
+    window byte per arah per koneksi"""
+
+    def __init__(self, upstream, delay, window):
+        self.upstream = upstream
+        self.delay = delay
+        self.window = window
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(64)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            server = socket.create_connection(self.upstream)
+            for src, dst in ((client, server), (server, client)):
+                self._pipe(src, dst)
+
+    def _pipe(self, src, dst):
+        queue = collections.deque()
+        cond = threading.Condition()
+        state = {'queued': 0}
+
+        def reader():
+            while True:
+                try:
+                    data = src.recv(64 * 1024)
+                except OSError:
+                    data = b""
+                with cond:
+                    while data and state['queued'] >= self.window:
+                        cond.wait()
+                    queue.append((time.monotonic() + self.delay, data))
+                    state['queued'] += len(data)
+                    cond.notify_all()
+                if not data: return
+
+        def writer():
+            while True:
+                with cond:
+                    while not queue:
+                        cond.wait()
+                    due, data = queue.popleft()
+                wait = due - time.monotonic()
+                if wait > 0: time.sleep(wait)
+                try:
+                    if not data:
+                        dst.shutdown(socket.SHUT_WR)
+                        return
+                    dst.sendall(data)
+                except OSError:
+                    return
+                finally:
+                    with cond:
+                        state['queued'] -= len(data)
+                        cond.notify_all()
+
+        threading.Thread(target=reader, daemon=True).start()
+        threading.Thread(target=writer, daemon=True).start()
+
+    def close(self):
+        self.sock.close()
+
+def main():
+    size_mib = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    rtt_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    window_kib = int(sys.argv[3]) if len(sys.argv) > 3 else 256
+
+    workdir = tempfile.mkdtemp(prefix="bproto-bench-")
+    receiver = sender = proxy = None
+    try:
+        src = os.path.join(workdir, "payload.bin")
+        with open(src, 'wb') as f:
+            for _ in range(size_mib):
+                f.write(os.urandom(MIB))
+
+        port = free_port()
+        receiver = BProto("bench-recv", save_dir=os.path.join(workdir, "recv"), port=port, app_id="bench",
+                          durability="none", metrics_port=0)
+        receiver.start()
+        proxy = DelayProxy(("127.0.0.1", port), rtt_ms / 2000, window_kib * 1024)
+        sender = BProto("bench-send", save_dir=os.path.join(workdir, "send"), port=free_port(), app_id="bench",
+                        auto_tune=False, metrics_port=0)
+        sender.discovery.peers["127.0.0.1"] = {"name": "bench-recv", "port": proxy.port, "proto": 3}
+        received = os.path.join(receiver.save_dir, "payload.bin")
+
+        print(f"{size_mib} MiB, RTT {rtt_ms:g} ms, window {window_kib} KiB per koneksi")
+        print(f"{'streams':>7} {'detik':>7} {'MiB/s':>8} {'speedup':>8}")
+        base = None
+        for streams in STREAMS:
+            start = time.perf_counter()
+            ok = sender.send_file("127.0.0.1", src, streams=streams)
+            elapsed = time.perf_counter() - start
+            if not ok or os.path.getsize(received) != size_mib * MIB:
+                print(f"GAGAL: transfer {streams} stream")
+                return 1
+            os.remove(received)
+            rate = size_mib / elapsed
+            base = base or rate
+            print(f"{streams:>7} {elapsed:>7.2f} {rate:>8.1f} {rate / base:>7.2f}x")
+        return 0
+    finally:
+        if proxy: proxy.close()
+        if sender: sender.stop()
+        if receiver: receiver.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# bench/sendfile_throughput.py
+# Throughput & CPU pengirim di loopback: TransferManager.stream_file lewat
+# zero-copy (sendfile) vs loop baca + sendall. CPU diukur untuk thread
+# pengirim saja (user + sys) dan dinormalisasi per GiB. Penerima hanya
+# membaca frame lalu membuangnya, jadi disk penerima tidak ikut terukur.
+# Checksum sudah diketahui di depan (cache), jadi yang dibandingkan hanya
+# jalur payload. Exit 1 jika byte yang diterima tidak sama dengan file.
+#
+#   python bench/sendfile_throughput.py [ukuran MiB] [ulangan]
+import os
+import sys
+import time
+import socket
+import shutil
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bproto import transfer as transfer_module
+from bproto.config import CHUNK_SIZE
+from bproto.events import EventManager
+from bproto.transfer import TransferManager
+from bproto.cache import ChecksumCache, ContentIndex
+from bproto.utils import recv_exact, recv_into_exact, recv_json
+
+MIB = 1024 * 1024
+GIB = 1024 * MIB
+
+def tcp_pair():
+    serv = socket.socket()
+    serv.bind(("127.0.0.1", 0))
+    serv.listen(1)
+    client = socket.create_connection(serv.getsockname())
+    conn, _ = serv.accept()
+    serv.close()
+    return client, conn
+
+def drain(conn, result):
+    """Baca frame [4 byte length][data] sampai terminator + trailer, hitung byte payload"""
+    buf = memoryview(bytearray(CHUNK_SIZE))
+    received = 0
+    while True:
+        length = int.from_bytes(recv_exact(conn, 4), byteorder='big')
+        if length == 0: break
+        if length > len(buf):
+            buf = memoryview(bytearray(length))
+        recv_into_exact(conn, buf[:length])
+        received += length
+    result['trailer'] = recv_json(conn)
+    result['received'] = received
+    conn.close()
+
+def run_once(manager, path, size, checksum, zero_copy):
+    # stream_file memilih jalur dari flag modul ini (sama seperti config)
+    transfer_module.ENABLE_ZERO_COPY = zero_copy
+    client, conn = tcp_pair()
+    result = {}
+    receiver = threading.Thread(target=drain, args=(conn, result))
+    receiver.start()
+    cpu = time.thread_time()
+    start = time.perf_counter()
+    try:
+        manager.stream_file(client, path, 0, size, checksum)
+    finally:
+        client.close()
+    receiver.join()
+    elapsed = time.perf_counter() - start
+    cpu = time.thread_time() - cpu
+    if result.get('received') != size or result['trailer'].get('checksum') != checksum:
+        raise RuntimeError(f"Penerima mendapat {result.get('received')} dari {size} byte")
+    return elapsed, cpu
+
+def main():
+    size_mib = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    size = size_mib * MIB
+
+    workdir = tempfile.mkdtemp(prefix="bproto-bench-")
+    try:
+        manager = TransferManager(workdir, EventManager(), checksum_cache=ChecksumCache(None),
+                                  content_index=ContentIndex(None))
+        path = os.path.join(workdir, "payload.bin")
+        block = os.urandom(MIB)
+        with open(path, 'wb') as f:
+            for _ in range(size_mib):
+                f.write(block)
+        # Baca sekali: checksum untuk cache + page cache panas untuk semua mode
+        checksum = manager.calculate_checksum(path)
+
+        print(f"{size_mib} MiB lewat loopback, {repeat} ulangan, chunk {CHUNK_SIZE // MIB} MiB")
+        print(f"{'mode':<12} {'MiB/s':>8} {'CPU s/GiB':>10}")
+        rows = {}
+        for label, zero_copy in (("read+send", False), ("sendfile", True)):
+            runs = [run_once(manager, path, size, checksum, zero_copy) for _ in range(repeat)]
+            best = min(elapsed for elapsed, _ in runs)
+            cpu = sorted(cpu for _, cpu in runs)[len(runs) // 2] * GIB / size
+            rows[label] = (size / MIB / best, cpu)
+            print(f"{label:<12} {rows[label][0]:>8.0f} {cpu:>10.3f}")
+
+        base, fast = rows["read+send"], rows["sendfile"]
+        print(f"sendfile vs read+send: throughput x{fast[0] / base[0]:.2f}, "
+              f"CPU per GiB {fast[1] / base[1] * 100 - 100:+.0f}%")
+        return 0
+    except RuntimeError as e:
+        print(f"GAGAL: {e}")
+        return 1
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# bench/server_load.py
+# Load test lokal untuk satu server BProto:
+#   1. `clients` task AsyncBProto bersamaan, masing-masing mengirim beberapa
+#      pesan lalu satu file kecil (isi unik, jadi tidak kena dedup). Dicatat
+#      operasi/detik, latensi p50/p99, gagal, BUSY dari server, dan puncak
+#      inflight engine.
+#   2. `sessions` klien sinkron yang masing-masing membuka sesi mux. Thread
+#      mux-serve di server harus berhenti di MUX_SERVER_SESSIONS, sisanya
+#      memakai koneksi biasa.
+# Exit 1 jika ada operasi yang gagal atau thread mux melewati batas.
+#
+#   python bench/server_load.py [clients] [pesan per klien] [file KiB] [sessions]
+import os
+import sys
+import time
+import shutil
+import asyncio
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bproto import BProto
+from bproto.aio import AsyncBProto
+from bproto.config import MUX_SERVER_SESSIONS
+from bench.parallel_scaling import free_port
+
+class Sampler:
+    """Puncak nilai-nilai server selama load test (sampling tiap 5 ms)"""
+
+    def __init__(self, receiver):
+        self.receiver = receiver
+        self.peak_inflight = 0
+        self.peak_mux_threads = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(0.005):
+            mux_threads = sum(1 for t in threading.enumerate() if t.name.startswith("mux-serve"))
+            self.peak_inflight = max(self.peak_inflight, self.receiver.engine.inflight)
+            self.peak_mux_threads = max(self.peak_mux_threads, mux_threads)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+def rejected(receiver, reason):
+    values = receiver.stats().get("bproto_connections_rejected_total", {})
+    return sum(v for labels, v in values.items() if f'reason="{reason}"' in labels)
+
+async def client(aio, index, messages, path, latencies):
+    failures = 0
+    for i in range(messages):
+        start = time.perf_counter()
+        if await aio.send_message("127.0.0.1", f"load {index}/{i}"):
+            latencies.append(time.perf_counter() - start)
+        else:
+            failures += 1
+    start = time.perf_counter()
+    if await aio.send_file("127.0.0.1", path):
+        latencies.append(time.perf_counter() - start)
+    else:
+        failures += 1
+    return failures
+
+async def burst(aio, files, messages):
+    latencies = []
+    results = await asyncio.gather(*(client(aio, i, messages, path, latencies) for i, path in enumerate(files)))
+    return sum(results), sorted(latencies)
+
+def mux_sessions(workdir, port, count):
+    """Buka count sesi mux dari klien berbeda, return jumlah yang dapat sesi"""
+    senders = []
+    try:
+        granted = 0
+        for i in range(count):
+            sender = BProto(f"bench-mux-{i}", save_dir=os.path.join(workdir, "out"), port=free_port(),
+                            app_id="bench", metrics_port=0)
+            sender.discovery.peers["127.0.0.1"] = {"name": "bench-recv", "port": port, "proto": 3}
+            senders.append(sender)
+            if not sender.send_message("127.0.0.1", f"mux {i}"):
+                return None
+            granted += sender.mux_session("127.0.0.1") is not None
+        return granted
+    finally:
+        for sender in senders:
+            sender.stop()
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    file_kib = int(sys.argv[3]) if len(sys.argv) > 3 else 256
+    sessions = int(sys.argv[4]) if len(sys.argv) > 4 else MUX_SERVER_SESSIONS + 16
+
+    workdir = tempfile.mkdtemp(prefix="bproto-bench-")
+    receiver = sender = None
+    try:
+        src_dir = os.path.join(workdir, "src")
+        os.makedirs(src_dir)
+        files = []
+        for i in range(clients):
+            path = os.path.join(src_dir, f"file-{i}.bin")
+            with open(path, 'wb') as f:
+                f.write(os.urandom(file_kib * 1024))
+            files.append(path)
+
+        port = free_port()
+        receiver = BProto("bench-recv", save_dir=os.path.join(workdir, "recv"), port=port, app_id="bench",
+                          durability="none", metrics_port=0)
+        receiver.start()
+        sender = BProto("bench-send", save_dir=os.path.join(workdir, "out"), port=free_port(), app_id="bench",
+                        metrics_port=0)
+        sender.discovery.peers["127.0.0.1"] = {"name": "bench-recv", "port": port, "proto": 3}
+        aio = AsyncBProto(sender)
+
+        print(f"{clients} klien x ({messages} pesan + file {file_kib} KiB), "
+              f"worker {receiver.engine.workers}, antrean {receiver.engine.queue_size}")
+        sampler = Sampler(receiver)
+        start = time.perf_counter()
+        failures, latencies = asyncio.run(burst(aio, files, messages))
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+
+        ops = clients * (messages + 1)
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+        print(f"operasi     : {ops} dalam {elapsed:.2f} s ({ops / elapsed:.0f} op/s), gagal {failures}")
+        print(f"latensi     : p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+        print(f"server      : puncak inflight {sampler.peak_inflight}, BUSY {rejected(receiver, 'busy'):.0f}")
+
+        sampler = Sampler(receiver)
+        granted = mux_sessions(workdir, port, sessions)
+        sampler.stop()
+        if granted is None:
+            print("GAGAL: pesan lewat klien mux")
+            return 1
+        print(f"sesi mux    : {granted}/{sessions} dapat sesi, puncak thread mux-serve "
+              f"{sampler.peak_mux_threads} (batas {receiver.server.mux_sessions}), "
+              f"ditolak {rejected(receiver, 'mux_limit'):.0f}")
+        if failures or sampler.peak_mux_threads > receiver.server.mux_sessions:
+            return 1
+        return 0
+    finally:
+        if sender: sender.stop()
+        if receiver: receiver.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# bench/shaping_local.py
+# Cek lokal pembatas bandwidth (bproto/shaping.py) lewat TCP loopback:
+#   1. limit global tercapai (bukan jauh di atas / di bawah)
+#   2. interactive + bulk bersamaan: bulk turun ke BULK_SHARE dari limit
+#   3. limit diubah di tengah transfer langsung berlaku
+# Exit 1 jika rate terukur menyimpang lebih dari TOLERANCE.
+#
+#   python bench/shaping_local.py [limit MiB/s]
+import os
+import sys
+import time
+import socket
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bproto.config import BULK_SHARE, SHAPING_BURST
+from bproto.shaping import Shaper, PRIORITY_INTERACTIVE, PRIORITY_BULK
+
+MIB = 1024 * 1024
+TOLERANCE = 0.15
+PEER = "127.0.0.1"
+
+def tcp_pair():
+    serv = socket.socket()
+    serv.bind(("127.0.0.1", 0))
+    serv.listen(1)
+    client = socket.create_connection(serv.getsockname())
+    conn, _ = serv.accept()
+    serv.close()
+    threading.Thread(target=drain, args=(conn,), daemon=True).start()
+    return client
+
+def drain(conn):
+    while conn.recv(1024 * 1024):
+        pass
+    conn.close()
+
+def send_for(shaper, priority, seconds, sent):
+    """Kirim lewat Flow selama `seconds`; sent[priority] = byte terkirim"""
+    sock = tcp_pair()
+    block = b"\0" * (256 * 1024)
+    deadline = time.monotonic() + seconds
+    with shaper.flow(PEER, priority) as flow:
+        while time.monotonic() < deadline:
+            flow.sendall(sock, block)
+    sent[priority] = flow.sent
+    sock.close()
+
+def expected_rate(rate, seconds):
+    """Bucket mulai penuh: byte burst awal (rate * SHAPING_BURST) ikut terkirim"""
+    return rate * (1 + SHAPING_BURST / seconds)
+
+def check(label, rate, expected):
+    ok = abs(rate - expected) <= expected * TOLERANCE
+    print(f"{'OK   ' if ok else 'GAGAL'} {label}: {rate / MIB:.2f} MiB/s (target {expected / MIB:.2f})")
+    return ok
+
+def main():
+    limit = int(float(sys.argv[1]) * MIB) if len(sys.argv) > 1 else 16 * MIB
+    results = []
+
+    # 1. Limit global, satu flow
+    shaper = Shaper(limit)
+    sent = {}
+    send_for(shaper, PRIORITY_BULK, 2.0, sent)
+    results.append(check("global, satu flow", sent[PRIORITY_BULK] / 2.0, expected_rate(limit, 2.0)))
+
+    # 2. Interactive + bulk bersamaan
+    shaper = Shaper(limit)
+    sent = {}
+    threads = [threading.Thread(target=send_for, args=(shaper, p, 3.0, sent))
+               for p in (PRIORITY_INTERACTIVE, PRIORITY_BULK)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    results.append(check("bulk saat ada interactive", sent[PRIORITY_BULK] / 3.0,
+                         expected_rate(limit * BULK_SHARE, 3.0)))
+    # Interactive mendapat sisa limit global setelah porsi bulk
+    results.append(check("interactive", sent[PRIORITY_INTERACTIVE] / 3.0,
+                         expected_rate(limit, 3.0) - expected_rate(limit * BULK_SHARE, 3.0)))
+
+    # 3. Limit diturunkan di tengah transfer
+    shaper = Shaper(limit)
+    sent = {}
+    t = threading.Thread(target=send_for, args=(shaper, PRIORITY_BULK, 4.0, sent))
+    t.start()
+    time.sleep(2.0)
+    shaper.set_limit(limit // 4)
+    t.join()
+    expected = (expected_rate(limit, 2.0) * 2.0 + limit / 4 * 2.0) / 4.0
+    results.append(check("limit diubah saat jalan", sent[PRIORITY_BULK] / 4.0, expected))
+
+    return 0 if all(results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
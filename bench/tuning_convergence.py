@@ -0,0 +1,108 @@
+# bench/tuning_convergence.py
+# Konvergensi AutoTuner: file yang sama dikirim berulang ke satu peer dan
+# profile hasil tuning (ukuran chunk, SO_SNDBUF) dicetak per transfer.
+# Skenario: loopback langsung, link dibatasi Shaper, dan link dengan RTT
+# buatan (DelayProxy dari parallel_scaling.py). Tiap skenario ditutup
+# dengan transfer pembanding memakai profile default tanpa auto-tune.
+# Exit 1 jika ada transfer yang gagal.
+#
+#   python bench/tuning_convergence.py [ukuran MiB] [jumlah transfer]
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bproto import BProto
+from bench.parallel_scaling import DelayProxy, free_port
+
+MIB = 1024 * 1024
+LIMIT = 40 * MIB  # Batas Shaper untuk skenario "terbatas"
+
+def make_sender(workdir, port, auto_tune, limit=0):
+    sender = BProto("bench-send", save_dir=os.path.join(workdir, "out"), port=free_port(), app_id="bench",
+                    auto_tune=auto_tune, metrics_port=0)
+    sender.discovery.peers["127.0.0.1"] = {"name": "bench-recv", "port": port, "proto": 3}
+    if limit:
+        sender.set_bandwidth_limit(limit)
+    return sender
+
+def timed_send(sender, src, received):
+    start = time.perf_counter()
+    ok = sender.send_file("127.0.0.1", src, streams=1)
+    elapsed = time.perf_counter() - start
+    if not ok:
+        return None
+    os.remove(received)
+    return os.path.getsize(src) / MIB / elapsed
+
+def run_scenario(label, workdir, src, received, port, rounds, limit=0):
+    print(f"\n{label}")
+    print(f"{'transfer':>8} {'MiB/s':>8} {'chunk KiB':>10} {'sndbuf KiB':>11}")
+    sender = make_sender(workdir, port, True, limit)
+    try:
+        previous = None
+        converged = None
+        for i in range(1, rounds + 1):
+            rate = timed_send(sender, src, received)
+            if rate is None: return False
+            profile = sender.get_peer_profile("127.0.0.1")
+            current = (profile.chunk_size, profile.sndbuf)
+            if current == previous and converged is None:
+                converged = i - 1
+            elif current != previous:
+                converged = None
+            previous = current
+            sndbuf = f"{profile.sndbuf // 1024}" if profile.sndbuf else "kernel"
+            print(f"{i:>8} {rate:>8.1f} {profile.chunk_size // 1024:>10} {sndbuf:>11}")
+        print("profile stabil sejak transfer", converged if converged else "- (belum stabil)")
+    finally:
+        sender.stop()
+
+    fixed = make_sender(workdir, port, False, limit)
+    try:
+        rate = timed_send(fixed, src, received)
+        if rate is None: return False
+        print(f"{'default':>8} {rate:>8.1f} {fixed.get_peer_profile('127.0.0.1').chunk_size // 1024:>10}")
+    finally:
+        fixed.stop()
+    return True
+
+def main():
+    size_mib = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    workdir = tempfile.mkdtemp(prefix="bproto-bench-")
+    receiver = proxy = None
+    try:
+        src = os.path.join(workdir, "payload.bin")
+        with open(src, 'wb') as f:
+            for _ in range(size_mib):
+                f.write(os.urandom(MIB))
+
+        port = free_port()
+        receiver = BProto("bench-recv", save_dir=os.path.join(workdir, "recv"), port=port, app_id="bench",
+                          durability="none", metrics_port=0)
+        receiver.start()
+        received = os.path.join(receiver.save_dir, "payload.bin")
+        proxy = DelayProxy(("127.0.0.1", port), 0.010, 4 * MIB)
+
+        print(f"{size_mib} MiB per transfer, {rounds} transfer per skenario")
+        scenarios = (
+            ("loopback", port, 0),
+            (f"Shaper {LIMIT // MIB} MiB/s", port, LIMIT),
+            ("RTT 20 ms (proxy)", proxy.port, 0),
+        )
+        for label, target_port, limit in scenarios:
+            if not run_scenario(label, workdir, src, received, target_port, rounds, limit):
+                print(f"GAGAL: transfer {label}")
+                return 1
+        return 0
+    finally:
+        if proxy: proxy.close()
+        if receiver: receiver.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,6 @@
 # bproto/__init__.py
 from .core import BProto
 from .utils import SystemUtils
-from .protocol import PacketType
\ No newline at end of file
+from .protocol import PacketType
+from .tuning import TransferProfile
+from .aio import AsyncBProto
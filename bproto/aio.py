@@ -0,0 +1,336 @@
+# bproto/aio.py
+# Klien asyncio untuk BProto: wire protocol & auth sama dengan BProto,
+# tapi memakai asyncio streams sehingga ratusan transfer bisa jalan di
+# satu event loop dan bisa di-cancel (task.cancel / timeout).
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+
+from .config import (CONNECTION_TIMEOUT, VERIFY_INTEGRITY, ENABLE_ZERO_COPY, PROGRESS_QUEUE_SIZE, BINARY_FRAMES,
+                     BUSY_RETRIES, BUSY_RETRY_AFTER, ACK_TIMEOUT)
+from .protocol import PacketType
+from . import frame
+
+_CLOSED = object()
+
+async def read_json(reader, timeout=CONNECTION_TIMEOUT):
+    """Pesan kontrol V2 ([4 byte length][JSON]) atau frame V3 dari StreamReader"""
+    async def read():
+        head = await reader.readexactly(4)
+        if head[0] == frame.MAGIC:
+            head += await reader.readexactly(frame.HEADER.size - 4)
+            frame_type, _, _, length = frame.parse_header(head)
+            return frame.decode_control(frame_type, await reader.readexactly(length))
+        length = int.from_bytes(head, byteorder='big')
+        return json.loads((await reader.readexactly(length)).decode())
+    return await asyncio.wait_for(read(), timeout)
+
+def write_json(writer, data):
+    writer.write(frame.encode_message(data, frame.wire_version(writer)))
+
+class ProgressStream:
+    """Event progress sebagai async iterator:
+
+        async with client.progress() as stream:
+            async for filename, percent, mbps in stream: ...
+
+    Event bisa datang dari thread lain (server), jadi dimasukkan lewat
+    call_soon_threadsafe. Jika konsumen lambat, event paling lama dibuang."""
+
+    def __init__(self, events, loop, maxsize=PROGRESS_QUEUE_SIZE):
+        self._events = events
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize)
+        self._closed = False
+        events.on("progress", self._on_progress)
+
+    def _on_progress(self, filename, percent, speed):
+        if self._closed: return
+        try:
+            self._loop.call_soon_threadsafe(self._put, (filename, percent, speed))
+        except RuntimeError:
+            pass  # Loop sudah ditutup
+
+    def _put(self, item):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(item)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed and self._queue.empty():
+            raise StopAsyncIteration
+        item = await self._queue.get()
+        if item is _CLOSED:
+            raise StopAsyncIteration
+        return item
+
+    def close(self):
+        if self._closed: return
+        self._closed = True
+        self._events.off("progress", self._on_progress)
+        self._put(_CLOSED)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+class AsyncBProto:
+    """Versi asyncio dari sisi klien BProto.
+
+    Memakai instance BProto yang sama untuk security (token/handshake),
+    daftar peer (discovery), cache checksum dan EventManager, jadi server,
+    discovery dan callback lama tetap berjalan seperti biasa."""
+
+    def __init__(self, bp=None, **kwargs):
+        if bp is None:
+            from .core import BProto
+            bp = BProto(**kwargs)
+        self.bp = bp
+        self.events = bp.events
+        self.io_timeout = CONNECTION_TIMEOUT  # Batas satu operasi jaringan (connect, baca, drain)
+
+    def start(self):
+        self.bp.start()
+
+    def stop(self):
+        self.bp.stop()
+
+    @property
+    def peers(self):
+        return self.bp.peers
+
+    async def scan(self, wait=1.0):
+        """Broadcast discovery lalu tunggu balasan selama `wait` detik"""
+        self.bp.scan()
+        await asyncio.sleep(wait)
+        return dict(self.bp.peers)
+
+    def progress(self):
+        return ProgressStream(self.events, asyncio.get_running_loop())
+
+    async def _drain(self, writer):
+        await asyncio.wait_for(writer.drain(), self.io_timeout)
+
+    async def _connect(self, target_ip, packet_type, payload, busy_retries=BUSY_RETRIES):
+        """Connect + header + handshake, sama dengan BProto._connect_and_send_header.
+        Return (reader, writer, resp) atau None."""
+        if target_ip not in self.bp.peers:
+            self.events.error("Target IP unknown (Scan first?)")
+            return None
+
+        target_port = self.bp.peers[target_ip]['port']
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(target_ip, target_port), self.io_timeout)
+
+            header = {"type": packet_type, "auth": self.bp.security.get_outgoing_auth(target_ip)}
+            header.update(payload)
+            if BINARY_FRAMES and self.bp.peers[target_ip].get('proto', frame.VERSION_V2) >= frame.VERSION_V3:
+                frame.set_version(writer, frame.VERSION_V3)
+            write_json(writer, header)
+            await self._drain(writer)
+
+            resp = await read_json(reader, self.io_timeout)
+            if resp['status'] == "CHALLENGE":
+                proof = self.bp.security.create_proof(resp['nonce']).encode()
+                if frame.wire_version(writer) >= frame.VERSION_V3:
+                    proof = frame.encode_frame(frame.FRAME_PROOF, proof)
+                writer.write(proof)  # V2: mentah (server membacanya dengan satu recv)
+                await self._drain(writer)
+                resp = await read_json(reader, self.io_timeout)
+                if resp['status'] != "OK":
+                    self.events.error("Authentication Failed")
+                    writer.close()
+                    return None
+                self.bp.security.save_client_token(target_ip, resp['token'])
+
+            if resp['status'] == "OK":
+                return reader, writer, resp
+            writer.close()
+            if resp['status'] == PacketType.BUSY:
+                if busy_retries <= 0:
+                    self.events.error(f"Server {target_ip} sibuk, coba lagi nanti")
+                    return None
+                await asyncio.sleep(resp.get('retry_after', BUSY_RETRY_AFTER) * random.uniform(0.5, 1.0))
+                return await self._connect(target_ip, packet_type, payload, busy_retries - 1)
+            return None
+        except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError) as e:
+            # TimeoutError termasuk OSError, FrameError termasuk ValueError
+            self.events.error(f"Connection Error: {e!r}")
+            if writer: writer.close()
+            return None
+
+    async def send_message(self, target_ip, message, timeout=None):
+        return await self._send_simple(target_ip, PacketType.MESSAGE, message, f"Message sent to {target_ip}", timeout)
+
+    async def send_clipboard(self, target_ip, text, timeout=None):
+        return await self._send_simple(target_ip, PacketType.CLIPBOARD, text,
+                                       f"Clipboard data sent to {target_ip}", timeout)
+
+    async def _send_simple(self, target_ip, packet_type, content, log_msg, timeout):
+        conn = await asyncio.wait_for(self._connect(target_ip, packet_type, {"content": content}), timeout)
+        if not conn: return False
+        conn[1].close()
+        self.events.log(log_msg)
+        return True
+
+    async def send_file(self, target_ip, filepath, compression=None, timeout=None):
+        """Kirim file. timeout (detik) untuk seluruh transfer -> asyncio.TimeoutError.
+        Jika task di-cancel, koneksi ditutup dan file parsial di penerima
+        dipakai untuk resume pada pengiriman berikutnya.
+        Folder dikirim lewat BProto.send_file di thread (tidak bisa di-cancel)."""
+        return await asyncio.wait_for(self._send_file(target_ip, filepath, compression), timeout)
+
+    async def _send_file(self, target_ip, filepath, compression):
+        loop = asyncio.get_running_loop()
+        transfer = self.bp.transfer
+        try:
+            # prepare_file bisa meng-hash file kecil (dedup), jangan di thread loop
+            file_meta = await loop.run_in_executor(None, transfer.prepare_file, filepath)
+        except Exception as e:
+            self.events.error(str(e))
+            return False
+
+        if file_meta['kind'] == 'dir':
+            return await asyncio.to_thread(self.bp.send_file, target_ip, filepath, None, False, compression)
+
+        if compression:
+            file_meta['compression'] = compression
+            file_meta['compressed'] = compression == "zlib"
+        file_meta['delta'] = False
+        file_meta['ack'] = True  # Sukses = dikonfirmasi penerima (lihat BProto._await_ack)
+
+        conn = await self._connect(target_ip, PacketType.FILE_INIT, {"file": file_meta})
+        if not conn: return False
+
+        reader, writer, resp = conn
+        self.bp._apply_negotiated(file_meta, resp)
+        metrics = self.bp.metrics
+        started = time.perf_counter()
+        metrics.inc("bproto_transfers_active", direction="out")
+        ok = False
+        try:
+            if resp.get('have'):
+                if not await self._await_ack(reader, file_meta, resp): return False
+                self.events.log(f"Transfer Complete: {file_meta['name']} (sudah ada di penerima)")
+                ok = True
+                return True
+
+            start_byte, prefix_hasher = await self._resolve_resume(reader, writer, file_meta, resp)
+            checksum = await self._stream_file(target_ip, writer, file_meta, start_byte, prefix_hasher,
+                                               transfer.make_codec(file_meta))
+            if not await self._await_ack(reader, file_meta, resp, checksum): return False
+            self.events.log(f"Transfer Complete: {file_meta['name']}")
+            ok = True
+            return True
+        except (OSError, ConnectionError, ValueError) as e:
+            self.events.error(f"Stream Error: {e!r}")
+            return False
+        finally:
+            writer.close()
+            metrics.inc("bproto_transfers_active", -1, direction="out")
+            metrics.record_transfer("out", target_ip, file_meta['size'], time.perf_counter() - started, ok)
+
+    async def _await_ack(self, reader, file_meta, resp, checksum=None):
+        """Sama dengan BProto._await_ack"""
+        if not resp.get('ack'):
+            return True
+        ack = await read_json(reader, max(self.io_timeout, ACK_TIMEOUT))
+        remote = ack.get('checksum')
+        checksum = checksum or file_meta.get('checksum')
+        if ack.get('ok') and not (remote and checksum and remote != checksum):
+            return True
+        self.events.error(f"Transfer Failed: {file_meta['name']} (ditolak penerima)")
+        return False
+
+    async def _resolve_resume(self, reader, writer, file_meta, resp):
+        """Sama dengan BProto._resolve_resume; hash prefix di executor"""
+        if 'resume_digest' not in resp and not resp.get('resume_deferred'):
+            return 0, None
+
+        offset = resp.get('resume_offset', 0)
+        prefix_hasher = None
+        if offset:
+            prefix_hasher = await asyncio.get_running_loop().run_in_executor(
+                None, self.bp.transfer.prefix_hasher, file_meta['path'], offset)
+        digest = resp.get('resume_digest')
+        if resp.get('resume_deferred'):
+            digest = (await read_json(reader, max(self.io_timeout, ACK_TIMEOUT))).get('resume_digest')
+        matched = prefix_hasher is not None and prefix_hasher.hexdigest() == digest
+        start_byte = offset if matched else 0
+        if offset and not matched:
+            self.events.log(f"Resume ditolak (prefix berbeda), kirim ulang {file_meta['name']} dari awal")
+        write_json(writer, {"resume_offset": start_byte})
+        return start_byte, (prefix_hasher if matched else None)
+
+    async def _stream_file(self, target_ip, writer, file_meta, start_byte, prefix_hasher, codec):
+        """Framing sama dengan TransferManager.stream_file. Baca, hash dan
+        kompres/enkripsi jalan di executor; loop hanya menulis ke socket."""
+        loop = asyncio.get_running_loop()
+        transfer = self.bp.transfer
+        path, total_size = file_meta['path'], file_meta['size']
+        checksum = file_meta['checksum']
+        chunk_size = self.bp.tuner.profile_for(target_ip).chunk_size
+        st = os.stat(path)
+
+        hasher = None
+        if VERIFY_INTEGRITY and not checksum:
+            hasher = prefix_hasher if (prefix_hasher and start_byte) else hashlib.sha256()
+
+        with open(path, 'rb') as f:
+            if hasher and start_byte and hasher is not prefix_hasher:
+                await loop.run_in_executor(None, transfer._hash_range, f, hasher, start_byte)
+            f.seek(start_byte)
+            sent = start_byte
+            start_time = time.time()
+            zero_copy = ENABLE_ZERO_COPY and codec.is_identity
+
+            def next_frame():
+                chunk = f.read(chunk_size)
+                if not chunk: return None
+                if hasher: hasher.update(chunk)
+                return (len(chunk),) + codec.encode(chunk)
+
+            while sent < total_size:
+                if zero_copy:
+                    raw_len = min(chunk_size, total_size - sent)
+                    writer.write(raw_len.to_bytes(4, byteorder='big'))
+                    await self._drain(writer)
+                    # Kernel sendfile jika transport mendukung, selain itu fallback baca+tulis
+                    await loop.sendfile(writer.transport, f, sent, raw_len)
+                    if hasher:
+                        # Hash dari page cache, payload tetap lewat sendfile
+                        await loop.run_in_executor(None, transfer._hash_sent, f, hasher, sent, raw_len)
+                else:
+                    frame = await loop.run_in_executor(None, next_frame)
+                    if frame is None: break
+                    raw_len, data, flag = frame
+                    drain_start = time.perf_counter()
+                    writer.write((len(data) | flag).to_bytes(4, byteorder='big'))
+                    writer.write(data)
+                    await self._drain(writer)
+                    codec.record_send(len(data) + 4, time.perf_counter() - drain_start)
+                sent += raw_len
+
+                elapsed = time.time() - start_time
+                mbps = (sent - start_byte) / (1024*1024) / (elapsed if elapsed > 0 else 1)
+                self.events.progress(file_meta['name'], min((sent/total_size)*100, 99), mbps)
+
+        writer.write((0).to_bytes(4, byteorder='big'))
+        if hasher:
+            checksum = hasher.hexdigest()
+            if transfer.checksum_cache.get(path) is None and os.stat(path).st_mtime_ns == st.st_mtime_ns:
+                transfer.checksum_cache.put(path, checksum, st)
+        if VERIFY_INTEGRITY:
+            write_json(writer, {"checksum": checksum})
+        await self._drain(writer)
+        return checksum
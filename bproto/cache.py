@@ -0,0 +1,189 @@
+# bproto/cache.py
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+from .config import CHECKSUM_CACHE_FILE, CHECKSUM_CACHE_SIZE, CONTENT_INDEX_SIZE
+
+def _write_json(path, data):
+    """Tulis JSON lewat file sementara unik di folder yang sama lalu replace
+    atomik. Beberapa proses (client.py, syncb.py) bisa berbagi ~/.bproto."""
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+class ChecksumCache:
+    """Cache SHA-256 file yang pernah dikirim.
+    Key = (path, inode, size, mtime_ns) sehingga file yang berubah otomatis miss.
+    LRU terbatas (max_entries) dan disimpan ke JSON agar tetap ada setelah restart."""
+
+    SAVE_INTERVAL = 2.0  # Detik minimal antar penulisan ke disk
+
+    def __init__(self, cache_file=CHECKSUM_CACHE_FILE, max_entries=CHECKSUM_CACHE_SIZE):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0
+        self._load()
+
+    @staticmethod
+    def _key(path, st):
+        return f"{os.path.abspath(path)}|{st.st_ino}|{st.st_size}|{st.st_mtime_ns}"
+
+    def _load(self):
+        if not self.cache_file or not os.path.exists(self.cache_file): return
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+            for key, digest in data.items():
+                self._entries[key] = digest
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        except Exception as e:
+            print(f"[WARNING] Checksum cache rusak, diabaikan: {e}")
+
+    def get(self, path, st=None):
+        """Checksum dari cache, atau None jika file belum pernah di-hash / sudah berubah"""
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return None
+        key = self._key(path, st)
+        with self._lock:
+            digest = self._entries.get(key)
+            if digest is not None:
+                self._entries.move_to_end(key)
+            return digest
+
+    def put(self, path, digest, st=None):
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return
+        key = self._key(path, st)
+        with self._lock:
+            self._entries[key] = digest
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+        if time.time() - self._last_save >= self.SAVE_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Tulis cache ke disk (atomic replace)"""
+        if not self.cache_file: return
+        with self._lock:
+            if not self._dirty: return
+            data = dict(self._entries)
+            self._dirty = False
+            self._last_save = time.time()
+        try:
+            _write_json(self.cache_file, data)
+        except OSError as e:
+            print(f"[WARNING] Gagal menyimpan checksum cache: {e}")
+
+class ContentIndex:
+    """Index penerima: sha256 isi -> file lokal yang isinya itu.
+    Dipakai untuk dedup (pengirim menawarkan hash, penerima cukup link/copy).
+    Tiap entry menyimpan (size, mtime_ns) saat di-index; file yang sudah
+    berubah/hilang dibuang saat lookup."""
+
+    SAVE_INTERVAL = 2.0  # Perubahan dikumpulkan lalu ditulis thread background
+
+    def __init__(self, index_file, max_entries=CONTENT_INDEX_SIZE):
+        self.index_file = index_file
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # digest -> {path: [size, mtime_ns]}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._timer = None  # Flush terjadwal (add/discard tidak pernah menulis disk sendiri)
+        self._load()
+
+    def _load(self):
+        if not self.index_file or not os.path.exists(self.index_file): return
+        try:
+            with open(self.index_file, 'r') as f:
+                data = json.load(f)
+            for digest, paths in data.items():
+                self._entries[digest] = paths
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        except Exception as e:
+            print(f"[WARNING] Content index rusak, diabaikan: {e}")
+
+    def add(self, path, digest, st=None):
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            paths = self._entries.setdefault(digest, {})
+            paths[os.path.abspath(path)] = [st.st_size, st.st_mtime_ns]
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+        self._schedule_flush()
+
+    def lookup(self, digest, size):
+        """Path file lokal yang masih berisi digest ini, atau None"""
+        with self._lock:
+            candidates = list(self._entries.get(digest, {}).items())
+        for path, (rec_size, rec_mtime) in candidates:
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if st and st.st_size == rec_size == size and st.st_mtime_ns == rec_mtime:
+                return path
+            self.discard(digest, path)
+        return None
+
+    def discard(self, digest, path):
+        with self._lock:
+            paths = self._entries.get(digest)
+            if paths and paths.pop(path, None) is not None:
+                if not paths: del self._entries[digest]
+                self._dirty = True
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        """Index bisa berisi ratusan ribu entry: penulisan ulang JSON-nya
+        dikerjakan thread timer, paling sering sekali per SAVE_INTERVAL"""
+        if not self.index_file: return
+        with self._lock:
+            if self._timer is not None or not self._dirty: return
+            self._timer = threading.Timer(self.SAVE_INTERVAL, self._scheduled_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _scheduled_flush(self):
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    def flush(self):
+        if not self.index_file: return
+        with self._lock:
+            if not self._dirty: return
+            data = {digest: dict(paths) for digest, paths in self._entries.items()}
+            self._dirty = False
+        try:
+            _write_json(self.index_file, data)
+        except OSError as e:
+            print(f"[WARNING] Gagal menyimpan content index: {e}")
@@ -0,0 +1,195 @@
+# bproto/compression.py
+# Kompresi per transfer: mode dinegosiasikan lewat metadata file.
+#   "off"      -> chunk dikirim apa adanya
+#   "zlib"     -> semua chunk di-zlib (perilaku lama, kompatibel dgn 'compressed': True)
+#   "adaptive" -> per chunk: skip data yang tidak bisa dikompres, level dipilih
+#                 dari throughput link vs kecepatan kompresi; frame diberi flag
+import time
+import zlib
+import threading
+from .config import RECV_MAX_FRAME
+
+MODE_OFF = "off"
+MODE_ZLIB = "zlib"
+MODE_ADAPTIVE = "adaptive"
+MODES = (MODE_OFF, MODE_ZLIB, MODE_ADAPTIVE)
+
+# Bit tertinggi length prefix = frame terkompresi (hanya mode adaptive)
+FRAME_COMPRESSED = 0x80000000
+FRAME_LENGTH_MASK = 0x7FFFFFFF
+
+# Magic bytes format yang sudah terkompresi (offset, signature)
+COMPRESSED_MAGIC = (
+    (0, b'\xff\xd8\xff'),        # JPEG
+    (0, b'\x89PNG'),             # PNG
+    (0, b'GIF8'),                # GIF
+    (0, b'PK\x03\x04'),          # ZIP / DOCX / APK
+    (0, b'\x1f\x8b'),            # GZIP
+    (0, b'7z\xbc\xaf'),          # 7-Zip
+    (0, b'Rar!'),                # RAR
+    (0, b'\x28\xb5\x2f\xfd'),    # Zstandard
+    (0, b'\xfd7zXZ'),            # XZ
+    (0, b'BZh'),                 # BZIP2
+    (0, b'OggS'),                # OGG
+    (0, b'fLaC'),                # FLAC
+    (0, b'ID3'),                 # MP3
+    (4, b'ftyp'),                # MP4 / MOV / HEIC
+    (8, b'WEBP'),                # WEBP
+)
+
+LEVELS = (1, 3, 6, 9)
+# Perkiraan relatif (kecepatan, rasio) terhadap level 1 sebelum level itu terukur
+_LEVEL_SPEED = {1: 1.0, 3: 0.75, 6: 0.35, 9: 0.12}
+_LEVEL_RATIO = {1: 1.0, 3: 0.96, 6: 0.92, 9: 0.9}
+
+def sniff_compressed(data):
+    """True jika awal data cocok dengan magic bytes format terkompresi"""
+    head = bytes(data[:16])
+    return any(head[off:off + len(sig)] == sig for off, sig in COMPRESSED_MAGIC)
+
+class AdaptiveCompressor:
+    """Keputusan kompresi per chunk untuk satu transfer. plan() dipanggil
+    berurutan (thread pembaca file), compress() boleh paralel di worker pool;
+    statistik level dikunci."""
+
+    SAMPLE_SIZE = 64 * 1024
+    MIN_GAIN = 0.9  # Sampel harus mengecil minimal 10%, selain itu kirim raw
+    ALPHA = 0.3     # Bobot EWMA
+
+    def __init__(self):
+        self.level = 1
+        self.link_bps = None  # Throughput socket terukur (byte/detik, ukuran wire)
+        self.speed = {}       # level -> kecepatan kompresi (byte raw/detik)
+        self.ratio = {}       # level -> rasio output/input
+        self.first_chunk = True
+        self._lock = threading.Lock()
+
+    def _ewma(self, old, new):
+        return new if old is None else old + self.ALPHA * (new - old)
+
+    def record_send(self, nbytes, seconds):
+        if seconds > 0 and nbytes > 0:
+            with self._lock:
+                self.link_bps = self._ewma(self.link_bps, nbytes / seconds)
+
+    def _estimate(self, level):
+        base_speed = self.speed.get(1) or (self.speed.get(self.level, 0) / _LEVEL_SPEED[self.level])
+        base_ratio = self.ratio.get(1) or (self.ratio.get(self.level, 1) / _LEVEL_RATIO[self.level])
+        speed = self.speed.get(level) or base_speed * _LEVEL_SPEED[level]
+        ratio = self.ratio.get(level) or base_ratio * _LEVEL_RATIO[level]
+        return speed, ratio
+
+    def _choose_level(self):
+        """Pilih level dengan throughput efektif terbesar: min(kecepatan kompresi,
+        link / rasio). Return None jika kirim raw lebih cepat."""
+        if not self.link_bps or not self.speed:
+            return self.level
+        best_level, best_rate = None, self.link_bps  # Kandidat raw
+        for level in LEVELS:
+            speed, ratio = self._estimate(level)
+            rate = min(speed, self.link_bps / max(ratio, 0.01))
+            if rate > best_rate * 1.05:
+                best_level, best_rate = level, rate
+        return best_level
+
+    def plan(self, chunk):
+        """Level zlib untuk chunk berikutnya dalam urutan file, None = kirim raw.
+        Sniffing hanya untuk chunk pertama file."""
+        with self._lock:
+            if self.first_chunk:
+                self.first_chunk = False
+                if sniff_compressed(chunk):
+                    return None
+            level = self._choose_level()
+            if level is not None:
+                self.level = level
+            return level
+
+    def compress(self, chunk, level=None):
+        """Return (data, terkompresi). level dari plan(); tanpa level, plan()
+        dipanggil di sini (pemakaian berurutan)."""
+        if level is None:
+            level = self.plan(chunk)
+            if level is None:
+                return chunk, False
+
+        # Sampel dari tengah chunk (header file sering tidak representatif)
+        if len(chunk) > self.SAMPLE_SIZE * 2:
+            mid = len(chunk) // 2
+            sample = chunk[mid:mid + self.SAMPLE_SIZE]
+            if len(zlib.compress(sample, 1)) > len(sample) * self.MIN_GAIN:
+                return chunk, False
+
+        start = time.perf_counter()
+        out = zlib.compress(chunk, level)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            if elapsed > 0:
+                self.speed[level] = self._ewma(self.speed.get(level), len(chunk) / elapsed)
+            self.ratio[level] = self._ewma(self.ratio.get(level), len(out) / max(len(chunk), 1))
+
+        if len(out) >= len(chunk):
+            return chunk, False
+        return out, True
+
+_UNPLANNED = object()
+
+class FrameCodec:
+    """Transformasi frame untuk satu transfer: kompresi lalu enkripsi"""
+
+    def __init__(self, mode=MODE_OFF, security=None, encrypt=False):
+        self.mode = mode if mode in MODES else MODE_OFF
+        self.security = security if encrypt else None
+        self.adaptive = AdaptiveCompressor() if self.mode == MODE_ADAPTIVE else None
+
+    @property
+    def is_identity(self):
+        """True jika payload tidak diubah sama sekali (boleh zero-copy)"""
+        return self.mode == MODE_OFF and self.security is None
+
+    def plan(self, chunk):
+        """Keputusan adaptive untuk chunk berikutnya (diteruskan ke encode).
+        Dipanggil berurutan sebelum encode dijalankan paralel."""
+        return self.adaptive.plan(chunk) if self.adaptive else None
+
+    def encode(self, chunk, level=_UNPLANNED):
+        """Return (payload, flag) - flag di-OR ke length prefix.
+        level: hasil plan(); default diputuskan di sini (encode berurutan)."""
+        flag = 0
+        if self.mode == MODE_ZLIB:
+            chunk = zlib.compress(chunk)
+        elif self.adaptive:
+            if level is _UNPLANNED:
+                level = self.adaptive.plan(chunk)
+            if level is not None:
+                chunk, compressed = self.adaptive.compress(chunk, level)
+                if compressed: flag = FRAME_COMPRESSED
+        if self.security:
+            chunk = self.security.encrypt_data(chunk)
+        return chunk, flag
+
+    def decode(self, payload, flag):
+        if self.security:
+            try:
+                payload = self.security.decrypt_data(payload)
+            except Exception:
+                raise ValueError("Decryption error during transfer")
+        if self.mode == MODE_ZLIB or (self.mode == MODE_ADAPTIVE and flag):
+            try:
+                payload = zlib.decompress(payload)
+            except Exception:
+                raise ValueError("Decompression error")
+        return payload
+
+    def split_length(self, raw_len):
+        """Pisahkan flag dari length prefix (hanya mode adaptive memakai flag).
+        Length di atas RECV_MAX_FRAME ditolak: buffer dialokasikan sebesar ini."""
+        length, flag = raw_len, 0
+        if self.mode == MODE_ADAPTIVE:
+            length, flag = raw_len & FRAME_LENGTH_MASK, raw_len & FRAME_COMPRESSED
+        if length > RECV_MAX_FRAME:
+            raise ValueError(f"Chunk too large: {length} bytes (max {RECV_MAX_FRAME})")
+        return length, flag
+
+    def record_send(self, nbytes, seconds):
+        if self.adaptive: self.adaptive.record_send(nbytes, seconds)
@@ -1,6 +1,8 @@
 # bproto/config.py
+import os
 
-PROTOCOL_ID = b'BPROTO_V2'
+PROTOCOL_ID = b'BPROTO_V2'   # Prefix discovery (tetap, agar peer V2 tetap saling lihat)
+PROTOCOL_VERSION = 3         # Versi wire yang diiklankan di discovery
 DISCOVERY_PORT = 7001
 TCP_PORT = 7002
 
@@ -14,4 +16,112 @@ DEFAULT_SAVE_DIR = "BProto_Received"
 # WAJIB FALSE AGAR TIDAK ERROR "LIBRARY NOT FOUND"
 ENABLE_ENCRYPTION = False   
 ENABLE_COMPRESSION = False
-VERIFY_INTEGRITY = True
\ No newline at end of file
+VERIFY_INTEGRITY = True
+
+# Mode kompresi default per transfer: "off" | "zlib" | "adaptive"
+# (dinegosiasikan lewat metadata file; ENABLE_COMPRESSION lama = "zlib")
+COMPRESSION_MODE = "zlib" if ENABLE_COMPRESSION else "off"
+
+# Cache checksum pengirim: (path, inode, size, mtime_ns) -> sha256
+CHECKSUM_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".bproto", "checksums.json")
+CHECKSUM_CACHE_SIZE = 4096
+
+# Transfer paralel (multi-koneksi, per byte range). 1 = nonaktif
+PARALLEL_STREAMS = 1
+PARALLEL_MIN_RANGE = 1024 * 1024 * 16  # Range lebih kecil dari ini tidak dipecah
+RANGE_SESSION_TIMEOUT = 300
+
+# Pipeline pengirim: baca -> transform (zlib/AES, paralel) -> kirim
+PIPELINE_WORKERS = min(4, os.cpu_count() or 1)
+PIPELINE_DEPTH = 4  # Chunk maksimal yang antre (backpressure memori)
+
+# Zero-copy (sendfile) saat kompresi & enkripsi mati
+ENABLE_ZERO_COPY = True
+
+# Profile transfer (lihat bproto/tuning.py): "low_memory" | "default" | "high_throughput"
+TRANSFER_PROFILE = "default"
+AUTO_TUNE = True
+TUNE_WINDOW = 3.0        # Detik awal transfer yang dipakai untuk mengukur
+TUNE_FRAME_TIME = 0.05   # Target durasi kirim satu frame (detik)
+
+# Jalur tulis penerima (lihat bproto/storage.py)
+PREALLOCATE = True               # posix_fallocate ukuran file di depan
+DURABILITY = "fsync"             # "none" | "fsync" (saat selesai) | "periodic"
+FSYNC_INTERVAL = 1024 * 1024 * 64  # Mode periodic: fdatasync tiap N byte
+
+# Pipeline penerima (lihat bproto/pipeline.py): socket -> decode (paralel) -> write-behind
+RECV_PIPELINE = True
+RECV_DECODE_WORKERS = min(2, os.cpu_count() or 1)  # Worker zlib/AES-GCM bersama semua transfer
+RECV_PIPELINE_DEPTH = 4          # Frame maksimal antre per transfer (buffer terima dibatasi RECV_BUFFER_BYTES)
+RECV_BUFFER_BYTES = 1024 * 1024 * 32  # Total buffer terima per transfer; satu frame selalu boleh
+# Frame data terbesar yang diterima: chunk maksimal pengirim (tuning.MAX_CHUNK = 16 MiB)
+# + overhead zlib/AES-GCM. Length prefix di atas ini -> transfer ditolak sebelum alokasi
+RECV_MAX_FRAME = max(CHUNK_SIZE, 1024 * 1024 * 16) + 1024 * 64
+WRITE_BEHIND_SIZE = 1024 * 1024 * 4  # Frame kecil digabung sampai ukuran ini per write()
+
+# Shaping bandwidth kirim (lihat bproto/shaping.py). Limit dalam byte/detik, 0 = tanpa batas
+BANDWIDTH_LIMIT = 0
+DEFAULT_PRIORITY = "bulk"        # "interactive" | "bulk"
+BULK_SHARE = 0.1                 # Porsi bulk dari limit global saat ada transfer interactive
+SHAPING_SLICE = 64 * 1024        # Payload dikirim per potongan ini saat dibatasi
+SHAPING_BURST = 0.25             # Kapasitas bucket = rate * detik ini
+
+# Dedup isi file: pengirim menawarkan sha256, penerima hard link file yang sudah ada
+ENABLE_DEDUP = True
+DEDUP_HASH_LIMIT = 1024 * 1024 * 32  # File <= ini di-hash dulu jika belum ada di cache
+DEDUP_HARDLINK = True                # False = penerima tidak memakai dedup (beda filesystem juga terima penuh)
+CONTENT_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".bproto", "content_index")
+CONTENT_INDEX_SIZE = 100000
+
+# Pool koneksi klien (keep-alive). POOL_SIZE = koneksi idle maksimal per peer, 0 = nonaktif
+POOL_SIZE = 2
+POOL_IDLE_TIMEOUT = 30     # Detik; harus lebih kecil dari KEEPALIVE_TIMEOUT server
+POOL_PING_AFTER = 10       # Idle lebih lama dari ini -> PING dulu sebelum dipakai
+KEEPALIVE_TIMEOUT = 60     # Server menutup koneksi keep-alive yang idle
+
+# Klien asyncio (bproto/aio.py): event progress yang ditahan per iterator
+PROGRESS_QUEUE_SIZE = 256
+
+# Fan-out ke banyak peer (broadcast_file / broadcast_message)
+BROADCAST_CONCURRENCY = 8
+BROADCAST_TIMEOUT = 15     # Detik macet per operasi socket, per peer
+BROADCAST_RETRIES = 2
+BROADCAST_RETRY_DELAY = 0.5  # Backoff: delay * 2^(percobaan-1)
+
+# Frame kontrol biner V3 (lihat bproto/frame.py). False = selalu header JSON V2
+BINARY_FRAMES = True
+FRAME_MAX_PAYLOAD = 1024 * 1024 * 16
+
+# Multiplexing (lihat bproto/mux.py): satu koneksi per peer V3, banyak stream logis
+ENABLE_MUX = True               # Chat & clipboard ke peer V3 lewat sesi mux
+MUX_FILES = False               # True = send_file biasa juga lewat mux (tanpa resume/delta/kompresi/dedup)
+MUX_FRAME_SIZE = 64 * 1024      # Potongan DATA = waktu tunggu maksimal pesan kecil di belakang transfer besar
+MUX_WINDOW = 1024 * 1024 * 4    # Kredit awal per stream (byte yang boleh dikirim sebelum dikonfirmasi)
+MUX_NOTSENT_LOWAT = 16 * 1024   # Batas data belum terkirim di antrean kernel (TCP_NOTSENT_LOWAT)
+MUX_REPLY_TIMEOUT = 30          # Detik menunggu hasil stream dari penerima
+MUX_RETRY_AFTER = 30            # Detik peer yang gagal membuka sesi mux dilewati (pakai koneksi biasa)
+MUX_SERVER_SESSIONS = 64        # Sesi mux masuk maksimal (satu thread per sesi); lebih -> klien pakai koneksi biasa
+
+# Outbox (lihat bproto/outbox.py): antrean kirim persisten dengan retry
+OUTBOX_DIR = os.path.join(os.path.expanduser("~"), ".bproto", "outbox")
+OUTBOX_WORKERS = 2
+OUTBOX_BASE_DELAY = 2.0    # Detik; backoff = base * 2^(percobaan-1), jitter 50-100%
+OUTBOX_MAX_DELAY = 300
+OUTBOX_MAX_ATTEMPTS = 0    # 0 = coba terus sampai terkirim
+
+# Server: antrean accept kernel, worker terbatas, admission control (lihat ServerManager)
+DEBUG_LOG = False          # True = detail per koneksi (accept, handshake, file masuk) dikirim sebagai event log
+SERVER_BACKLOG = 128
+SERVER_WORKERS = 16        # Thread pemroses koneksi (handshake + transfer)
+SERVER_QUEUE = 256         # Koneksi siap yang boleh menunggu worker (tanpa thread); lebih dari ini -> BUSY
+BUSY_RETRY_AFTER = 1.0     # Detik; saran tunggu ke klien (x1..x2 sesuai panjang antrean)
+BUSY_RETRIES = 3           # Klien: percobaan ulang setelah dibalas BUSY
+
+# Ack transfer: penerima mengonfirmasi (checksum + byte tertulis) setelah file
+# diverifikasi & di-rename; send_file baru return True setelah ack diterima
+ACK_TIMEOUT = 60  # Detik; verifikasi + fsync file besar bisa lebih lama dari CONNECTION_TIMEOUT
+
+# Metrik (lihat bproto/metrics.py): BProto.stats() selalu tersedia; endpoint
+# HTTP Prometheus (GET /metrics) hanya jika port diisi
+METRICS_PORT = 0           # 0 = endpoint mati
+METRICS_HOST = "127.0.0.1"  # "0.0.0.0" agar bisa di-scrape dari mesin lain
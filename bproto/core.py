@@ -4,6 +4,12 @@ import struct
 import json
 import os
 import time
+import shutil
+import tempfile
+import uuid
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Import Modul Baru
 from .config import *
@@ -13,10 +19,32 @@ from .security import SecurityManager
 from .discovery import DiscoveryManager
 from .transfer import TransferManager
 from .server import ServerManager
+from .engine import ServerEngine
 from .websocket import WebSocketManager
+from .utils import recv_json, recv_json_wait, send_json, send_proof
+from .frame import VERSION_V2, VERSION_V3, set_version
+from .tuning import AutoTuner
+from .shaping import Shaper
+from .pool import ConnectionPool
+from .mux import MuxSession, PRIORITY_CONTROL
+from .outbox import Outbox
+from .metrics import node_metrics, MetricsServer
 
 class BProto:
-    def __init__(self, device_name=None, secret=DEFAULT_SECRET, save_dir=DEFAULT_SAVE_DIR, port=None, app_id="general"):
+    def __init__(self, device_name=None, secret=DEFAULT_SECRET, save_dir=DEFAULT_SAVE_DIR, port=None, app_id="general",
+                 profile=TRANSFER_PROFILE, auto_tune=AUTO_TUNE, durability=DURABILITY,
+                 pool_size=POOL_SIZE, pool_idle_timeout=POOL_IDLE_TIMEOUT, outbox_workers=OUTBOX_WORKERS,
+                 server_workers=SERVER_WORKERS, metrics_port=METRICS_PORT):
+        """profile: nama preset ("low_memory", "default", "high_throughput"),
+        dict, atau TransferProfile. auto_tune: sesuaikan per peer dari throughput
+        & RTT terukur, hasilnya dipakai untuk transfer berikutnya ke peer itu.
+        durability: "none" | "fsync" | "periodic" untuk file yang diterima.
+        pool_size: koneksi keep-alive idle per peer yang disimpan (0 = tanpa pool).
+        outbox_workers: worker yang mencoba ulang transfer di outbox (lihat queue_file).
+        server_workers: thread yang melayani koneksi masuk; kelebihan klien antre
+        lalu ditolak BUSY (klien mencoba lagi setelah retry_after).
+        metrics_port: port endpoint Prometheus (GET /metrics), 0 = mati; snapshot
+        metrik selalu tersedia lewat stats()."""
         self.name = device_name if device_name else socket.gethostname()
         self.save_dir = os.path.abspath(save_dir)
         if not os.path.exists(self.save_dir): os.makedirs(self.save_dir)
@@ -29,30 +57,62 @@ class BProto:
 
         # 1. Inisialisasi Sub-Sistem
         self.events = EventManager()
+        self.metrics = node_metrics()
         self.security = SecurityManager(secret)
         # Pass security ke transfer untuk enkripsi file
-        self.transfer = TransferManager(self.save_dir, self.events, self.security) 
+        self.transfer = TransferManager(self.save_dir, self.events, self.security, durability=durability,
+                                        metrics=self.metrics)
+        self.tuner = AutoTuner(profile, enabled=auto_tune)
+        self.shaper = Shaper()
+        self.pool = ConnectionPool(pool_size, pool_idle_timeout)
         
-        # 2. Network Managers
-        self.discovery = DiscoveryManager(self.name, self.tcp_port, self.events, app_id=app_id)
-        self.server = ServerManager(self.tcp_port, self.security, self.transfer, self.events)
+        # 2. Network Managers: TCP, WebSocket & discovery UDP berbagi satu event loop
+        # (ServerEngine); transfer & disk dikerjakan executor engine
+        self.engine = ServerEngine(self.events, workers=server_workers)
+        self.discovery = DiscoveryManager(self.name, self.tcp_port, self.events, app_id=app_id, engine=self.engine)
+        self.server = ServerManager(self.tcp_port, self.security, self.transfer, self.events, self.tuner.base,
+                                    engine=self.engine, metrics=self.metrics)
         
         # 3. WebSocket Manager (Baru)
-        self.ws_server = WebSocketManager(self.tcp_port, self.security, self.events, self.transfer)
+        self.ws_server = WebSocketManager(self.tcp_port, self.security, self.events, self.transfer, engine=self.engine,
+                                          metrics=self.metrics)
         
         self.peers = self.discovery.peers 
+        self._register_metrics()
+        self.metrics_server = MetricsServer(metrics_port, self.metrics, self.events, self.engine) if metrics_port else None
+        # Journal per app & port: beberapa aplikasi di satu mesin tidak berbagi antrean
+        self.outbox = Outbox(self, os.path.join(OUTBOX_DIR, f"{app_id}-{self.tcp_port}.jsonl"), outbox_workers)
+        self.peer_streams = {}  # Jumlah koneksi paralel per peer (override PARALLEL_STREAMS)
+        self._mux = {}          # Sesi mux per peer (lihat mux_session)
+        self._mux_connect = {}  # Lock connect per peer: peer yang tidak terjangkau tidak menahan peer lain
+        self._mux_failed = {}   # Peer -> waktu terakhir gagal membuka sesi mux
+        self._mux_lock = threading.Lock()  # Melindungi ketiga dict di atas, tidak dipegang selama connect
 
     def start(self):
         self.events.log(f"BProto V2.5 (Crypto+WS) Starting...")
         self.server.start()
         self.discovery.start_listener()
         self.ws_server.start() # Start WebSocket
+        if self.metrics_server: self.metrics_server.start()
+        self.outbox.start()
         self.events.log(f"TCP: {self.tcp_port}, WS: {self.tcp_port + 100}")
         self.events.log("Service Active.")
 
     def stop(self):
+        self.outbox.stop()
         self.discovery.stop()
         self.server.stop()
+        self.ws_server.stop()
+        if self.metrics_server: self.metrics_server.stop()
+        self.engine.stop()
+        self.transfer.checksum_cache.flush()
+        self.transfer.content_index.flush()
+        self.pool.close_all()
+        with self._mux_lock:
+            sessions = list(self._mux.values())
+            self._mux.clear()
+        for session in sessions:
+            session.close()
         self.events.log("Service Stopped.")
 
     def scan(self):
@@ -60,18 +120,25 @@ class BProto:
 
     # --- CLIENT ACTIONS ---
     
-    def _connect_and_send_header(self, target_ip, packet_type, payload):
-        """Helper internal untuk koneksi TCP dengan penanganan header 4-byte"""
+    def _connect_and_send_header(self, target_ip, packet_type, payload, timeout=None, busy_retries=BUSY_RETRIES):
+        """Helper internal untuk koneksi TCP dengan penanganan header 4-byte.
+        timeout: batas tiap operasi socket (default CONNECTION_TIMEOUT)
+        busy_retries: percobaan ulang jika server menjawab BUSY (worker penuh)"""
         if target_ip not in self.discovery.peers:
             self.events.error("Target IP unknown (Scan first?)")
             return None
 
         target_port = self.discovery.peers[target_ip]['port']
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(CONNECTION_TIMEOUT)
+        sock.settimeout(timeout or CONNECTION_TIMEOUT)
+        # Buffer socket diset sebelum connect (window scaling dinegosiasi saat SYN)
+        self.tuner.profile_for(target_ip).apply(sock)
         
         try:
+            connect_start = time.perf_counter()
             sock.connect((target_ip, target_port))
+            # Handshake TCP ~ 1 RTT
+            self.tuner.record_rtt(target_ip, time.perf_counter() - connect_start)
             
             # 1. Kirim Header ke Server
             auth_info = self.security.get_outgoing_auth(target_ip)
@@ -81,33 +148,22 @@ class BProto:
             }
             header.update(payload) 
             
-            js = json.dumps(header).encode()
-            sock.sendall(struct.pack("!I", len(js)))
-            sock.sendall(js)
+            # Frame biner hanya ke peer yang mengiklankan V3 (peer lama tetap JSON)
+            if BINARY_FRAMES and self.discovery.peers[target_ip].get('proto', VERSION_V2) >= VERSION_V3:
+                set_version(sock, VERSION_V3)
+            send_json(sock, header)
             
             # 2. Baca Respon Awal (Challenge/OK) - FIX: Pakai Header 4 Byte
-            raw_len = sock.recv(4)
-            if not raw_len: return None
-            header_len = struct.unpack("!I", raw_len)[0]
-            
-            resp_data = sock.recv(header_len).decode()
-            if not resp_data: return None
-            resp = json.loads(resp_data)
+            resp = recv_json(sock)
             
             # 3. Handle Handshake jika diminta
             if resp['status'] == "CHALLENGE":
                 nonce = resp['nonce']
                 proof = self.security.create_proof(nonce)
-                # Sesuai server.py, proof dikirim mentah (bukan _send_json)
-                sock.sendall(proof.encode())
+                send_proof(sock, proof)
                 
                 # Baca Respon Akhir Handshake - FIX: Pakai Header 4 Byte
-                raw_len_final = sock.recv(4)
-                if not raw_len_final: return None
-                header_len_final = struct.unpack("!I", raw_len_final)[0]
-                
-                auth_resp_data = sock.recv(header_len_final).decode()
-                auth_resp = json.loads(auth_resp_data)
+                auth_resp = recv_json(sock)
                 
                 if auth_resp['status'] == "OK":
                     self.security.save_client_token(target_ip, auth_resp['token'])
@@ -119,6 +175,15 @@ class BProto:
                     
             elif resp['status'] == "OK":
                 return sock, resp
+
+            elif resp['status'] == PacketType.BUSY:
+                sock.close()
+                if busy_retries <= 0:
+                    self.events.error(f"Server {target_ip} sibuk, coba lagi nanti")
+                    return None
+                # Jitter: klien yang ditolak bersamaan tidak kembali bersamaan
+                time.sleep(resp.get('retry_after', BUSY_RETRY_AFTER) * random.uniform(0.5, 1.0))
+                return self._connect_and_send_header(target_ip, packet_type, payload, timeout, busy_retries - 1)
             
             sock.close()
             return None
@@ -127,47 +192,550 @@ class BProto:
             if sock: sock.close()
             return None
 
-    def send_file(self, target_ip, filepath):
+    def _open(self, target_ip, packet_type, payload, expect_reply=True, timeout=None):
+        """Socket siap pakai untuk satu request. Koneksi dari pool cukup dikirimi
+        header (tanpa auth). Pesan tanpa balasan (expect_reply=False) meminta
+        'ack' di koneksi pool: write ke socket yang sudah ditutup server bisa
+        tetap sukses, jadi terkirim baru dianggap sukses setelah server
+        membalas. Jika tidak ada / sudah putus, buka koneksi baru."""
+        sock = self.pool.acquire(target_ip)
+        if sock:
+            sock.settimeout(timeout or CONNECTION_TIMEOUT)
+            header = {"type": packet_type}
+            header.update(payload)
+            if not expect_reply: header['ack'] = True
+            try:
+                send_json(sock, header)
+                resp = recv_json(sock)
+                if resp.get('status') == "OK":
+                    resp['keepalive'] = True
+                    return sock, resp
+            except (OSError, ConnectionError, ValueError):
+                pass
+            self.pool.discard(sock)
+
+        if self.pool.max_per_peer > 0:
+            payload = dict(payload, keepalive=True)
+        return self._connect_and_send_header(target_ip, packet_type, payload, timeout)
+
+    def _finish(self, target_ip, sock, resp, reusable):
+        """Kembalikan socket ke pool jika request selesai bersih, selain itu tutup"""
+        if reusable and resp.get('keepalive'):
+            self.pool.release(target_ip, sock)
+        else:
+            sock.close()
+
+    def set_peer_streams(self, target_ip, streams):
+        """Atur jumlah koneksi paralel default untuk satu peer"""
+        self.peer_streams[target_ip] = max(1, int(streams))
+
+    def set_peer_profile(self, target_ip, profile):
+        """Profile manual untuk satu peer (preset/dict/TransferProfile); auto-tune
+        tidak mengubahnya lagi"""
+        self.tuner.set_profile(target_ip, profile)
+
+    def get_peer_profile(self, target_ip):
+        return self.tuner.profile_for(target_ip)
+
+    def set_bandwidth_limit(self, rate, target_ip=None):
+        """Batasi kecepatan kirim (byte/detik, 0 = tanpa batas), global atau
+        per peer. Berlaku langsung, termasuk untuk transfer yang sedang jalan."""
+        self.shaper.set_limit(rate, target_ip)
+
+    def get_bandwidth_limits(self):
+        return self.shaper.snapshot()
+
+    def get_receive_stats(self):
+        """Pipeline terima: antrean & stall per tahap (lihat bproto/pipeline.py)"""
+        return self.transfer.receive_stats.snapshot()
+
+    def stats(self):
+        """Snapshot semua metrik node: {metric: {label: nilai}} (lihat bproto/metrics.py),
+        isi yang sama dengan endpoint Prometheus"""
+        return self.metrics.snapshot()
+
+    def _register_metrics(self):
+        """Gauge yang dibaca langsung dari state node saat snapshot / scrape"""
+        m = self.metrics
+        m.gauge("bproto_discovery_peers", "Peer yang dikenal (discovery + manual)", lambda: len(self.peers))
+        m.gauge("bproto_server_inflight", "Koneksi yang sedang / menunggu diproses worker server",
+                lambda: self.engine.inflight)
+        m.gauge("bproto_outbox_pending", "Item outbox yang belum terkirim", lambda: self.outbox.stats()['pending'])
+        recv = self.transfer.receive_stats
+        m.gauge("bproto_receive_queue_depth", "Frame antre di pipeline terima", lambda: recv.snapshot()['queue_depth'])
+        m.counter("bproto_receive_stall_seconds_total", "Waktu tunggu per tahap pipeline terima",
+                  lambda: [({"stage": stage}, seconds) for stage, seconds in recv.snapshot()['stall'].items()])
+
+    def _resolve_streams(self, target_ip, streams, size):
+        if streams is None:
+            streams = self.peer_streams.get(target_ip, PARALLEL_STREAMS)
+        # Jangan pecah file kecil jadi range yang lebih kecil dari PARALLEL_MIN_RANGE
+        return max(1, min(int(streams), size // PARALLEL_MIN_RANGE))
+
+    def send_file(self, target_ip, filepath, streams=None, delta=False, compression=None, priority=DEFAULT_PRIORITY,
+                  timeout=None, mux=None):
+        """delta=True: jika penerima sudah punya versi lama file ini,
+        kirim hanya bagian yang berubah (fallback ke kirim penuh jika belum ada).
+        compression: "off" | "zlib" | "adaptive" (default COMPRESSION_MODE).
+        priority: "interactive" | "bulk" - kelas shaping saat bandwidth dibatasi.
+        timeout: batas macet per operasi socket (default CONNECTION_TIMEOUT).
+        mux: kirim sebagai stream di sesi mux peer (default MUX_FILES); chat &
+        clipboard ke peer yang sama tetap lewat tanpa menunggu file selesai."""
         try:
             file_meta = self.transfer.prepare_file(filepath)
         except Exception as e:
             self.events.error(str(e))
             return False
 
-        result = self._connect_and_send_header(target_ip, PacketType.FILE_INIT, {"file": file_meta})
-        
-        if result:
-            sock, resp = result
-            try:
-                # Ambil offset jika server mendukung resume
-                start_byte = resp.get('resume_offset', 0)
-                self.transfer.stream_file(sock, file_meta['path'], start_byte, file_meta['size'])
+        started = time.perf_counter()
+        self.metrics.inc("bproto_transfers_active", direction="out")
+        ok = False
+        try:
+            ok = self._send_prepared(target_ip, file_meta, streams, delta, compression, priority, timeout, mux)
+            return ok
+        finally:
+            self.metrics.inc("bproto_transfers_active", -1, direction="out")
+            self.metrics.record_transfer("out", target_ip, file_meta['size'], time.perf_counter() - started, ok)
+
+    def _send_prepared(self, target_ip, file_meta, streams, delta, compression, priority, timeout, mux):
+        if (MUX_FILES if mux is None else mux) and file_meta['kind'] == 'file' and not delta and not compression:
+            session = self.mux_session(target_ip)
+            if session:
+                return self._send_file_mux(session, target_ip, file_meta, priority)
+
+        if compression:
+            file_meta['compression'] = compression
+            file_meta['compressed'] = compression == "zlib"
+
+        is_dir = file_meta['kind'] == 'dir'
+        if is_dir and self.discovery.peers.get(target_ip, {}).get('dir_stream') is False:
+            return self._send_dir_zip(target_ip, file_meta, priority, timeout)
+        file_meta['delta'] = bool(delta) and not is_dir
+        file_meta['ack'] = True  # Sukses = dikonfirmasi penerima, bukan sekadar terkirim
+        if not is_dir and not file_meta['delta']:
+            streams = self._resolve_streams(target_ip, streams, file_meta['size'])
+            if streams > 1:
+                return self._send_file_parallel(target_ip, file_meta, streams, priority, timeout)
+
+        result = self._open(target_ip, PacketType.FILE_INIT, {"file": file_meta}, timeout=timeout)
+        if not result: return False
+
+        sock, resp = result
+        self._apply_negotiated(file_meta, resp)
+        done = False
+        try:
+            with self.shaper.flow(target_ip, priority) as flow:
+                if is_dir:
+                    if not resp.get('dir_stream'):
+                        # Penerima lama tidak membalas dir_stream: header ini tidak
+                        # dilanjutkan, folder dikirim ulang sebagai zip (protokol lama)
+                        self.events.log(f"Peer {target_ip} terlalu lama untuk folder stream, kirim sebagai zip")
+                        sock.close()
+                        return self._send_dir_zip(target_ip, file_meta, priority, timeout)
+                    count = self.transfer.stream_directory(sock, file_meta, flow)
+                    if not self._await_ack(sock, file_meta, resp): return False
+                    self.events.log(f"Transfer Complete: {file_meta['name']} ({count} files)")
+                    done = True
+                    return True
+
+                if resp.get('have'):
+                    # Penerima sudah punya isi yang sama (dedup), payload tidak dikirim
+                    if not self._await_ack(sock, file_meta, resp): return False
+                    self.events.log(f"Transfer Complete: {file_meta['name']} (sudah ada di penerima)")
+                    done = True
+                    return True
+
+                if resp.get('delta'):
+                    checksum = self.transfer.stream_delta(sock, file_meta, flow)
+                    if not self._await_ack(sock, file_meta, resp, checksum): return False
+                    self.events.log(f"Transfer Complete: {file_meta['name']} (delta)")
+                    done = True
+                    return True
+
+                start_byte, prefix_hasher = self._resolve_resume(sock, file_meta, resp)
+                tuning = self.tuner.start(target_ip)
+                tuning.attach(sock)
+                checksum = self.transfer.stream_file(sock, file_meta['path'], start_byte, file_meta['size'],
+                                                     file_meta['checksum'], prefix_hasher,
+                                                     self.transfer.make_codec(file_meta), tuning, flow)
+                # Throughput diukur sampai byte terakhir ditulis, sebelum menunggu ack
+                tuning.finish()
+                if not self._await_ack(sock, file_meta, resp, checksum): return False
                 self.events.log(f"Transfer Complete: {file_meta['name']}")
+                done = True
                 return True
-            except Exception as e:
-                self.events.error(f"Stream Error: {e}")
-            finally:
-                sock.close()
-                if file_meta['is_zip'] and os.path.exists(file_meta['path']):
-                    os.remove(file_meta['path'])
+        except Exception as e:
+            self.events.error(f"Stream Error: {e}")
+        finally:
+            self._finish(target_ip, sock, resp, done)
         return False
 
-    def send_message(self, target_ip, message):
+    def _send_dir_zip(self, target_ip, file_meta, priority, timeout):
+        """Folder untuk penerima tanpa folder stream: zip sementara lalu kirim
+        sebagai file biasa <nama>.zip. Peer diingat supaya berikutnya langsung zip."""
+        if target_ip in self.discovery.peers:
+            self.discovery.peers[target_ip]['dir_stream'] = False
+        workdir = tempfile.mkdtemp(prefix="bproto-zip-")
+        try:
+            zip_path = os.path.join(workdir, f"{file_meta['name']}.zip")
+            self.transfer.zip_folder(file_meta['path'], zip_path)
+            zip_meta = self.transfer.prepare_file(zip_path)
+            return self._send_prepared(target_ip, zip_meta, 1, False, None, priority, timeout, False)
+        except OSError as e:
+            self.events.error(f"Zip Error: {e}")
+            return False
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def send_files(self, target_ip, paths, compression=None, priority=DEFAULT_PRIORITY):
+        """Kirim banyak file dalam satu sesi: sekali connect + auth, lalu file
+        dikirim berurutan. Return list hasil per file:
+        {"path", "name", "ok", "checksum", "error"}"""
+        results = [{"path": p, "name": os.path.basename(p), "ok": False, "checksum": None, "error": None}
+                   for p in paths]
+        if not results: return results
+
+        result = self._open(target_ip, PacketType.FILE_BATCH, {"count": len(results)})
+        if not result:
+            for r in results: r['error'] = "Connection failed"
+            return results
+
+        sock, resp = result
+        if not resp.get('batch'):
+            # Server lama belum kenal FILE_BATCH: kirim satu per satu
+            self._finish(target_ip, sock, resp, True)
+            for r in results:
+                r['ok'] = self.send_file(target_ip, r['path'], streams=1, compression=compression, priority=priority)
+                if r['ok']: r['checksum'] = self.transfer.checksum_cache.get(r['path'])
+            return results
+
+        done = False
+        try:
+            with self.shaper.flow(target_ip, priority) as flow:
+                tuning = self.tuner.start(target_ip)
+                tuning.attach(sock)
+                # Pipelining: header file berikutnya dikirim sebelum status file
+                # sebelumnya dibaca, jadi verifikasi + rename di penerima tumpang
+                # tindih dengan round trip header (bukan menunggu bergantian)
+                pending = None  # (result, checksum, peer, size, mulai) yang statusnya belum dibaca
+                for r in results:
+                    try:
+                        file_meta = self.transfer.prepare_file(r['path'])
+                    except Exception as e:
+                        r['error'] = str(e)
+                        self.events.error(f"{r['name']}: {e}")
+                        continue
+                    if file_meta['kind'] != 'file':
+                        r['error'] = "Folder tidak bisa dikirim lewat batch"
+                        continue
+                    if compression:
+                        file_meta['compression'] = compression
+                        file_meta['compressed'] = compression == "zlib"
+
+                    started = time.perf_counter()
+                    send_json(sock, {"file": file_meta})
+                    if pending:
+                        self._batch_status(sock, *pending)
+                        pending = None
+                    file_resp = recv_json(sock)
+                    self._apply_negotiated(file_meta, file_resp)
+                    checksum = file_meta['checksum']
+                    if not file_resp.get('have'):
+                        start_byte, prefix_hasher = self._resolve_resume(sock, file_meta, file_resp)
+                        checksum = self.transfer.stream_file(sock, file_meta['path'], start_byte, file_meta['size'],
+                                                             checksum, prefix_hasher,
+                                                             self.transfer.make_codec(file_meta), tuning, flow)
+                    pending = (r, checksum, target_ip, file_meta['size'], started)
+                send_json(sock, {"done": True})
+                tuning.finish()
+                if pending:
+                    self._batch_status(sock, *pending)
+                done = True
+        except Exception as e:
+            self.events.error(f"Batch Error: {e}")
+            for r in results:
+                if not r['ok'] and not r['error']: r['error'] = str(e)
+        finally:
+            self._finish(target_ip, sock, resp, done)
+        return results
+
+    def _recv_ack(self, sock):
+        # Penerima mem-verifikasi + fsync dulu: batas tunggu lebih longgar
+        return recv_json_wait(sock, ACK_TIMEOUT)
+
+    def _batch_status(self, sock, r, checksum, peer, size, started):
+        """Status per file dari penerima (setelah verifikasi & rename)"""
+        status = self._recv_ack(sock)
+        remote = status.get('checksum')
+        r['checksum'] = remote or checksum
+        r['ok'] = bool(status.get('ok')) and not (remote and checksum and remote != checksum)
+        # Durasi termasuk header file berikutnya yang sudah dikirim (pipelining)
+        self.metrics.record_transfer("out", peer, size, time.perf_counter() - started, r['ok'])
+        if r['ok']:
+            self.events.log(f"Transfer Complete: {r['name']}")
+        else:
+            r['error'] = "Rejected by receiver"
+            self.events.error(f"Transfer Failed: {r['name']}")
+
+    def _await_ack(self, sock, file_meta, resp, checksum=None):
+        """Tunggu konfirmasi penerima: file sudah diverifikasi dan ada di nama
+        akhirnya. Penerima lama tidak mengirim ack (resp tanpa 'ack')."""
+        if not resp.get('ack'):
+            return True
+        ack = self._recv_ack(sock)
+        remote = ack.get('checksum')
+        checksum = checksum or file_meta.get('checksum')
+        if ack.get('ok') and not (remote and checksum and remote != checksum):
+            return True
+        self.events.error(f"Transfer Failed: {file_meta['name']} (ditolak penerima)")
+        return False
+
+    def _apply_negotiated(self, file_meta, resp):
+        """Pakai mode kompresi yang diterima server. Server lama tidak membalas
+        'compression', jadi hanya flag 'compressed' lama yang berlaku."""
+        legacy = "zlib" if file_meta.get('compressed') else "off"
+        file_meta['compression'] = resp.get('compression', legacy)
+
+    def _resolve_resume(self, sock, file_meta, resp):
+        """Server menawarkan resume_offset + digest prefix file parsialnya.
+        Prefix hanya di-skip jika digest cocok dengan file lokal; keputusan
+        offset dikirim balik ke server sebelum chunk pertama. Server baru
+        mengirim digest setelah OK ('resume_deferred'): kedua sisi meng-hash
+        prefix bersamaan."""
+        if 'resume_digest' not in resp and not resp.get('resume_deferred'):
+            return 0, None
+
+        offset = resp.get('resume_offset', 0)
+        prefix_hasher = self.transfer.prefix_hasher(file_meta['path'], offset) if offset else None
+        digest = resp.get('resume_digest')
+        if resp.get('resume_deferred'):
+            digest = recv_json_wait(sock, ACK_TIMEOUT).get('resume_digest')
+        matched = prefix_hasher is not None and prefix_hasher.hexdigest() == digest
+        start_byte = offset if matched else 0
+        if offset and not matched:
+            self.events.log(f"Resume ditolak (prefix berbeda), kirim ulang {file_meta['name']} dari awal")
+        send_json(sock, {"resume_offset": start_byte})
+        return start_byte, (prefix_hasher if matched else None)
+
+    def _send_file_parallel(self, target_ip, file_meta, streams, priority=DEFAULT_PRIORITY, timeout=None):
+        """Pecah file jadi byte range, kirim bersamaan lewat beberapa koneksi"""
+        size = file_meta['size']
+        step = -(-size // streams)
+        transfer_id = uuid.uuid4().hex
+        ranges = list(enumerate(range(0, size, step)))
+
+        conns = []
+        try:
+            # Koneksi dibuka berurutan: yang pertama handshake, sisanya pakai token
+            for index, offset in ranges:
+                meta = dict(file_meta, checksum=None, range={
+                    "id": transfer_id, "index": index, "count": len(ranges),
+                    "offset": offset, "length": min(step, size - offset)
+                })
+                result = self._connect_and_send_header(target_ip, PacketType.FILE_INIT, {"file": meta}, timeout)
+                if not result: return False
+                self._apply_negotiated(meta, result[1])
+                conns.append((result[0], meta, result[1]))
+
+            lock = threading.Lock()
+            state = {'sent': 0, 'start': time.time()}
+            errors = []
+
+            def on_progress(n):
+                with lock:
+                    state['sent'] += n
+                    sent = state['sent']
+                elapsed = time.time() - state['start']
+                mbps = sent / (1024*1024) / (elapsed if elapsed > 0 else 1)
+                self.events.progress(file_meta['name'], min((sent/size)*100, 99), mbps)
+
+            def worker(sock, meta, resp, flow):
+                rng = meta['range']
+                # Satu sesi per koneksi; hasil tuning stream pertama yang disimpan
+                tuning = self.tuner.start(target_ip)
+                tuning.attach(sock)
+                try:
+                    self.transfer.stream_range(sock, file_meta['path'], rng['offset'], rng['length'],
+                                               on_progress, self.transfer.make_codec(meta), tuning, flow)
+                    if rng['index'] == 0: tuning.finish()
+                    # Ack range terakhir yang tiba datang setelah file di-rename
+                    if not self._await_ack(sock, meta, resp):
+                        errors.append(ValueError(f"range {rng['index']} ditolak penerima"))
+                except Exception as e:
+                    errors.append(e)
+
+            # Semua range satu file berbagi satu flow (limit per peer tetap berlaku total)
+            with self.shaper.flow(target_ip, priority) as flow:
+                threads = [threading.Thread(target=worker, args=c + (flow,), daemon=True) for c in conns]
+                for t in threads: t.start()
+                for t in threads: t.join()
+
+            if errors:
+                self.events.error(f"Stream Error: {errors[0]}")
+                return False
+            self.events.log(f"Transfer Complete: {file_meta['name']} ({len(ranges)} streams)")
+            return True
+        finally:
+            for sock, _, _ in conns:
+                sock.close()
+
+    def send_message(self, target_ip, message, timeout=None):
         """Fitur Baru: Kirim Chat"""
-        result = self._connect_and_send_header(target_ip, PacketType.MESSAGE, {"content": message})
+        if self._send_via_mux(target_ip, PacketType.MESSAGE, message, timeout):
+            self.events.log(f"Message sent to {target_ip}")
+            return True
+        result = self._open(target_ip, PacketType.MESSAGE, {"content": message}, expect_reply=False, timeout=timeout)
         if result:
-            sock, _ = result
-            sock.close()
+            sock, resp = result
+            self._finish(target_ip, sock, resp, True)
             self.events.log(f"Message sent to {target_ip}")
             return True
         return False
 
     def send_clipboard(self, target_ip, text):
         """Fitur Baru: Kirim ke Clipboard Remote"""
-        result = self._connect_and_send_header(target_ip, PacketType.CLIPBOARD, {"content": text})
+        if self._send_via_mux(target_ip, PacketType.CLIPBOARD, text):
+            self.events.log(f"Clipboard data sent to {target_ip}")
+            return True
+        result = self._open(target_ip, PacketType.CLIPBOARD, {"content": text}, expect_reply=False)
         if result:
-            sock, _ = result
-            sock.close()
+            sock, resp = result
+            self._finish(target_ip, sock, resp, True)
             self.events.log(f"Clipboard data sent to {target_ip}")
             return True
-        return False
\ No newline at end of file
+        return False
+
+    # --- MULTIPLEX (SATU KONEKSI, BANYAK STREAM) ---
+
+    def mux_session(self, target_ip):
+        """Sesi mux ke peer, dibuka jika belum ada / sudah putus.
+        None jika mux dimatikan, peer belum V3, atau membuka sesi ke peer ini
+        gagal dalam MUX_RETRY_AFTER detik terakhir."""
+        if not ENABLE_MUX or not BINARY_FRAMES:
+            return None
+        with self._mux_lock:
+            session = self._mux.get(target_ip)
+            if session and not session.closed:
+                return session
+            connect_lock = self._mux_connect.setdefault(target_ip, threading.Lock())
+
+        with connect_lock:
+            with self._mux_lock:
+                session = self._mux.get(target_ip)
+                if session and not session.closed:
+                    return session  # Dibuka thread lain selama menunggu connect_lock
+                failed = self._mux_failed.get(target_ip)
+            if failed is not None and time.monotonic() - failed < MUX_RETRY_AFTER:
+                return None
+            peer = self.discovery.peers.get(target_ip)
+            if not peer or peer.get('proto', VERSION_V2) < VERSION_V3:
+                return None
+
+            session = None
+            result = self._connect_and_send_header(target_ip, PacketType.MUX, {})
+            if result:
+                sock, resp = result
+                if resp.get('mux'):
+                    session = MuxSession(sock, target_ip, self.events)
+                else:
+                    sock.close()
+            with self._mux_lock:
+                if session:
+                    self._mux[target_ip] = session
+                    self._mux_failed.pop(target_ip, None)
+                else:
+                    self._mux_failed[target_ip] = time.monotonic()
+            return session
+
+    def _send_via_mux(self, target_ip, packet_type, content, timeout=None):
+        """Pesan kecil lewat sesi mux (prioritas kontrol). False jika tidak
+        ada sesi atau sesi putus -> pemanggil memakai koneksi biasa."""
+        session = self.mux_session(target_ip)
+        if not session:
+            return False
+        try:
+            resp = session.request({"type": packet_type, "content": content}, PRIORITY_CONTROL,
+                                   timeout or MUX_REPLY_TIMEOUT)
+        except (ConnectionError, ValueError):
+            return False
+        return bool(resp and resp.get('ok'))
+
+    def _send_file_mux(self, session, target_ip, file_meta, priority):
+        with self.shaper.flow(target_ip, priority) as flow:
+            resp = session.send_file(file_meta['path'], priority, file_meta['checksum'], flow)
+        if resp and resp.get('ok'):
+            self.events.log(f"Transfer Complete: {file_meta['name']} (mux)")
+            return True
+        self.events.error(f"Stream Error: {(resp or {}).get('error')}")
+        return False
+
+    # --- OUTBOX (KIRIM ULANG OTOMATIS) ---
+
+    def queue_file(self, target_ip, filepath, priority=DEFAULT_PRIORITY, delta=False):
+        """Masukkan file ke outbox persisten: dikirim worker di background dan
+        dicoba ulang dengan backoff sampai terkirim. Return id item outbox."""
+        return self.outbox.enqueue(target_ip, filepath, priority, delta)
+
+    def outbox_stats(self):
+        return self.outbox.stats()
+
+    # --- FAN-OUT KE BANYAK PEER ---
+
+    def _fan_out(self, peers, task, concurrency):
+        """Jalankan task(peer) paralel (maks concurrency sekaligus).
+        Return {peer: hasil task}"""
+        peers = list(dict.fromkeys(peers))
+        if not peers: return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(peers))),
+                                thread_name_prefix="bproto-fanout") as pool:
+            futures = {peer: pool.submit(task, peer) for peer in peers}
+            return {peer: future.result() for peer, future in futures.items()}
+
+    def _with_retry(self, action, retries):
+        """action() -> bool. Ulangi dengan backoff sampai berhasil / jatah habis"""
+        attempts = 0
+        while True:
+            attempts += 1
+            if action(): return True, attempts
+            if attempts > retries: return False, attempts
+            time.sleep(BROADCAST_RETRY_DELAY * (2 ** (attempts - 1)))
+
+    def broadcast_file(self, paths, peers, concurrency=BROADCAST_CONCURRENCY, timeout=BROADCAST_TIMEOUT,
+                       retries=BROADCAST_RETRIES, delta=False, compression=None, priority=DEFAULT_PRIORITY):
+        """Kirim file ke banyak peer sekaligus. Tiap peer punya timeout (macet
+        per operasi socket) dan retry sendiri; peer yang lambat tidak menahan
+        yang lain. Return {peer: {"ok", "files": {path: {"ok", "attempts"}}}}"""
+        if isinstance(paths, str): paths = [paths]
+
+        # Checksum dihitung sekali di depan (satu kali baca disk). Semua stream
+        # lalu memakai cache checksum yang sama dan zero-copy dari page cache.
+        if VERIFY_INTEGRITY:
+            for path in paths:
+                if os.path.isfile(path) and self.transfer.checksum_cache.get(path) is None:
+                    st = os.stat(path)
+                    digest = self.transfer.calculate_checksum(path)
+                    if os.stat(path).st_mtime_ns == st.st_mtime_ns:
+                        self.transfer.checksum_cache.put(path, digest, st)
+
+        def send_to(peer):
+            files = {}
+            for path in paths:
+                ok, attempts = self._with_retry(
+                    lambda: self.send_file(peer, path, delta=delta, compression=compression,
+                                           priority=priority, timeout=timeout), retries)
+                files[path] = {"ok": ok, "attempts": attempts}
+            return {"ok": all(f['ok'] for f in files.values()), "files": files}
+
+        results = self._fan_out(peers, send_to, concurrency)
+        failed = [peer for peer, r in results.items() if not r['ok']]
+        self.events.log(f"Broadcast {len(paths)} file ke {len(results)} peer"
+                        + (f", gagal: {', '.join(failed)}" if failed else ""))
+        return results
+
+    def broadcast_message(self, message, peers, concurrency=BROADCAST_CONCURRENCY, timeout=BROADCAST_TIMEOUT,
+                          retries=BROADCAST_RETRIES):
+        """send_message ke banyak peer paralel. Return {peer: {"ok", "attempts"}}"""
+        def send_to(peer):
+            ok, attempts = self._with_retry(lambda: self.send_message(peer, message, timeout=timeout), retries)
+            return {"ok": ok, "attempts": attempts}
+        return self._fan_out(peers, send_to, concurrency)
@@ -0,0 +1,192 @@
+# bproto/delta.py
+# Delta transfer ala rsync: penerima mengirim signature blok file lamanya,
+# pengirim hanya mengirim data literal + referensi blok yang sudah ada.
+import os
+import math
+import zlib
+import struct
+import hashlib
+
+ADLER_MOD = 65521
+MIN_BLOCK = 2048
+MAX_BLOCK = 128 * 1024
+_ENTRY = struct.Struct("!I16s")  # weak (adler32) + strong (blake2b-128)
+
+OP_COPY = b'C'
+OP_LITERAL = b'L'
+_COPY = struct.Struct("!II")  # index blok awal, jumlah blok
+
+SIGNATURE_SPAN = 16 * 1024 * 1024  # Byte file lama per potongan signature yang dikirim
+
+# Bagian tanpa blok cocok (data baru): setelah SPARSE_AFTER blok, cari per byte
+# hanya di satu window blok tiap SPARSE_GAP blok, sisanya langsung literal.
+# Loop per byte di Python ~0.5 us/byte, tanpa ini file yang berubah total
+# butuh menit per GB; kecocokan di tengah data baru terlambat maks SPARSE_GAP blok.
+SPARSE_AFTER = 8
+SPARSE_GAP = 15
+
+def block_size_for(size):
+    """Ukuran blok ~ sqrt(ukuran file) seperti rsync, kelipatan 1 KiB"""
+    bs = int(math.sqrt(size)) & ~1023
+    return max(MIN_BLOCK, min(MAX_BLOCK, bs))
+
+def strong_hash(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+class DeltaSignature:
+    def __init__(self, block_size, base_size, entries):
+        self.block_size = block_size
+        self.base_size = base_size
+        self.weak = [w for w, _ in entries]
+        self.strong = [s for _, s in entries]
+        self.table = {}  # weak -> [index blok]
+        self.tail_index = None
+        self.tail_len = base_size % block_size
+
+        full_blocks = base_size // block_size
+        for index, (weak, _) in enumerate(entries[:full_blocks]):
+            self.table.setdefault(weak, []).append(index)
+        if self.tail_len:
+            self.tail_index = full_blocks
+
+    @classmethod
+    def from_file(cls, path, block_size=None):
+        base_size = os.path.getsize(path)
+        block_size = block_size or block_size_for(base_size)
+        return cls.from_bytes(b"".join(iter_signature(path, block_size)), block_size, base_size)
+
+    def to_bytes(self):
+        return b"".join(_ENTRY.pack(w, s) for w, s in zip(self.weak, self.strong))
+
+    @classmethod
+    def from_bytes(cls, data, block_size, base_size):
+        entries = [_ENTRY.unpack_from(data, off) for off in range(0, len(data), _ENTRY.size)]
+        return cls(block_size, base_size, entries)
+
+    def block_span(self, index, count):
+        """(offset, length) di file lama untuk count blok mulai index"""
+        offset = index * self.block_size
+        return offset, min(count * self.block_size, self.base_size - offset)
+
+def iter_signature(path, block_size):
+    """Signature file per potongan (bytes entry) yang masing-masing mencakup
+    ~SIGNATURE_SPAN byte file, supaya bisa dikirim sambil dihitung"""
+    per_batch = max(1, SIGNATURE_SPAN // block_size)
+    batch = []
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block: break
+            batch.append(_ENTRY.pack(zlib.adler32(block), strong_hash(block)))
+            if len(batch) == per_batch:
+                yield b"".join(batch)
+                batch = []
+    if batch:
+        yield b"".join(batch)
+
+def _aligned_match(view, pos, L, table, strong):
+    """j terkecil (<= SPARSE_AFTER) di mana blok pada pos + j*L ada di file
+    lama, 0 jika tidak ada. Checksum dihitung di C, tanpa loop per byte."""
+    for j in range(1, SPARSE_AFTER + 1):
+        window = view[pos + j * L:pos + (j + 1) * L]
+        if len(window) < L: break
+        cands = table.get(zlib.adler32(window))
+        if cands and strong_hash(window) in (strong[i] for i in cands):
+            return j
+    return 0
+
+def iter_delta(data, sig, literal_max):
+    """Bandingkan buffer file baru (bytes/mmap) dengan signature.
+    Yield (OP_COPY, index, count) atau (OP_LITERAL, memoryview)."""
+    L = sig.block_size
+    n = len(data)
+    view = memoryview(data)
+    table, strong = sig.table, sig.strong
+
+    pos = lit_start = 0
+    sparse_at = SPARSE_AFTER * L  # Posisi lompatan berikutnya jika belum ada blok cocok
+    run = None  # [index awal, jumlah] blok berurutan yang digabung jadi satu op
+    fresh = True
+    a = b = 0
+
+    while pos + L <= n:
+        if fresh:
+            # Checksum penuh dihitung di C; byte-per-byte hanya saat mencari ulang
+            weak = zlib.adler32(view[pos:pos + L])
+            a, b = weak & 0xffff, weak >> 16
+            fresh = False
+        else:
+            weak = (b << 16) | a
+
+        cands = table.get(weak)
+        if cands:
+            digest = strong_hash(view[pos:pos + L])
+            match = next((i for i in cands if strong[i] == digest), None)
+            if match is not None:
+                if lit_start < pos:
+                    if run: yield (OP_COPY, run[0], run[1]); run = None
+                    yield (OP_LITERAL, view[lit_start:pos])
+                if run and run[0] + run[1] == match:
+                    run[1] += 1
+                else:
+                    if run: yield (OP_COPY, run[0], run[1])
+                    run = [match, 1]
+                pos += L
+                lit_start = pos
+                sparse_at = pos + SPARSE_AFTER * L
+                fresh = True
+                continue
+
+        # Tepat setelah blok cocok: perubahan di tempat membuat blok sejajar
+        # berikutnya biasanya cocok lagi, cek dulu sebelum mencari per byte
+        skip = _aligned_match(view, pos, L, table, strong) if run and pos == lit_start else 0
+        if skip:
+            pos += skip * L
+            fresh = True
+        else:
+            # Rolling Adler-32: geser window satu byte
+            if pos + L < n:
+                out, inn = data[pos], data[pos + L]
+                a = (a - out + inn) % ADLER_MOD
+                b = (b - L * out + a - 1) % ADLER_MOD
+            pos += 1
+            if pos >= sparse_at and pos + L <= n:
+                pos = min(pos + SPARSE_GAP * L, n - L)
+                sparse_at = pos + L
+                fresh = True
+        while pos - lit_start >= literal_max:
+            if run: yield (OP_COPY, run[0], run[1]); run = None
+            yield (OP_LITERAL, view[lit_start:lit_start + literal_max])
+            lit_start += literal_max
+
+    # Sisa akhir file: cocokkan dengan blok parsial terakhir file lama
+    tail_end = n
+    if sig.tail_index is not None and n - lit_start >= sig.tail_len \
+            and strong_hash(view[n - sig.tail_len:n]) == strong[sig.tail_index]:
+        tail_end = n - sig.tail_len
+    if lit_start < tail_end:
+        if run: yield (OP_COPY, run[0], run[1]); run = None
+        for off in range(lit_start, tail_end, literal_max):
+            yield (OP_LITERAL, view[off:min(off + literal_max, tail_end)])
+    if tail_end < n:
+        if run and run[0] + run[1] == sig.tail_index:
+            run[1] += 1
+        else:
+            if run: yield (OP_COPY, run[0], run[1])
+            run = [sig.tail_index, 1]
+    if run: yield (OP_COPY, run[0], run[1])
+
+def encode_op(op):
+    if op[0] == OP_COPY:
+        return OP_COPY + _COPY.pack(op[1], op[2])
+    return OP_LITERAL + bytes(op[1])
+
+def decode_op(frame):
+    """frame: payload hasil _iter_chunks -> (OP_COPY, index, count) / (OP_LITERAL, view)"""
+    kind = bytes(frame[:1])
+    if kind == OP_COPY:
+        index, count = _COPY.unpack(frame[1:1 + _COPY.size])
+        return (OP_COPY, index, count)
+    if kind == OP_LITERAL:
+        return (OP_LITERAL, frame[1:])
+    raise ValueError(f"Unknown delta op: {kind!r}")
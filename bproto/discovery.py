@@ -1,26 +1,30 @@
 # bproto/discovery.py
 import socket
 import json
-import threading
-from .config import PROTOCOL_ID, DISCOVERY_PORT
+import asyncio
+from .config import PROTOCOL_ID, PROTOCOL_VERSION, DISCOVERY_PORT
 from .protocol import PacketType
+from .engine import ServerEngine
 
 class DiscoveryManager:
 # 1. Tambahkan parameter app_id di __init__
-    def __init__(self, device_name, tcp_port, events, app_id="bproto-default"):
+    def __init__(self, device_name, tcp_port, events, app_id="bproto-default", engine=None):
         self.device_name = device_name
         self.tcp_port = tcp_port
         self.events = events
         self.app_id = app_id  # <--- Simpan App ID
         self.peers = {} 
         self.running = False
+        self.engine = engine or ServerEngine(events)
 
     def start_listener(self):
         self.running = True
-        threading.Thread(target=self._listen_loop, daemon=True).start()
+        self.engine.add(self)
+        self.engine.start()
 
     def stop(self):
         self.running = False
+        self.engine.remove(self)
 
     def scan(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -29,7 +33,8 @@ class DiscoveryManager:
             "t": PacketType.PING, 
             "n": self.device_name, 
             "p": self.tcp_port,
-            "a": self.app_id  # <--- Kirim App ID (key 'a')
+            "a": self.app_id,  # <--- Kirim App ID (key 'a')
+            "v": PROTOCOL_VERSION  # Versi wire; peer lama tidak mengirim 'v' (= V2)
         }).encode()
         try:
             sock.sendto(PROTOCOL_ID + payload, ('<broadcast>', DISCOVERY_PORT))
@@ -39,42 +44,64 @@ class DiscoveryManager:
         finally:
             sock.close()
 
-    def _listen_loop(self):
+    async def serve(self, engine):
+        """Front-end UDP di ServerEngine (tanpa thread sendiri)"""
+        loop = asyncio.get_running_loop()
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
             sock.bind(('', DISCOVERY_PORT))
         except Exception as e:
             self.events.error(f"UDP Bind failed: {e}")
+            sock.close()
             return
 
-        while self.running:
-            try:
-                data, addr = sock.recvfrom(4096)
-                if not data.startswith(PROTOCOL_ID): continue
-                
-                msg = json.loads(data[len(PROTOCOL_ID):])
-                
-                # --- FILTER BARU DI SINI ---
-                # Jika App ID paket tidak sama dengan App ID saya, abaikan!
-                remote_app = msg.get('a', 'bproto-default')
-                if remote_app != self.app_id:
-                    continue
+        transport, _ = await loop.create_datagram_endpoint(lambda: _DiscoveryProtocol(self), sock=sock)
+        try:
+            await asyncio.Future()  # Sampai di-cancel (stop)
+        finally:
+            transport.close()
+
+    def _on_packet(self, data, addr, reply):
+        try:
+            if not data.startswith(PROTOCOL_ID): return
+            
+            msg = json.loads(data[len(PROTOCOL_ID):])
+            
+            # --- FILTER BARU DI SINI ---
+            # Jika App ID paket tidak sama dengan App ID saya, abaikan!
+            remote_app = msg.get('a', 'bproto-default')
+            if remote_app != self.app_id:
+                return
+
+            ip = addr[0]
+            proto = msg.get('v', 2)
+            # Jika peer baru atau info update
+            if ip not in self.peers or self.peers[ip]['port'] != msg['p']:
+                self.peers[ip] = {'name': msg['n'], 'port': msg['p'], 'proto': proto}
+                self.events.emit("peer_found", ip, msg['n'])
+                self.events.log(f"Peer Found: {msg['n']} @ {ip}")
+            else:
+                self.peers[ip]['proto'] = proto
+
+            # Auto reply PING dengan PONG
+            if msg['t'] == PacketType.PING:
+                resp = json.dumps({
+                    "t": PacketType.PONG, 
+                    "n": self.device_name, 
+                    "p": self.tcp_port,
+                    "a": self.app_id, # <--- Balas dengan App ID juga
+                    "v": PROTOCOL_VERSION
+                }).encode()
+                reply(PROTOCOL_ID + resp, addr)
+        except Exception: pass
+
+class _DiscoveryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, manager):
+        self.manager = manager
+        self.transport = None
 
-                ip = addr[0]
-                # Jika peer baru atau info update
-                if ip not in self.peers or self.peers[ip]['port'] != msg['p']:
-                    self.peers[ip] = {'name': msg['n'], 'port': msg['p']}
-                    self.events.emit("peer_found", ip, msg['n'])
-                    self.events.log(f"Peer Found: {msg['n']} @ {ip}")
+    def connection_made(self, transport):
+        self.transport = transport
 
-                # Auto reply PING dengan PONG
-                if msg['t'] == PacketType.PING:
-                    resp = json.dumps({
-                        "t": PacketType.PONG, 
-                        "n": self.device_name, 
-                        "p": self.tcp_port,
-                        "a": self.app_id # <--- Balas dengan App ID juga
-                    }).encode()
-                    sock.sendto(PROTOCOL_ID + resp, addr)
-            except Exception: pass
-        sock.close()
\ No newline at end of file
+    def datagram_received(self, data, addr):
+        self.manager._on_packet(data, addr, self.transport.sendto)
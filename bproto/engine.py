@@ -0,0 +1,148 @@
+# bproto/engine.py
+# Satu event loop asyncio (satu thread) untuk semua front-end server node:
+# TCP (ServerManager), WebSocket (WebSocketManager) dan discovery UDP.
+# Front-end hanya menangani I/O jaringan yang non-blocking (accept, header,
+# handshake, koneksi keep-alive yang idle); pekerjaan blocking (transfer,
+# disk, hashing file) dijalankan di executor milik engine.
+#
+# Front-end: objek dengan coroutine serve(engine) yang jalan sampai di-cancel.
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .config import SERVER_WORKERS, SERVER_QUEUE
+
+class ServerEngine:
+    def __init__(self, events, workers=SERVER_WORKERS, queue_size=SERVER_QUEUE):
+        """workers: thread executor (dibuat saat dibutuhkan, maksimal sebanyak ini).
+        queue_size: tugas yang boleh menunggu executor sebelum full() = True."""
+        self.events = events
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.executor = None
+        self.loop = None
+        self.inflight = 0  # Tugas executor yang belum selesai (hanya diubah di thread loop)
+        self._frontends = {}  # front-end -> task serve (None jika loop belum jalan)
+        self._closing = set()  # Task serve yang sudah di-cancel tapi belum selesai
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.loop is not None and self.loop.is_running()
+
+    def start(self):
+        """Jalankan loop di thread sendiri (idempotent), lalu semua front-end"""
+        with self._lock:
+            if self.running: return
+            self.loop = asyncio.new_event_loop()
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="bproto-worker")
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), daemon=True, name="bproto-engine")
+            self._thread.start()
+            ready.wait()
+            for frontend in list(self._frontends):
+                self.loop.call_soon_threadsafe(self._launch, frontend)
+
+    def stop(self):
+        with self._lock:
+            if not self.running: return
+            loop = self.loop
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join()
+            self.executor.shutdown(wait=False)
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(ready.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    async def _shutdown(self):
+        tasks = [task for task in self._frontends.values() if task] + list(self._closing)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for frontend in self._frontends:
+            self._frontends[frontend] = None
+
+    # --- FRONT-END ---
+
+    def add(self, frontend):
+        """Daftarkan front-end; langsung dijalankan jika loop sudah berjalan"""
+        with self._lock:
+            if frontend in self._frontends: return
+            self._frontends[frontend] = None
+            if self.running:
+                self.loop.call_soon_threadsafe(self._launch, frontend)
+
+    def remove(self, frontend):
+        """Hentikan satu front-end (serve di-cancel), loop tetap berjalan"""
+        with self._lock:
+            if frontend not in self._frontends: return
+            if self.running:
+                self.loop.call_soon_threadsafe(self._cancel, frontend)
+            else:
+                del self._frontends[frontend]
+
+    def _launch(self, frontend):
+        if frontend in self._frontends and self._frontends[frontend] is None:
+            self._frontends[frontend] = self.loop.create_task(frontend.serve(self))
+
+    def _cancel(self, frontend):
+        task = self._frontends.pop(frontend, None)
+        if task:
+            task.cancel()
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    # --- EXECUTOR ---
+
+    def full(self):
+        """Semua worker sibuk dan antrean executor sudah berisi queue_size tugas"""
+        return self.inflight >= self.workers + self.queue_size
+
+    def run_blocking(self, fn, *args):
+        """Jalankan fn di executor. Dipanggil dari thread loop; return future asyncio."""
+        self.inflight += 1
+        future = self.loop.run_in_executor(self.executor, fn, *args)
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future):
+        self.inflight -= 1
+        if not future.cancelled() and future.exception():
+            self.events.error(f"Worker Error: {future.exception()!r}")
+
+    def call_soon(self, fn, *args):
+        """Jadwalkan fn di thread loop dari thread lain. False jika loop sudah berhenti."""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return False
+        try:
+            loop.call_soon_threadsafe(fn, *args)
+        except RuntimeError:
+            return False  # Loop ditutup di antara cek dan pemanggilan
+        return True
+
+async def authenticate(security, client_ip, auth_data, ask_proof, events=None):
+    """Handshake bersama TCP & WebSocket. Return (berhasil, token baru atau None).
+    ask_proof(nonce): coroutine front-end yang mengirim CHALLENGE ke klien dan
+    mengembalikan proof yang diterima. events: EventManager untuk log handshake."""
+    # Cek Token Lama
+    if auth_data.get('auth_mode') == "TOKEN" and security.verify_token(client_ip, auth_data.get('data')):
+        if events: events.debug(f"{client_ip} Login via TOKEN sukses.")
+        return True, None
+
+    # Jika Token Gagal, Lakukan Handshake Baru
+    if events: events.debug(f"{client_ip} Meminta Handshake Baru...")
+    nonce = uuid.uuid4().hex[:8]
+    client_proof = await ask_proof(nonce)
+    if not security.verify_handshake(nonce, client_proof):
+        if events: events.log(f"{client_ip} Handshake GAGAL (Wrong Secret).")
+        return False, None
+    if events: events.log(f"{client_ip} Handshake BERHASIL.")
+    return True, security.create_session_for(client_ip)
@@ -1,14 +1,18 @@
 # bproto/events.py
+from .config import DEBUG_LOG
 
 class EventManager:
     def __init__(self):
+        self.debug_log = DEBUG_LOG  # Pesan debug() ikut dikirim sebagai "log"
         self._listeners = {
             "log": [],
             "error": [],
             "progress": [],
             "message": [],    # Baru: Event chat masuk
             "clipboard": [],  # Baru: Event clipboard
-            "peer_found": []  # Baru: Event peer ditemukan
+            "peer_found": [],  # Baru: Event peer ditemukan
+            "file_received": [],  # File sudah di nama akhirnya (setelah rename atomik)
+            "outbox": []  # (status "done" | "retry" | "failed", item) dari Outbox
         }
 
     def on(self, event_name, callback):
@@ -16,10 +20,16 @@ class EventManager:
         if event_name in self._listeners:
             self._listeners[event_name].append(callback)
 
+    def off(self, event_name, callback):
+        """Melepas listener yang pernah didaftarkan"""
+        if callback in self._listeners.get(event_name, []):
+            self._listeners[event_name].remove(callback)
+
     def emit(self, event_name, *args):
         """Memicu event"""
         if event_name in self._listeners:
-            for callback in self._listeners[event_name]:
+            # Salinan list: listener boleh dilepas (off) dari thread lain saat emit
+            for callback in list(self._listeners[event_name]):
                 try:
                     callback(*args)
                 except Exception as e:
@@ -28,4 +38,7 @@ class EventManager:
     # Helper standar agar tidak merubah behavior lama
     def log(self, msg): self.emit("log", msg)
     def error(self, msg): self.emit("error", msg)
-    def progress(self, filename, percent, speed): self.emit("progress", filename, percent, speed)
\ No newline at end of file
+    def debug(self, msg):
+        if self.debug_log: self.emit("log", msg)
+    def progress(self, filename, percent, speed): self.emit("progress", filename, percent, speed)
+    def file_received(self, path, size): self.emit("file_received", path, size)
\ No newline at end of file
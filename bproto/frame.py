@@ -0,0 +1,277 @@
+# bproto/frame.py
+# Frame kontrol biner (protokol V3), dipakai bersama oleh server, klien
+# (BProto & AsyncBProto) dan transport berikutnya.
+#
+#   V2: [4 byte length][JSON]
+#   V3: [magic 0xB3][tipe][flags][stream id 2 byte][length 4 byte][payload]
+#
+# Byte pertama pesan V2 adalah byte teratas length, selalu 0 untuk pesan
+# < 16 MiB, jadi penerima bisa membedakan V2/V3 dari byte pertama saja.
+# Pengirim hanya memakai V3 ke peer yang mengiklankan versi 3 di discovery;
+# server menjawab dengan versi yang sama dengan header yang diterima.
+import json
+import struct
+import weakref
+from .config import FRAME_MAX_PAYLOAD
+
+VERSION_V2 = 2
+VERSION_V3 = 3
+MAGIC = 0xB3
+
+FRAME_CONTROL = 1  # Payload: field compact (dict header/respon)
+FRAME_PROOF = 2    # Payload: proof auth mentah
+# Sesi multiplex (mux.py): stream id membedakan stream logis
+FRAME_OPEN = 3     # Buka stream; payload: field header (tipe, meta file, isi pesan)
+FRAME_DATA = 4     # Payload: byte mentah stream
+FRAME_END = 5      # Stream selesai (pengirim) / hasil akhir (penerima); payload: field
+FRAME_CREDIT = 6   # Flow control: penerima menambah kredit byte; payload: field int
+FRAME_RESET = 7    # Batalkan stream; payload: field {"error"}
+FRAME_TYPES = (FRAME_CONTROL, FRAME_PROOF, FRAME_OPEN, FRAME_DATA, FRAME_END, FRAME_CREDIT, FRAME_RESET)
+
+HEADER = struct.Struct("!BBBHI")  # magic, tipe, flags, stream id, length payload
+MAX_DEPTH = 32
+
+class FrameError(ValueError):
+    """Frame rusak / tidak dikenal (turunan ValueError seperti JSONDecodeError)"""
+
+# --- ENCODING FIELD ---
+# Tabel ini bagian dari format wire V3: jangan diubah urutannya dan jangan
+# ditambah (penerima V3 menolak indeks yang tidak dikenalnya). Key / string
+# lain dikirim apa adanya; tabel baru butuh versi frame baru.
+KEYS = (
+    "type", "status", "auth", "auth_mode", "data", "nonce", "token", "file",
+    "name", "size", "kind", "checksum", "path", "trailer", "resume", "compression",
+    "compressed", "encrypted", "dedup", "delta", "keepalive", "resume_offset",
+    "resume_digest", "have", "dir_stream", "batch", "content", "done", "ok",
+    "range", "entries", "block_size", "base_size",
+)
+VALUES = (
+    "OK", "CHALLENGE", "FAIL", "PING", "PONG", "FILE_INIT", "FILE_BATCH",
+    "MESSAGE", "CLIPBOARD", "TOKEN", "NEW_HANDSHAKE", "file", "dir", "off",
+    "zlib", "adaptive",
+)
+_KEY_INDEX = {k: i for i, k in enumerate(KEYS)}
+_VALUE_INDEX = {v: i for i, v in enumerate(VALUES)}
+_KEY_STR = 0xFF
+
+T_NONE, T_FALSE, T_TRUE, T_UINT, T_NINT, T_FLOAT, T_STR, T_BYTES, T_LIST, T_DICT, T_KNOWN = range(11)
+_DOUBLE = struct.Struct("!d")
+_VARINT_MAX_BYTES = 10  # uint64
+
+def _put_varint(out, n):
+    if n >= 1 << 64:
+        raise FrameError("Integer terlalu besar untuk frame V3")
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _put_str(out, s):
+    raw = s.encode()
+    _put_varint(out, len(raw))
+    out += raw
+
+def _put_value(out, value, depth=0):
+    if depth > MAX_DEPTH:
+        raise FrameError("Field bersarang terlalu dalam")
+    if value is None:
+        out.append(T_NONE)
+    elif value is True:
+        out.append(T_TRUE)
+    elif value is False:
+        out.append(T_FALSE)
+    elif isinstance(value, int):
+        if value >= 0:
+            out.append(T_UINT)
+            _put_varint(out, value)
+        else:
+            out.append(T_NINT)
+            _put_varint(out, -1 - value)
+    elif isinstance(value, float):
+        out.append(T_FLOAT)
+        out += _DOUBLE.pack(value)
+    elif isinstance(value, str):
+        idx = _VALUE_INDEX.get(value)
+        if idx is not None:
+            out.append(T_KNOWN)
+            out.append(idx)
+        else:
+            out.append(T_STR)
+            _put_str(out, value)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        out.append(T_BYTES)
+        _put_varint(out, len(value))
+        out += value
+    elif isinstance(value, (list, tuple)):
+        out.append(T_LIST)
+        _put_varint(out, len(value))
+        for item in value:
+            _put_value(out, item, depth + 1)
+    elif isinstance(value, dict):
+        out.append(T_DICT)
+        _put_varint(out, len(value))
+        for key, item in value.items():
+            key = str(key)  # Sama dengan json.dumps
+            idx = _KEY_INDEX.get(key)
+            if idx is not None:
+                out.append(idx)
+            else:
+                out.append(_KEY_STR)
+                _put_str(out, key)
+            _put_value(out, item, depth + 1)
+    else:
+        raise FrameError(f"Tipe {type(value).__name__} tidak bisa dikirim di frame")
+
+def encode_fields(value):
+    out = bytearray()
+    _put_value(out, value)
+    return bytes(out)
+
+def _varint(buf, pos):
+    n = shift = 0
+    for _ in range(_VARINT_MAX_BYTES):
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+    raise FrameError("Varint terlalu panjang")
+
+def _text(buf, pos):
+    length, pos = _varint(buf, pos)
+    end = pos + length
+    if end > len(buf):
+        raise FrameError("Payload terpotong")
+    return buf[pos:end].decode(), end
+
+def _value(buf, pos, depth):
+    # IndexError (buffer habis) & UnicodeDecodeError diubah jadi FrameError di decode_fields
+    tag = buf[pos]
+    pos += 1
+    if tag == T_KNOWN:
+        return VALUES[buf[pos]], pos + 1
+    if tag == T_STR:
+        return _text(buf, pos)
+    if tag == T_UINT:
+        return _varint(buf, pos)
+    if tag == T_TRUE: return True, pos
+    if tag == T_FALSE: return False, pos
+    if tag == T_NONE: return None, pos
+    if depth >= MAX_DEPTH:
+        raise FrameError("Field bersarang terlalu dalam")
+    if tag == T_DICT:
+        count, pos = _varint(buf, pos)
+        result = {}
+        for _ in range(count):
+            idx = buf[pos]
+            if idx == _KEY_STR:
+                key, pos = _text(buf, pos + 1)
+            else:
+                key = KEYS[idx]
+                pos += 1
+            result[key], pos = _value(buf, pos, depth + 1)
+        return result, pos
+    if tag == T_LIST:
+        count, pos = _varint(buf, pos)
+        result = []
+        for _ in range(count):
+            item, pos = _value(buf, pos, depth + 1)
+            result.append(item)
+        return result, pos
+    if tag == T_NINT:
+        n, pos = _varint(buf, pos)
+        return -1 - n, pos
+    if tag == T_FLOAT:
+        if pos + 8 > len(buf):
+            raise FrameError("Payload terpotong")
+        return _DOUBLE.unpack_from(buf, pos)[0], pos + 8
+    if tag == T_BYTES:
+        length, pos = _varint(buf, pos)
+        if pos + length > len(buf):
+            raise FrameError("Payload terpotong")
+        return bytes(buf[pos:pos + length]), pos + length
+    raise FrameError(f"Tag field tidak dikenal: {tag}")
+
+def decode_fields(buf):
+    buf = bytes(buf)
+    try:
+        value, pos = _value(buf, 0, 0)
+    except IndexError:
+        raise FrameError("Payload terpotong / indeks tabel tidak dikenal") from None
+    except UnicodeDecodeError as e:
+        raise FrameError(f"String bukan UTF-8: {e}") from None
+    if pos != len(buf):
+        raise FrameError("Sisa byte setelah field")
+    return value
+
+# --- FRAME ---
+
+def encode_frame(frame_type, payload, flags=0, stream_id=0):
+    if len(payload) > FRAME_MAX_PAYLOAD:
+        raise FrameError(f"Payload frame terlalu besar ({len(payload)} byte)")
+    return HEADER.pack(MAGIC, frame_type, flags, stream_id, len(payload)) + payload
+
+def parse_header(buf):
+    """9 byte header -> (tipe, flags, stream id, length). Raise FrameError"""
+    magic, frame_type, flags, stream_id, length = HEADER.unpack(buf)
+    if magic != MAGIC:
+        raise FrameError(f"Magic frame salah: {magic:#x}")
+    if frame_type not in FRAME_TYPES:
+        raise FrameError(f"Tipe frame tidak dikenal: {frame_type}")
+    if length > FRAME_MAX_PAYLOAD:
+        raise FrameError(f"Payload frame terlalu besar ({length} byte)")
+    return frame_type, flags, stream_id, length
+
+def decode_frame(buf):
+    """Satu frame utuh -> (tipe, flags, stream id, payload)"""
+    if len(buf) < HEADER.size:
+        raise FrameError("Header frame terpotong")
+    frame_type, flags, stream_id, length = parse_header(buf[:HEADER.size])
+    if len(buf) - HEADER.size != length:
+        raise FrameError("Panjang payload tidak cocok")
+    return frame_type, flags, stream_id, buf[HEADER.size:]
+
+def encode_message(data, version=VERSION_V2):
+    """Pesan kontrol (dict) dalam format wire versi tertentu"""
+    if version >= VERSION_V3:
+        return encode_frame(FRAME_CONTROL, encode_fields(data))
+    js = json.dumps(data).encode()
+    return struct.pack("!I", len(js)) + js
+
+def message_need(buf):
+    """Byte yang masih kurang agar awal buf berisi satu pesan utuh (V2 atau
+    frame V3); 0 = lengkap. Untuk pembaca non-blocking (selector server)."""
+    if len(buf) < 4:
+        return 4 - len(buf)
+    if buf[0] == MAGIC:
+        if len(buf) < HEADER.size:
+            return HEADER.size - len(buf)
+        length = parse_header(bytes(buf[:HEADER.size]))[3]
+        return HEADER.size + length - len(buf)
+    length = struct.unpack_from("!I", buf)[0]
+    if length > FRAME_MAX_PAYLOAD:
+        raise FrameError(f"Pesan terlalu besar ({length} byte)")
+    return 4 + length - len(buf)
+
+def decode_message(buf):
+    """Pesan kontrol utuh (hasil message_need == 0) -> (dict, versi)"""
+    if buf[0] == MAGIC:
+        frame_type, _, _, payload = decode_frame(bytes(buf))
+        return decode_control(frame_type, payload), VERSION_V3
+    return json.loads(bytes(buf[4:]).decode()), VERSION_V2
+
+def decode_control(frame_type, payload):
+    if frame_type != FRAME_CONTROL:
+        raise FrameError(f"Diharapkan frame kontrol, diterima tipe {frame_type}")
+    return decode_fields(payload)
+
+# --- VERSI PER KONEKSI ---
+# Socket / StreamWriter -> versi wire yang dipakai untuk mengirim.
+_versions = weakref.WeakKeyDictionary()
+
+def set_version(conn, version):
+    _versions[conn] = version
+
+def wire_version(conn):
+    return _versions.get(conn, VERSION_V2)
@@ -0,0 +1,256 @@
+# bproto/metrics.py
+# Metrik runtime node: counter, gauge & histogram dengan label, snapshot
+# (BProto.stats()) dan endpoint HTTP format teks Prometheus (opsional).
+#
+# Update tanpa lock: tiap thread menulis ke shard miliknya sendiri
+# (threading.local); hanya snapshot/render yang menjumlahkan semua shard.
+# Shard thread yang sudah selesai dilebur ke total saat snapshot.
+import bisect
+import asyncio
+import threading
+from .config import METRICS_HOST
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# Bucket default (detik / byte per detik)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+THROUGHPUT_BUCKETS = (1e5, 5e5, 1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8, 2.5e8, 5e8, 1e9, 2.5e9, 1e10)
+
+def _labels(labels):
+    if len(labels) < 2:
+        return tuple(labels.items())
+    return tuple(sorted(labels.items()))
+
+def _label_str(key):
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in key)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value):
+    if value == float("inf"): return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15: return str(int(value))
+    return repr(value)
+
+class _Metric:
+    def __init__(self, name, kind, help_text, buckets=None, fn=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.buckets = tuple(buckets) if buckets else None
+        self.fn = fn  # Nilai dihitung saat dibaca: angka atau list (dict label, nilai)
+
+class Metrics:
+    def __init__(self):
+        self._metrics = {}
+        self._local = threading.local()
+        self._shards = []  # (thread, shard) yang pernah menulis
+        self._retired = {}  # Total dari thread yang sudah selesai
+        self._lock = threading.Lock()  # Hanya registrasi shard & snapshot
+
+    # --- REGISTRASI ---
+
+    def counter(self, name, help_text, fn=None):
+        self._metrics[name] = _Metric(name, COUNTER, help_text, fn=fn)
+
+    def gauge(self, name, help_text, fn=None):
+        """fn=None: gauge naik-turun lewat inc() (misal transfer aktif)"""
+        self._metrics[name] = _Metric(name, GAUGE, help_text, fn=fn)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._metrics[name] = _Metric(name, HISTOGRAM, help_text, buckets=sorted(buckets))
+
+    # --- UPDATE (hot path, tanpa lock) ---
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def inc(self, name, value=1, **labels):
+        shard = self._shard()
+        key = (name, _labels(labels))
+        shard[key] = shard.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        shard = self._shard()
+        key = (name, _labels(labels))
+        cells = shard.get(key)
+        if cells is None:
+            # [count per bucket..., count +Inf, sum]
+            cells = shard[key] = [0] * (len(self._metrics[name].buckets) + 2)
+        cells[bisect.bisect_left(self._metrics[name].buckets, value)] += 1
+        cells[-1] += value
+
+    def record_transfer(self, direction, peer, nbytes, seconds, ok):
+        """Satu transfer file selesai (direction "in" | "out")"""
+        self.inc("bproto_transfers_total", direction=direction, result="ok" if ok else "failed")
+        if not ok:
+            return
+        self.inc("bproto_transfer_bytes_total", nbytes, direction=direction, peer=peer)
+        self.observe("bproto_transfer_duration_seconds", seconds, direction=direction)
+        if nbytes and seconds > 0:
+            self.observe("bproto_transfer_throughput_bytes", nbytes / seconds, direction=direction)
+
+    # --- BACA ---
+
+    def _collect(self):
+        """Jumlahkan semua shard -> {(name, labels): angka | list cell}"""
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)  # Thread selesai: shard tidak berubah lagi
+            self._shards = live
+            total = {}
+            self._merge(total, self._retired)
+            for _, shard in live:
+                # dict()/list() menyalin di C (atomik terhadap update thread pemilik)
+                self._merge(total, dict(shard))
+        return total
+
+    @staticmethod
+    def _merge(into, shard):
+        for key, value in shard.items():
+            if isinstance(value, list):
+                cells = into.get(key)
+                value = list(value)
+                if cells is None:
+                    into[key] = value
+                else:
+                    for i, v in enumerate(value):
+                        cells[i] += v
+            else:
+                into[key] = into.get(key, 0) + value
+
+    def _series(self):
+        """metric -> list (label key, nilai); fn dipanggil di sini"""
+        values = self._collect()
+        series = {name: [] for name in self._metrics}
+        for (name, key), value in values.items():
+            if name in series:
+                series[name].append((key, value))
+        for metric in self._metrics.values():
+            if not metric.fn: continue
+            try:
+                result = metric.fn()
+            except Exception as e:
+                print(f"[METRICS ERROR] {metric.name}: {e}")
+                continue
+            if isinstance(result, (int, float)):
+                series[metric.name].append(((), result))
+            else:
+                series[metric.name].extend((_labels(labels), value) for labels, value in result)
+        for items in series.values():
+            items.sort(key=lambda item: item[0])
+        return series
+
+    def _histogram(self, metric, cells):
+        cumulative, buckets = 0, {}
+        for bound, count in zip(metric.buckets + (float("inf"),), cells):
+            cumulative += count
+            buckets[_number(float(bound))] = cumulative
+        return {"count": cumulative, "sum": cells[-1], "buckets": buckets}
+
+    def snapshot(self):
+        """{metric: {label string: nilai}}; label string format Prometheus
+        ('direction="in",peer="10.0.0.2"', "" tanpa label). Histogram:
+        {"count", "sum", "buckets": {le: jumlah kumulatif}}"""
+        result = {}
+        for name, items in self._series().items():
+            metric = self._metrics[name]
+            result[name] = {
+                _label_str(key): self._histogram(metric, value) if metric.kind == HISTOGRAM else value
+                for key, value in items
+            }
+        return result
+
+    def render(self):
+        """Format teks Prometheus (text/plain; version=0.0.4)"""
+        lines = []
+        for name, items in self._series().items():
+            metric = self._metrics[name]
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in items:
+                if metric.kind != HISTOGRAM:
+                    lines.append(f"{name}{{{_label_str(key)}}} {_number(value)}" if key else f"{name} {_number(value)}")
+                    continue
+                hist = self._histogram(metric, value)
+                for le, count in hist['buckets'].items():
+                    lines.append(f"{name}_bucket{{{_label_str(key + (('le', le),))}}} {count}")
+                suffix = f"{{{_label_str(key)}}}" if key else ""
+                lines.append(f"{name}_sum{suffix} {_number(hist['sum'])}")
+                lines.append(f"{name}_count{suffix} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+def node_metrics():
+    """Registry dengan semua metrik standar node BProto"""
+    m = Metrics()
+    m.counter("bproto_connections_accepted_total", "Koneksi masuk yang diterima (sebelum autentikasi)")
+    m.counter("bproto_connections_rejected_total", "Koneksi masuk yang ditolak (busy / auth / error / mux_limit)")
+    m.histogram("bproto_handshake_seconds", "Waktu dari koneksi diterima sampai autentikasi selesai",
+                LATENCY_BUCKETS)
+    m.counter("bproto_transfers_total", "Transfer file selesai per arah & hasil")
+    m.counter("bproto_transfer_bytes_total", "Ukuran file transfer yang berhasil per peer & arah (termasuk bagian yang di-skip dedup/delta/resume)")
+    m.histogram("bproto_transfer_duration_seconds", "Durasi transfer file yang berhasil", DURATION_BUCKETS)
+    m.histogram("bproto_transfer_throughput_bytes", "Throughput transfer file yang berhasil (byte/detik)",
+                THROUGHPUT_BUCKETS)
+    m.counter("bproto_checksum_failures_total", "File yang gagal verifikasi checksum")
+    m.gauge("bproto_transfers_active", "Transfer file yang sedang berjalan")
+    return m
+
+class MetricsServer:
+    """Front-end HTTP kecil di ServerEngine: GET /metrics -> format teks Prometheus"""
+
+    def __init__(self, port, metrics, events, engine, host=METRICS_HOST):
+        self.port = port
+        self.host = host
+        self.metrics = metrics
+        self.events = events
+        self.engine = engine
+
+    def start(self):
+        self.engine.add(self)
+        self.engine.start()
+
+    def stop(self):
+        self.engine.remove(self)
+
+    async def serve(self, engine):
+        try:
+            server = await asyncio.start_server(self._handle, self.host, self.port)
+            async with server:
+                self.events.log(f"Metrics endpoint: http://{self.host}:{self.port}/metrics")
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.events.error(f"Metrics Server Error: {e}")
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass  # Header request tidak dipakai
+            parts = request.decode(errors='replace').split()
+            path = parts[1].split("?")[0] if len(parts) > 1 else ""
+            if parts and parts[0] == "GET" and path in ("/", "/metrics"):
+                status, body = "200 OK", self.metrics.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
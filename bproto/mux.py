@@ -0,0 +1,425 @@
+# bproto/mux.py
+# Multiplexing: satu koneksi V3 per peer membawa banyak stream logis (file,
+# chat, clipboard). Tiap stream dipotong jadi frame DATA kecil yang dikirim
+# satu writer thread berdasarkan prioritas, jadi pesan kecil tidak menunggu
+# transfer besar selesai. Flow control per stream memakai kredit: pengirim
+# hanya boleh punya MUX_WINDOW byte yang belum dikonfirmasi penerima.
+#
+#   Pengirim -> penerima : OPEN(header) DATA* END({"checksum"}) | RESET
+#   Penerima -> pengirim : CREDIT(n)* lalu END({"ok", ...}) | RESET({"error"})
+import os
+import time
+import uuid
+import queue
+import socket
+import hashlib
+import threading
+from collections import deque
+
+from .config import (MUX_FRAME_SIZE, MUX_WINDOW, MUX_NOTSENT_LOWAT, MUX_REPLY_TIMEOUT,
+                     KEEPALIVE_TIMEOUT, VERIFY_INTEGRITY, CHUNK_SIZE)
+from .protocol import PacketType
+from .frame import (HEADER, FRAME_OPEN, FRAME_DATA, FRAME_END, FRAME_CREDIT, FRAME_RESET,
+                    encode_frame, encode_fields, decode_fields, parse_header)
+from .shaping import PRIORITY_INTERACTIVE, PRIORITY_BULK
+from .storage import StagedFile
+from .utils import SystemUtils, recv_exact
+
+PRIORITY_CONTROL = "control"  # Chat, clipboard, kontrol sync: selalu dikirim duluan
+_LEVELS = {PRIORITY_CONTROL: 0, PRIORITY_INTERACTIVE: 1, PRIORITY_BULK: 2}
+_MAX_STREAM_ID = 0xFFFF
+
+def _set_notsent_lowat(sock):
+    """Batasi data yang antre di kernel supaya frame prioritas tinggi tidak
+    tertahan di belakang buffer kirim yang penuh data bulk"""
+    opt = getattr(socket, 'TCP_NOTSENT_LOWAT', None)
+    if opt is None or not MUX_NOTSENT_LOWAT: return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, opt, MUX_NOTSENT_LOWAT)
+    except OSError:
+        pass
+
+class MuxStream:
+    def __init__(self, session, stream_id, priority):
+        self.session = session
+        self.id = stream_id
+        self.level = _LEVELS.get(priority, _LEVELS[PRIORITY_BULK])
+        self.credit = MUX_WINDOW
+        self.result = None
+        self.done = threading.Event()
+
+    def write(self, data):
+        self.session._send_data(self, data)
+
+    def finish(self, fields=None, timeout=MUX_REPLY_TIMEOUT):
+        """Kirim END lalu tunggu hasil dari penerima"""
+        try:
+            self.session._enqueue(self.level, encode_frame(FRAME_END, encode_fields(fields or {}), stream_id=self.id))
+        except ConnectionError as e:
+            return self.result or {"ok": False, "error": str(e)}
+        return self.wait(timeout)
+
+    def wait(self, timeout=MUX_REPLY_TIMEOUT):
+        """Hasil akhir stream: {"ok": bool, ...}"""
+        if not self.done.wait(timeout):
+            self.reset("timeout")
+        return self.result
+
+    def reset(self, error):
+        self.session._reset(self, error)
+
+class MuxSession:
+    """Sisi pengirim satu sesi mux. Dibuat oleh BProto.mux_session()
+    dari socket yang sudah terautentikasi dengan header MUX."""
+
+    def __init__(self, sock, peer, events):
+        self.sock = sock
+        self.peer = peer
+        self.events = events
+        self.closed = False
+        self.error = None
+        self._cond = threading.Condition()
+        self._queues = [deque() for _ in range(len(_LEVELS))]
+        self._streams = {}
+        self._next_id = 1
+
+        sock.settimeout(None)  # Writer/reader blok; close() membangunkan keduanya
+        _set_notsent_lowat(sock)
+        threading.Thread(target=self._write_loop, daemon=True, name=f"mux-write-{peer}").start()
+        threading.Thread(target=self._read_loop, daemon=True, name=f"mux-read-{peer}").start()
+
+    # --- STREAM ---
+
+    def open_stream(self, header, priority=PRIORITY_BULK):
+        payload = encode_fields(header)  # FrameError sebelum stream didaftarkan
+        with self._cond:
+            if self.closed:
+                raise ConnectionError(f"Sesi mux tertutup: {self.error}")
+            stream_id = self._next_id
+            while stream_id in self._streams:
+                stream_id = stream_id % _MAX_STREAM_ID + 1
+            self._next_id = stream_id % _MAX_STREAM_ID + 1
+            stream = MuxStream(self, stream_id, priority)
+            self._streams[stream_id] = stream
+            self._queues[stream.level].append(encode_frame(FRAME_OPEN, payload, stream_id=stream_id))
+            self._cond.notify_all()
+        return stream
+
+    def request(self, header, priority=PRIORITY_CONTROL, timeout=MUX_REPLY_TIMEOUT):
+        """Stream satu pesan (isi di header OPEN), tunggu hasilnya"""
+        return self.open_stream(header, priority).wait(timeout)
+
+    def send_message(self, text, timeout=MUX_REPLY_TIMEOUT):
+        return self.request({"type": PacketType.MESSAGE, "content": text}, timeout=timeout)
+
+    def send_clipboard(self, text, timeout=MUX_REPLY_TIMEOUT):
+        return self.request({"type": PacketType.CLIPBOARD, "content": text}, timeout=timeout)
+
+    def send_file(self, path, priority=PRIORITY_BULK, checksum=None, throttle=None, timeout=MUX_REPLY_TIMEOUT):
+        """Kirim isi file utuh sebagai satu stream. throttle: Flow dari Shaper.
+        Return hasil dari penerima: {"ok", "checksum"} atau {"ok": False, "error"}"""
+        name = os.path.basename(path)
+        size = os.path.getsize(path)
+        stream = self.open_stream({"type": PacketType.FILE_INIT, "file": {"name": name, "size": size}}, priority)
+        hasher = hashlib.sha256() if VERIFY_INTEGRITY and not checksum else None
+        sent = 0
+        reported = 0
+        start_time = time.time()
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(MUX_FRAME_SIZE)
+                    if not chunk: break
+                    if hasher: hasher.update(chunk)
+                    if throttle: throttle.consume(len(chunk))
+                    stream.write(chunk)
+                    sent += len(chunk)
+                    if sent - reported >= CHUNK_SIZE:
+                        reported = sent
+                        elapsed = time.time() - start_time
+                        mbps = sent / (1024*1024) / (elapsed if elapsed > 0 else 1)
+                        self.events.progress(name, min((sent/size)*100, 99), mbps)
+        except ConnectionError:
+            return stream.result or {"ok": False, "error": str(self.error)}
+        except OSError as e:
+            stream.reset(str(e))  # Gagal baca file lokal
+            return stream.result
+        if hasher: checksum = hasher.hexdigest()
+        return stream.finish({"checksum": checksum if VERIFY_INTEGRITY else None}, timeout)
+
+    # --- INTERNAL ---
+
+    def _enqueue(self, level, data):
+        with self._cond:
+            if self.closed:
+                raise ConnectionError(f"Sesi mux tertutup: {self.error}")
+            self._queues[level].append(data)
+            self._cond.notify_all()
+
+    def _send_data(self, stream, data):
+        view = memoryview(data)
+        for off in range(0, len(view), MUX_FRAME_SIZE):
+            piece = view[off:off + MUX_FRAME_SIZE]
+            with self._cond:
+                while stream.credit < len(piece) and not self.closed and not stream.done.is_set():
+                    self._cond.wait()
+                if stream.done.is_set():
+                    raise ConnectionError(f"Stream dihentikan penerima: {stream.result.get('error')}")
+                if self.closed:
+                    raise ConnectionError(f"Sesi mux tertutup: {self.error}")
+                stream.credit -= len(piece)
+                self._queues[stream.level].append(encode_frame(FRAME_DATA, bytes(piece), stream_id=stream.id))
+                self._cond.notify_all()
+
+    def _reset(self, stream, error):
+        with self._cond:
+            if self._streams.pop(stream.id, None) is None: return
+            stream.result = {"ok": False, "error": error}
+            stream.done.set()
+            if not self.closed:
+                # Frame lama stream ini yang masih antre tetap terkirim; penerima
+                # mengabaikan DATA untuk stream yang sudah di-reset
+                self._queues[0].append(encode_frame(FRAME_RESET, encode_fields({"error": error}), stream_id=stream.id))
+            self._cond.notify_all()
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self.closed and not any(self._queues):
+                    self._cond.wait()
+                if self.closed: return
+                # Antrean prioritas tertinggi yang berisi; satu frame per giliran
+                data = next(q for q in self._queues if q).popleft()
+            try:
+                self.sock.sendall(data)
+            except OSError as e:
+                self._fail(e)
+                return
+
+    def _read_loop(self):
+        try:
+            while True:
+                frame_type, _, stream_id, length = parse_header(recv_exact(self.sock, HEADER.size))
+                fields = decode_fields(recv_exact(self.sock, length)) if length else None
+                with self._cond:
+                    stream = self._streams.get(stream_id)
+                    if stream is None: continue
+                    if frame_type == FRAME_CREDIT:
+                        stream.credit += int(fields or 0)
+                    elif frame_type in (FRAME_END, FRAME_RESET):
+                        del self._streams[stream_id]
+                        if frame_type == FRAME_END:
+                            stream.result = fields if isinstance(fields, dict) else {"ok": False}
+                        else:
+                            stream.result = {"ok": False, "error": (fields or {}).get('error')}
+                        stream.done.set()
+                    self._cond.notify_all()
+        except (OSError, ConnectionError, ValueError) as e:
+            self._fail(e)
+
+    def _fail(self, error):
+        with self._cond:
+            if self.closed: return
+            self.closed = True
+            self.error = error
+            for stream in self._streams.values():
+                stream.result = {"ok": False, "error": f"Sesi mux putus: {error}"}
+                stream.done.set()
+            self._streams.clear()
+            self._cond.notify_all()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def close(self):
+        self._fail("closed")
+
+class _IncomingFile:
+    """Stream file di sisi penerima. Data ditulis worker thread sendiri supaya
+    disk lambat tidak menahan stream lain; kredit dikembalikan setelah ditulis."""
+
+    def __init__(self, server, stream_id, meta):
+        self.server = server
+        self.id = stream_id
+        self.name = os.path.basename(meta['name'])
+        self.size = int(meta['size'])
+        self.received = 0
+        self.granted = 0
+        self.queue = queue.SimpleQueue()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True, name=f"mux-file-{self.id}").start()
+
+    def feed(self, data):
+        self.received += len(data)
+        if self.received > self.granted + MUX_WINDOW:
+            raise ValueError(f"Stream {self.id} melewati kredit flow control")
+        self.queue.put(data)
+
+    def end(self, checksum):
+        self.queue.put(("end", checksum))
+
+    def abort(self):
+        self.queue.put(None)
+
+    def _run(self):
+        transfer = self.server.transfer
+        events = self.server.events
+        path = os.path.join(transfer.save_dir, self.name)
+        out = None
+        hasher = hashlib.sha256() if VERIFY_INTEGRITY else None
+        written = 0
+        reported = 0
+        start_time = time.time()
+        try:
+            # .part unik per stream: tidak bentrok dengan terima TCP / stream lain bernama sama
+            part_path = transfer._part_path(self.name, f"mux-{uuid.uuid4().hex[:8]}")
+            out = StagedFile(part_path, path, self.size, transfer.durability)
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    out.abort()
+                    return
+                if isinstance(item, tuple): break
+                out.write(item)
+                if hasher: hasher.update(item)
+                written += len(item)
+                if written - self.granted >= MUX_WINDOW // 2:
+                    credit = written - self.granted
+                    self.granted = written  # Sebelum CREDIT terkirim (reader membaca nilai ini)
+                    self.server._reply(FRAME_CREDIT, self.id, credit)
+                if written - reported >= CHUNK_SIZE:
+                    reported = written
+                    elapsed = time.time() - start_time
+                    mbps = written / (1024*1024) / (elapsed if elapsed > 0 else 1)
+                    events.progress(self.name, min((written/self.size)*100, 99), mbps)
+
+            expected = item[1]
+            if written != self.size:
+                raise ValueError(f"Ukuran tidak cocok ({written}/{self.size} byte)")
+            digest = hasher.hexdigest() if hasher else None
+            if hasher and expected and digest != expected:
+                transfer._checksum_failed()
+                raise ValueError("Checksum mismatch")
+
+            out.commit()
+            events.log(f"File Received: {self.name} (mux)")
+            events.progress(self.name, 100, 0)
+            transfer._file_received(path, written, digest)
+            transfer.metrics.record_transfer("in", self.server.client_ip, written, time.time() - start_time, True)
+            self.server._close_stream(self, FRAME_END, {"ok": True, "checksum": digest})
+        except Exception as e:
+            transfer.metrics.record_transfer("in", self.server.client_ip, written, time.time() - start_time, False)
+            if out: out.abort()
+            events.error(f"Mux stream {self.name}: {e}")
+            self.server._close_stream(self, FRAME_RESET, {"error": str(e)})
+
+class MuxServer:
+    """Sisi penerima satu sesi mux. Dipanggil ServerManager setelah auth;
+    memakai koneksi sampai pengirim menutupnya atau idle KEEPALIVE_TIMEOUT."""
+
+    def __init__(self, conn, client_ip, transfer, events):
+        self.conn = conn
+        self.client_ip = client_ip
+        self.transfer = transfer
+        self.events = events
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        # Chat & clipboard (listener / subprocess clipboard bisa lambat) diproses
+        # di thread per tipe, bukan di reader yang melayani semua stream.
+        # Urutan per tipe tetap; hanya diakses reader thread.
+        self._control = {}
+
+    def serve(self):
+        try:
+            while True:
+                # Idle (tanpa stream aktif) terlalu lama -> tutup sesi
+                self.conn.settimeout(None if self._streams else KEEPALIVE_TIMEOUT)
+                try:
+                    head = recv_exact(self.conn, HEADER.size)
+                except socket.timeout:
+                    break
+                self.conn.settimeout(None)
+                frame_type, _, stream_id, length = parse_header(head)
+                self._handle(frame_type, stream_id, recv_exact(self.conn, length))
+        except (OSError, ConnectionError, ValueError) as e:
+            if self._streams:
+                self.events.error(f"Sesi mux {self.client_ip} putus: {e}")
+        finally:
+            with self._lock:
+                streams = list(self._streams.values())
+                self._streams.clear()
+            for stream in streams:
+                stream.abort()
+            for control in self._control.values():
+                control.put(None)
+
+    def _handle(self, frame_type, stream_id, payload):
+        if frame_type == FRAME_DATA:
+            stream = self._streams.get(stream_id)
+            if stream: stream.feed(payload)
+        elif frame_type == FRAME_OPEN:
+            self._open(stream_id, decode_fields(payload))
+        elif frame_type == FRAME_END:
+            stream = self._streams.get(stream_id)
+            if stream: stream.end((decode_fields(payload) or {}).get('checksum'))
+        elif frame_type == FRAME_RESET:
+            with self._lock:
+                stream = self._streams.pop(stream_id, None)
+            if stream: stream.abort()
+
+    def _open(self, stream_id, header):
+        msg_type = header.get('type')
+        if msg_type in (PacketType.MESSAGE, PacketType.CLIPBOARD):
+            control = self._control.get(msg_type)
+            if control is None:
+                control = self._control[msg_type] = queue.SimpleQueue()
+                threading.Thread(target=self._control_loop, args=(control,), daemon=True,
+                                 name=f"mux-{msg_type.lower()}-{self.client_ip}").start()
+            control.put((stream_id, msg_type, header.get('content')))
+        elif msg_type == PacketType.FILE_INIT:
+            try:
+                stream = _IncomingFile(self, stream_id, header['file'])
+            except (KeyError, TypeError, ValueError) as e:
+                self._reply(FRAME_RESET, stream_id, {"error": f"Header file tidak valid: {e}"})
+                return
+            with self._lock:
+                self._streams[stream_id] = stream
+            stream.start()
+        else:
+            self._reply(FRAME_RESET, stream_id, {"error": f"Tipe stream tidak didukung: {msg_type}"})
+
+    def _control_loop(self, control):
+        while True:
+            item = control.get()
+            if item is None: return
+            stream_id, msg_type, content = item
+            try:
+                if msg_type == PacketType.MESSAGE:
+                    self.events.log(f"Chat dari {self.client_ip}: {content}")
+                    self.events.emit("message", self.client_ip, content)
+                    self._reply(FRAME_END, stream_id, {"ok": True})
+                else:
+                    success = SystemUtils.copy_to_clipboard(content)
+                    self.events.log(f"Clipboard dari {self.client_ip}: {'Sukses' if success else 'Gagal'}")
+                    self._reply(FRAME_END, stream_id, {"ok": True, "copied": success})
+            except Exception as e:
+                self.events.error(f"Mux stream {stream_id}: {e}")
+                self._reply(FRAME_RESET, stream_id, {"error": str(e)})
+
+    def _close_stream(self, stream, frame_type, fields):
+        with self._lock:
+            if self._streams.get(stream.id) is stream:
+                del self._streams[stream.id]
+        self._reply(frame_type, stream.id, fields)
+
+    def _reply(self, frame_type, stream_id, fields):
+        data = encode_frame(frame_type, encode_fields(fields), stream_id=stream_id)
+        try:
+            with self._send_lock:
+                self.conn.sendall(data)
+        except OSError:
+            pass  # Reader thread akan melihat koneksi putus
@@ -0,0 +1,250 @@
+# bproto/outbox.py
+# Antrean kirim persisten. Transfer yang gagal (server reboot, Wi-Fi putus)
+# dicatat di journal lalu dicoba ulang oleh worker dengan backoff eksponensial
+# + jitter. Percobaan ulang memakai send_file biasa, jadi melanjutkan dari
+# file .part penerima (resume offset yang sudah diterima) bila masih ada.
+#
+# Journal: JSON per baris, {"op": "put", "item": {...}} atau {"op": "del", "id"},
+# di-fsync tiap record dan dipadatkan saat dibuka / saat terlalu panjang.
+import os
+import json
+import time
+import uuid
+import random
+import threading
+from .config import OUTBOX_WORKERS, OUTBOX_BASE_DELAY, OUTBOX_MAX_DELAY, OUTBOX_MAX_ATTEMPTS
+from .storage import sync_fd
+
+STATE_PENDING = "pending"
+STATE_FAILED = "failed"  # Jatah percobaan habis; retry_failed() untuk mencoba lagi
+
+class Outbox:
+    def __init__(self, bp, journal_file, workers=OUTBOX_WORKERS):
+        """bp: instance BProto yang dipakai untuk mengirim"""
+        self.bp = bp
+        self.events = bp.events
+        self.journal_file = journal_file
+        self.workers = max(1, workers)
+        self._items = {}
+        self._inflight = set()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+        self._records = 0
+        self.delivered = 0  # Sejak start
+        self._load()
+
+    # --- JOURNAL ---
+
+    def _load(self):
+        if not os.path.exists(self.journal_file): return
+        try:
+            with open(self.journal_file, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Baris terakhir terpotong (crash saat menulis)
+                    if record.get('op') == "put":
+                        self._items[record['item']['id']] = record['item']
+                    elif record.get('op') == "del":
+                        self._items.pop(record.get('id'), None)
+        except OSError as e:
+            print(f"[WARNING] Outbox journal tidak bisa dibaca: {e}")
+            return
+        self._compact()
+        if self._items:
+            self.events.log(f"Outbox: {len(self._items)} transfer tertunda dimuat")
+
+    def _compact(self):
+        # Dipanggil dengan _cond dipegang (atau saat init)
+        os.makedirs(os.path.dirname(self.journal_file) or '.', exist_ok=True)
+        tmp = self.journal_file + ".tmp"
+        with open(tmp, 'w') as f:
+            for item in self._items.values():
+                f.write(json.dumps({"op": "put", "item": item}) + "\n")
+            f.flush()
+            sync_fd(f.fileno())
+        os.replace(tmp, self.journal_file)
+        self._records = len(self._items)
+
+    def _append(self, record):
+        # Dipanggil dengan _cond dipegang
+        if self._records > 2 * len(self._items) + 64:
+            self._compact()  # _items sudah berisi perubahan ini
+            return
+        os.makedirs(os.path.dirname(self.journal_file) or '.', exist_ok=True)
+        with open(self.journal_file, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            sync_fd(f.fileno())
+        self._records += 1
+
+    def _put(self, item):
+        self._items[item['id']] = item
+        self._append({"op": "put", "item": item})
+
+    def _delete(self, item_id):
+        if self._items.pop(item_id, None) is not None:
+            self._append({"op": "del", "id": item_id})
+
+    # --- API ---
+
+    def enqueue(self, peer, path, priority="bulk", delta=False):
+        """Masukkan file ke antrean untuk peer. Return id item.
+        Isi yang sama (peer, nama, sha256) yang masih antre tidak ditambah lagi;
+        versi lama dari path yang sama digantikan."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        checksum = self.bp.transfer.checksum_cache.get(path, st)
+        if checksum is None:
+            checksum = self.bp.transfer.calculate_checksum(path)
+            if os.stat(path).st_mtime_ns == st.st_mtime_ns:
+                self.bp.transfer.checksum_cache.put(path, checksum, st)
+        name = os.path.basename(path)
+        now = time.time()
+
+        with self._cond:
+            for item in list(self._items.values()):
+                if item['peer'] != peer: continue
+                if item['name'] == name and item['checksum'] == checksum:
+                    if item['state'] == STATE_FAILED:
+                        item.update(state=STATE_PENDING, next_try=now)
+                        self._put(item)
+                        self._cond.notify()
+                    return item['id']
+                if item['path'] == path and item['id'] not in self._inflight:
+                    self._delete(item['id'])  # Isi file sudah berubah
+
+            item = {
+                "id": uuid.uuid4().hex, "peer": peer, "path": path, "name": name,
+                "checksum": checksum, "size": st.st_size, "priority": priority, "delta": bool(delta),
+                "created": now, "attempts": 0, "next_try": now, "last_error": None,
+                "state": STATE_PENDING
+            }
+            self._put(item)
+            self._cond.notify()
+        return item['id']
+
+    def cancel(self, item_id):
+        with self._cond:
+            if item_id in self._inflight: return False
+            self._delete(item_id)
+            return True
+
+    def retry_failed(self):
+        """Aktifkan lagi item yang jatah percobaannya sudah habis"""
+        count = 0
+        with self._cond:
+            for item in self._items.values():
+                if item['state'] == STATE_FAILED:
+                    item.update(state=STATE_PENDING, attempts=0, next_try=time.time())
+                    self._put(item)
+                    count += 1
+            self._cond.notify_all()
+        return count
+
+    def items(self):
+        with self._cond:
+            return [dict(item, inflight=item['id'] in self._inflight) for item in self._items.values()]
+
+    def stats(self):
+        """Ringkasan backlog untuk UI"""
+        now = time.time()
+        with self._cond:
+            pending = [i for i in self._items.values() if i['state'] == STATE_PENDING]
+            oldest = min((i['created'] for i in pending), default=None)
+            peers = {}
+            for item in pending:
+                peers[item['peer']] = peers.get(item['peer'], 0) + 1
+            return {
+                "pending": len(pending),
+                "inflight": len(self._inflight),
+                "failed": sum(1 for i in self._items.values() if i['state'] == STATE_FAILED),
+                "pending_bytes": sum(i['size'] for i in pending),
+                "oldest": oldest,
+                "oldest_age": now - oldest if oldest else 0,
+                "failures": sum(i['attempts'] for i in self._items.values()),
+                "delivered": self.delivered,
+                "peers": peers
+            }
+
+    # --- WORKER ---
+
+    def start(self):
+        with self._cond:
+            if self._running: return
+            self._running = True
+        self._threads = [threading.Thread(target=self._worker, daemon=True, name=f"outbox-{i}")
+                         for i in range(self.workers)]
+        for t in self._threads: t.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def _next_due(self):
+        # Dipanggil dengan _cond dipegang. Return (item, detik tunggu)
+        best = None
+        for item in self._items.values():
+            if item['state'] != STATE_PENDING or item['id'] in self._inflight: continue
+            if best is None or item['next_try'] < best['next_try']:
+                best = item
+        if best is None:
+            return None, None
+        return best, max(0.0, best['next_try'] - time.time())
+
+    def _backoff(self, attempts):
+        delay = min(OUTBOX_MAX_DELAY, OUTBOX_BASE_DELAY * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)  # Jitter: klien tidak menyerbu server bersamaan
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._running: return
+                    item, wait = self._next_due()
+                    if item is not None and wait == 0: break
+                    self._cond.wait(wait)
+                self._inflight.add(item['id'])
+                item = dict(item)
+
+            ok, error = self._send(item)
+
+            with self._cond:
+                self._inflight.discard(item['id'])
+                current = self._items.get(item['id'])
+                if current is None:
+                    continue  # Dibatalkan / digantikan saat dikirim
+                if ok:
+                    self._delete(item['id'])
+                    self.delivered += 1
+                else:
+                    current['attempts'] += 1
+                    current['last_error'] = error
+                    if error == "missing" or (OUTBOX_MAX_ATTEMPTS and current['attempts'] >= OUTBOX_MAX_ATTEMPTS):
+                        current['state'] = STATE_FAILED
+                    else:
+                        current['next_try'] = time.time() + self._backoff(current['attempts'])
+                    self._put(current)
+                    item = dict(current)
+                self._cond.notify_all()
+
+            if ok:
+                self.events.log(f"Outbox: {item['name']} terkirim ke {item['peer']}")
+                self.events.emit("outbox", "done", item)
+            elif item['state'] == STATE_FAILED:
+                self.events.error(f"Outbox: {item['name']} ke {item['peer']} gagal permanen ({item['last_error']})")
+                self.events.emit("outbox", "failed", item)
+            else:
+                self.events.emit("outbox", "retry", item)
+
+    def _send(self, item):
+        if not os.path.exists(item['path']):
+            return False, "missing"
+        try:
+            ok = self.bp.send_file(item['peer'], item['path'], delta=item['delta'], priority=item['priority'])
+        except Exception as e:
+            return False, str(e)
+        return ok, None if ok else "send failed"
@@ -0,0 +1,240 @@
+# bproto/pipeline.py
+# Pipeline penerima (receive_stream): thread socket hanya membaca frame ke
+# buffer, worker pool mendekripsi/dekompresi, dan thread write-behind menulis
+# ke disk berurutan dalam potongan besar. Buffer & queue dibatasi: jika disk
+# atau dekripsi lambat, reader berhenti membaca socket sehingga window TCP
+# menutup dan pengirim ikut melambat (backpressure lewat TCP).
+#
+#   socket -> [reader] -> queue (RECV_PIPELINE_DEPTH) -> [writer] -> StagedFile
+#                 \-> decode pool (zlib/AES-GCM) -/
+import time
+import queue
+import threading
+from .config import RECV_PIPELINE_DEPTH, RECV_BUFFER_BYTES, WRITE_BEHIND_SIZE
+from .utils import recv_exact, recv_into_exact
+
+class PipelineStats:
+    """Statistik kumulatif semua transfer (thread-safe), untuk tuning depth/worker.
+    Stall per tahap (detik):
+      read_stall   - reader menunggu buffer / slot queue (hilir lambat -> TCP ditahan)
+      decode_stall - writer menunggu hasil decode (CPU zlib/AES-GCM jadi batas)
+      write_idle   - writer menunggu frame dari reader (jaringan jadi batas)
+      write_time   - waktu di write() ke file (disk jadi batas)"""
+
+    STAGES = ("read_stall", "decode_stall", "write_idle", "write_time")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.transfers = 0
+            self.active = 0
+            self.frames = 0
+            self.bytes = 0
+            self.writes = 0
+            self.queue_depth = 0  # Frame antre + yang sedang menunggu slot (semua transfer aktif)
+            self.queue_max = 0
+            self.stall = dict.fromkeys(self.STAGES, 0.0)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stall[stage] += seconds
+
+    def queued(self, delta):
+        with self._lock:
+            self.queue_depth += delta
+            self.queue_max = max(self.queue_max, self.queue_depth)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "transfers": self.transfers, "active": self.active, "frames": self.frames,
+                "bytes": self.bytes, "writes": self.writes,
+                "queue_depth": self.queue_depth, "queue_max": self.queue_max,
+                "stall": dict(self.stall),
+            }
+
+class _BufferPool:
+    """Buffer terima yang dipakai ulang. Jumlah dan total byte-nya dibatasi:
+    reader menunggu di acquire() sampai writer / worker decode melepas buffer.
+    Jika tidak ada buffer sama sekali, satu buffer selalu boleh dibuat."""
+
+    def __init__(self, count, max_bytes):
+        self._free = []
+        self._cond = threading.Condition()
+        self._count = count
+        self._max_bytes = max_bytes
+        self._made = 0   # Buffer yang ada (bebas + dipakai)
+        self._bytes = 0  # Total ukurannya
+
+    def acquire(self, size, stop):
+        with self._cond:
+            while True:
+                for i, buf in enumerate(self._free):
+                    if len(buf) >= size:
+                        return self._free.pop(i)
+                fits = self._made < self._count and self._bytes + size <= self._max_bytes
+                if self._free and not fits:
+                    # Buffer bebas terlalu kecil (chunk pengirim membesar): dibuang untuk memberi tempat
+                    self._bytes -= len(self._free.pop())
+                    self._made -= 1
+                    continue
+                if fits or self._made == 0:
+                    self._made += 1
+                    self._bytes += size
+                    return bytearray(size)
+                self._cond.wait(0.2)
+                if stop.is_set(): return None
+
+    def release(self, buf):
+        with self._cond:
+            self._free.append(buf)
+            self._cond.notify()
+
+class ReceivePipeline:
+    """Satu transfer masuk. run() dipanggil di thread pemilik socket dan
+    kembali setelah terminator diterima & semua data sudah ditulis.
+
+    sink(data): dipanggil berurutan di thread writer untuk tiap potongan data
+    asli (hash + progress); write(data): tulis ke file, dalam potongan sampai
+    WRITE_BEHIND_SIZE (frame kecil digabung)."""
+
+    def __init__(self, codec, write, sink, stats, pool=None, depth=RECV_PIPELINE_DEPTH,
+                 write_size=WRITE_BEHIND_SIZE, buffer_bytes=RECV_BUFFER_BYTES):
+        self.codec = codec
+        self.write = write
+        self.sink = sink
+        self.stats = stats
+        self.pool = None if codec.is_identity else pool  # Tanpa transform: tidak perlu worker
+        self.decode_inline = pool is None and not codec.is_identity  # Worker dimatikan: decode di writer
+        self.depth = max(1, depth)
+        self.write_size = write_size
+        self._buffers = _BufferPool(self.depth + 1, buffer_bytes)
+        self._queue = queue.Queue(maxsize=self.depth)
+        self._stop = threading.Event()
+        self._error = None
+
+    def run(self, sock):
+        self._writer_thread = threading.Thread(target=self._writer, daemon=True, name="bproto-write")
+        with self.stats._lock:
+            self.stats.transfers += 1
+            self.stats.active += 1
+        self._writer_thread.start()
+        try:
+            self._read(sock)
+        except BaseException:
+            # Koneksi putus: frame yang sudah diterima tetap ditulis (untuk resume)
+            self._put(None)
+            raise
+        finally:
+            self._writer_thread.join()
+            with self.stats._lock:
+                self.stats.active -= 1
+                # Sisa frame yang tidak sempat ditulis (writer gagal)
+                while not self._queue.empty():
+                    if self._queue.get_nowait() is not None:
+                        self.stats.queue_depth -= 1
+        if self._error:
+            raise self._error
+
+    # --- READER (thread socket) ---
+
+    def _read(self, sock):
+        codec = self.codec
+        while not self._stop.is_set():
+            # Mode adaptive: bit atas length = flag kompresi
+            raw_len = int.from_bytes(recv_exact(sock, 4), byteorder='big')
+            if raw_len == 0:
+                self._put(None)
+                return
+            chunk_len, flag = codec.split_length(raw_len)
+
+            start = time.perf_counter()
+            buf = self._buffers.acquire(chunk_len, self._stop)
+            if buf is None: break
+            waited = time.perf_counter() - start
+            view = memoryview(buf)[:chunk_len]
+            recv_into_exact(sock, view)
+
+            if self.pool:
+                item = (buf, self.pool.submit(self._decode, buf, view, flag), flag)
+            else:
+                item = (buf, view, flag)
+            start = time.perf_counter()
+            if not self._put(item): break
+            self.stats.add("read_stall", waited + time.perf_counter() - start)
+        # Writer gagal (disk penuh / data rusak): error-nya di-raise oleh run()
+
+    def _put(self, item):
+        """Masukkan ke queue (blocking). False jika writer sudah berhenti karena error."""
+        if item is not None: self.stats.queued(1)
+        while self._writer_thread.is_alive():
+            try:
+                self._queue.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        if item is not None: self.stats.queued(-1)
+        return False
+
+    def _decode(self, buf, view, flag):
+        # Worker: hasil decode adalah bytes baru, buffer terima bisa dipakai lagi
+        try:
+            return bytes(self.codec.decode(view, flag))
+        finally:
+            view.release()
+            self._buffers.release(buf)
+
+    # --- WRITE-BEHIND ---
+
+    def _writer(self):
+        pending = bytearray()
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self._queue.get()
+                self.stats.add("write_idle", time.perf_counter() - start)
+                if item is None: break
+                self.stats.queued(-1)
+                buf, data, flag = item
+                view = data
+
+                start = time.perf_counter()
+                if self.pool:
+                    data = data.result()
+                elif self.decode_inline:
+                    data = self.codec.decode(view, flag)
+                self.stats.add("decode_stall", time.perf_counter() - start)
+                self.sink(data)
+                with self.stats._lock:
+                    self.stats.frames += 1
+                    self.stats.bytes += len(data)
+
+                # Frame kecil digabung, frame besar langsung ditulis
+                if pending or len(data) < self.write_size:
+                    pending += data
+                    if len(pending) >= self.write_size:
+                        self._flush(pending)
+                else:
+                    self._flush(data)
+                if not self.pool:
+                    view.release()
+                    self._buffers.release(buf)
+            self._flush(pending)
+        except BaseException as e:
+            # Disk penuh / data rusak: reader berhenti di _put atau acquire
+            self._error = e
+            self._stop.set()
+
+    def _flush(self, data):
+        if not data: return
+        start = time.perf_counter()
+        self.write(data)
+        elapsed = time.perf_counter() - start
+        with self.stats._lock:
+            self.stats.stall["write_time"] += elapsed
+            self.stats.writes += 1
+        if isinstance(data, bytearray):
+            del data[:]
@@ -0,0 +1,97 @@
+# bproto/pool.py
+# Pool koneksi ter-autentikasi per peer. Koneksi dibuka dengan header
+# 'keepalive' sehingga server melayani banyak paket di socket yang sama;
+# request berikutnya tidak perlu connect + auth ulang.
+import time
+import socket
+import threading
+from .protocol import PacketType
+from .utils import recv_json, send_json
+from .config import POOL_SIZE, POOL_IDLE_TIMEOUT, POOL_PING_AFTER
+
+class ConnectionPool:
+    def __init__(self, max_per_peer=POOL_SIZE, idle_timeout=POOL_IDLE_TIMEOUT):
+        self.max_per_peer = max_per_peer
+        self.idle_timeout = idle_timeout
+        self._idle = {}  # peer -> [(sock, waktu terakhir dipakai)]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _alive(sock):
+        """Cek murah tanpa round trip: server yang sudah menutup koneksi
+        membuat socket terbaca dengan 0 byte. Data lain tidak boleh ada."""
+        try:
+            timeout = sock.gettimeout()
+            sock.setblocking(False)
+            try:
+                sock.recv(1, socket.MSG_PEEK)
+                return False
+            except (BlockingIOError, InterruptedError):
+                return True
+            finally:
+                sock.settimeout(timeout)
+        except OSError:
+            return False
+
+    @staticmethod
+    def _ping(sock):
+        try:
+            send_json(sock, {"type": PacketType.PING})
+            return recv_json(sock).get('status') == PacketType.PONG
+        except (OSError, ConnectionError, ValueError):
+            return False
+
+    def acquire(self, peer):
+        """Socket idle yang masih sehat untuk peer, atau None"""
+        while True:
+            with self._lock:
+                conns = self._idle.get(peer)
+                if not conns: return None
+                sock, last_used = conns.pop()
+            idle = time.time() - last_used
+            if idle > self.idle_timeout or not self._alive(sock):
+                self.discard(sock)
+                continue
+            # Lama tidak dipakai: pastikan server masih melayani sebelum dipakai
+            if idle > POOL_PING_AFTER and not self._ping(sock):
+                self.discard(sock)
+                continue
+            return sock
+
+    def release(self, peer, sock):
+        """Kembalikan socket setelah satu request selesai dengan bersih"""
+        self._sweep()
+        with self._lock:
+            conns = self._idle.setdefault(peer, [])
+            if len(conns) < self.max_per_peer:
+                conns.append((sock, time.time()))
+                return
+        self.discard(sock)
+
+    def discard(self, sock):
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def _sweep(self):
+        now = time.time()
+        expired = []
+        with self._lock:
+            for peer, conns in self._idle.items():
+                keep = [(s, t) for s, t in conns if now - t <= self.idle_timeout]
+                expired.extend(s for s, t in conns if now - t > self.idle_timeout)
+                self._idle[peer] = keep
+        for sock in expired:
+            self.discard(sock)
+
+    def close_all(self):
+        with self._lock:
+            conns = [s for items in self._idle.values() for s, _ in items]
+            self._idle.clear()
+        for sock in conns:
+            self.discard(sock)
+
+    def snapshot(self):
+        with self._lock:
+            return {peer: len(conns) for peer, conns in self._idle.items() if conns}
@@ -6,11 +6,14 @@ class PacketType:
     PING = "PING"
     PONG = "PONG"
     FILE_INIT = "FILE_INIT"
+    FILE_BATCH = "FILE_BATCH"     # Banyak file dalam satu sesi (sekali auth)
+    MUX = "MUX"                   # Satu koneksi, banyak stream logis (lihat mux.py)
     MESSAGE = "MESSAGE"           # Fitur Baru: Chat
     CLIPBOARD = "CLIPBOARD"       # Fitur Baru: Remote Clipboard
     AUTH_CHALLENGE = "CHALLENGE"
     AUTH_OK = "OK"
     AUTH_FAIL = "FAIL"
+    BUSY = "BUSY"                 # Server penuh, coba lagi setelah retry_after detik
 
 class AuthMode:
     TOKEN = "TOKEN"
@@ -6,137 +6,383 @@ import json
 import uuid
 import os
 import time
+import asyncio
+from . import frame
 from .protocol import PacketType
-from .utils import SystemUtils
+from .utils import SystemUtils, recv_json, send_json
+from .config import (KEEPALIVE_TIMEOUT, SESSION_TIMEOUT, CONNECTION_TIMEOUT, SERVER_WORKERS, SERVER_BACKLOG,
+                     SERVER_QUEUE, BUSY_RETRY_AFTER, MUX_SERVER_SESSIONS)
+from .mux import MuxServer
+from .engine import ServerEngine, authenticate
+from .metrics import node_metrics
 
 class ServerManager:
-    def __init__(self, port, security, transfer, events):
+    def __init__(self, port, security, transfer, events, profile=None, workers=SERVER_WORKERS,
+                 backlog=SERVER_BACKLOG, queue_size=SERVER_QUEUE, engine=None, metrics=None,
+                 mux_sessions=MUX_SERVER_SESSIONS):
+        """Front-end TCP di ServerEngine. Accept, header & handshake ditangani di
+        event loop; koneksi yang sudah terautentikasi diproses di executor engine.
+        Jika semua worker sibuk dan antrean penuh, klien baru dibalas BUSY +
+        retry_after. backlog: antrean accept kernel. workers / queue_size hanya
+        dipakai jika engine tidak diberikan (engine sendiri). mux_sessions: sesi
+        mux bersamaan maksimal (di luar worker engine, satu thread per sesi)."""
         self.port = port
+        self.profile = profile  # TransferProfile: buffer socket sisi penerima
         self.security = security
         self.transfer = transfer
         self.events = events
+        self.backlog = backlog
+        self.engine = engine or ServerEngine(events, workers, queue_size)
+        self.metrics = metrics if metrics is not None else transfer.metrics
         self.running = False
+        self._tasks = set()  # Handshake & koneksi keep-alive yang sedang menunggu header
+        self._active = set()  # Koneksi yang sedang diproses worker (ditutup saat stop)
+        self.mux_sessions = mux_sessions
+        self._mux_conns = set()  # Koneksi sesi mux yang diterima (thread sendiri)
+        self._mux_lock = threading.Lock()
 
     def start(self):
         self.running = True
-        t = threading.Thread(target=self._accept_loop, daemon=True)
-        t.start()
-        return t
+        self.engine.add(self)
+        self.engine.start()
 
     def stop(self):
         self.running = False
+        self.engine.remove(self)
+        # Worker yang menunggu data (mux, transfer macet) dibangunkan dengan error
+        for conn in list(self._active):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
 
-    def _accept_loop(self):
+    async def serve(self, engine):
+        loop = asyncio.get_running_loop()
         serv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         # Fix: Allow reuse address agar tidak error "Address already in use" saat restart cepat
         serv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # SO_RCVBUF harus diset sebelum listen agar koneksi yang di-accept ikut
+        if self.profile: self.profile.apply(serv)
         
         try:
             serv.bind(('0.0.0.0', self.port))
-            serv.listen(5)
-            while self.running:
-                try:
-                    conn, addr = serv.accept()
-                    threading.Thread(target=self._handle_client, args=(conn, addr)).start()
-                except OSError: break
+            serv.listen(self.backlog)
+            serv.setblocking(False)
+            while True:
+                conn, addr = await loop.sock_accept(serv)  # conn sudah non-blocking
+                self.events.debug(f"Koneksi masuk dari: {addr[0]}")
+                self.metrics.inc("bproto_connections_accepted_total", transport="tcp")
+                if self.profile: self.profile.apply(conn)
+                self._spawn(self._handshake(conn, addr[0]))
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             self.events.error(f"TCP Server Error: {e}")
         finally:
             serv.close()
+            for task in list(self._tasks):
+                task.cancel()
 
-    def _handle_client(self, conn, addr):
-        client_ip = addr[0]
-        # [DEBUG] Tampilkan siapa yang connect
-        print(f"[DEBUG] Koneksi masuk dari: {client_ip}")
+    def _spawn(self, coro):
+        # Dipanggil di thread loop
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
 
+    async def _read_message(self, conn):
+        """Satu pesan V2 / frame V3 utuh, dibaca tepat sebanyak yang kurang
+        (tidak melewati batas pesan; sisa stream milik worker)"""
+        loop = asyncio.get_running_loop()
+        buf = bytearray()
+        while True:
+            need = frame.message_need(buf)
+            if need == 0:
+                return bytes(buf)
+            chunk = await loop.sock_recv(conn, need)
+            if not chunk:
+                raise ConnectionError("Koneksi ditutup sebelum pesan lengkap")
+            buf += chunk
+
+    async def _read_header(self, conn):
+        header, version = frame.decode_message(await self._read_message(conn))
+        frame.set_version(conn, version)  # Balasan memakai versi yang sama
+        return header
+
+    async def _send(self, conn, data):
+        await asyncio.get_running_loop().sock_sendall(conn, frame.encode_message(data, frame.wire_version(conn)))
+
+    async def _handshake(self, conn, client_ip):
+        """Header pertama + autentikasi, dibatasi CONNECTION_TIMEOUT: klien yang
+        lambat / diam tidak pernah menahan worker"""
+        started = time.perf_counter()
         try:
-            # Baca Header Length
-            raw_len = conn.recv(4)
-            if not raw_len: return
-            header_len = struct.unpack("!I", raw_len)[0]
-            
-            # Baca Header JSON
-            header_data = conn.recv(header_len).decode()
-            header = json.loads(header_data)
-            
+            header = await asyncio.wait_for(self._read_header(conn), CONNECTION_TIMEOUT)
+            if self.engine.full():
+                self.metrics.inc("bproto_connections_rejected_total", transport="tcp", reason="busy")
+                await self._reject_busy(conn, client_ip)
+                return
+
             # 1. AUTENTIKASI
-            auth_data = header.get('auth', {})
-            authorized = False
-
-            # Cek Token Lama
-            if auth_data.get('auth_mode') == "TOKEN":
-                if self.security.verify_token(client_ip, auth_data.get('data')):
-                    authorized = True
-                    # Kirim OK
-                    print(f"[DEBUG] {client_ip} Login via TOKEN sukses.")
-                    self._send_json(conn, {"status": "OK", "resume_offset": self._get_local_offset(header)})
-
-            # Jika Token Gagal, Lakukan Handshake Baru
+            async def ask_proof(nonce):
+                await self._send(conn, {"status": "CHALLENGE", "nonce": nonce})
+                return await self._recv_proof(conn)
+
+            authorized, new_token = await asyncio.wait_for(
+                authenticate(self.security, client_ip, header.get('auth', {}), ask_proof, self.events),
+                CONNECTION_TIMEOUT)
             if not authorized:
-                print(f"[DEBUG] {client_ip} Meminta Handshake Baru...")
-                nonce = uuid.uuid4().hex[:8]
-                self._send_json(conn, {"status": "CHALLENGE", "nonce": nonce})
-                
-                # FIX: Baca proof dengan buffer aman (bukan fix 64 byte yg bisa macet)
-                client_proof = conn.recv(1024).decode().strip()
-                
-                if self.security.verify_handshake(nonce, client_proof):
-                    print(f"[DEBUG] {client_ip} Handshake BERHASIL.")
-                    new_token = self.security.create_session_for(client_ip)
-                    self._send_json(conn, {
-                        "status": "OK", 
-                        "token": new_token, 
-                        "resume_offset": self._get_local_offset(header)
-                    })
-                else:
-                    print(f"[DEBUG] {client_ip} Handshake GAGAL (Wrong Secret).")
-                    self._send_json(conn, {"status": "FAIL"})
-                    return
+                self.metrics.inc("bproto_connections_rejected_total", transport="tcp", reason="auth")
+                await self._send(conn, {"status": "FAIL"})
+                conn.close()
+                return
+            self.metrics.observe("bproto_handshake_seconds", time.perf_counter() - started, transport="tcp")
+
+            conn.setblocking(True)
+            self.engine.run_blocking(self._work, self._handle_client, conn, client_ip, header, new_token)
+        except asyncio.CancelledError:
+            conn.close()
+            raise
+        except (OSError, ValueError) as e:
+            # TimeoutError & ConnectionError termasuk OSError, FrameError / JSON rusak termasuk ValueError
+            self.metrics.inc("bproto_connections_rejected_total", transport="tcp", reason="error")
+            self.events.error(f"Client Handle Error: {e!r}")
+            conn.close()
+
+    async def _recv_proof(self, conn):
+        if frame.wire_version(conn) >= frame.VERSION_V3:
+            # V3: proof ber-frame
+            frame_type, _, _, payload = frame.decode_frame(await self._read_message(conn))
+            if frame_type != frame.FRAME_PROOF:
+                raise frame.FrameError(f"Diharapkan proof, diterima tipe frame {frame_type}")
+            return payload.decode(errors='replace')
+        # Klien V2 mengirim proof mentah, dibaca dengan satu recv
+        raw = await asyncio.get_running_loop().sock_recv(conn, 1024)
+        return raw.decode(errors='replace').strip()
+
+    async def _reject_busy(self, conn, client_ip):
+        """Worker & antrean penuh: balas BUSY + saran waktu tunggu lalu tutup"""
+        waiting = max(0, self.engine.inflight - self.engine.workers)
+        retry_after = round(BUSY_RETRY_AFTER * (1 + waiting / max(1, self.engine.queue_size)), 1)
+        try:
+            await asyncio.wait_for(self._send(conn, {"status": PacketType.BUSY, "retry_after": retry_after}), 1.0)
+            conn.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+        self.events.log(f"{client_ip} ditolak: server sibuk (retry_after {retry_after}s)")
+
+    def _park(self, conn, session):
+        """Dari worker: koneksi keep-alive kembali ke event loop sampai header
+        berikutnya datang (tidak memakai thread selama idle)"""
+        if not (self.running and self.engine.call_soon(self._spawn_next, conn, session)):
+            conn.close()
+
+    def _spawn_next(self, conn, session):
+        if not self.running:
+            conn.close()
+            return
+        self._spawn(self._await_next(conn, session))
+
+    async def _await_next(self, conn, session):
+        conn.setblocking(False)
+        try:
+            header = await asyncio.wait_for(self._read_header(conn), KEEPALIVE_TIMEOUT)
+        except asyncio.CancelledError:
+            conn.close()
+            raise
+        except (OSError, ValueError):
+            # Idle terlalu lama / klien menutup koneksi
+            conn.close()
+            return
+        conn.setblocking(True)
+        # Klien sudah dilayani: tidak melewati admission control
+        self.engine.run_blocking(self._work, self._handle_next, conn, session, header)
+
+    def _work(self, fn, conn, *args):
+        self._active.add(conn)
+        try:
+            fn(conn, *args)
+        finally:
+            self._active.discard(conn)
+
+    def _handle_client(self, conn, client_ip, header, new_token):
+        """Worker: koneksi baru yang sudah lolos autentikasi di event loop"""
+        try:
+            if new_token:
+                self._send_json(conn, {"status": "OK", "token": new_token, **self._negotiate(conn, header)})
+            else:
+                # Kirim OK
+                self._send_json(conn, {"status": "OK", **self._negotiate(conn, header)})
 
             # 2. PROSES TIPE PAKET
-            msg_type = header.get('type')
-            
-            if msg_type == PacketType.FILE_INIT:
-                fname = header['file']['name']
-                print(f"[DEBUG] Menerima file: {fname}")
-                self.transfer.receive_stream(conn, header['file'])
-                
-            elif msg_type == PacketType.MESSAGE:
-                content = header.get('content')
-                self.events.log(f"Chat dari {client_ip}: {content}")
-                self.events.emit("message", client_ip, content)
-                
-            elif msg_type == PacketType.CLIPBOARD:
-                content = header.get('content')
-                success = SystemUtils.copy_to_clipboard(content)
-                self.events.log(f"Clipboard dari {client_ip}: {'Sukses' if success else 'Gagal'}")
+            session = {"ip": client_ip, "keepalive": header.get('keepalive', False), "authed_at": time.time()}
+            self._serve(conn, session, header)
 
         except Exception as e:
-            self.events.error(f"Client Handle Error: {e}")
-            import traceback
-            traceback.print_exc() # Print error detail ke terminal server
+            self.events.error(f"Client Handle Error: {e!r}")
+            self._release_mux(conn)
+            conn.close()
+
+    def _serve(self, conn, session, header):
+        """Proses satu paket. Keep-alive: koneksi (sudah terautentikasi) diparkir
+        di event loop menunggu header berikutnya, worker bebas melayani klien lain."""
+        if header.get('type') == PacketType.MUX:
+            # Sesi mux memakai koneksi sampai ditutup / idle KEEPALIVE_TIMEOUT:
+            # reader-nya jalan di thread sendiri, worker engine langsung bebas.
+            # Jumlah thread dibatasi mux_sessions (lihat _admit_mux)
+            if conn not in self._mux_conns:
+                conn.close()  # Ditolak di negotiate: klien memakai koneksi biasa
+                return
+            threading.Thread(target=self._work, args=(self._serve_mux, conn, session['ip']), daemon=True,
+                             name=f"mux-serve-{session['ip']}").start()
+            return
+        reusable = self._dispatch(conn, session['ip'], header)
+        if (reusable and session['keepalive'] and self.running
+                and time.time() - session['authed_at'] <= SESSION_TIMEOUT):
+            self._park(conn, session)
+        else:
+            conn.close()
+
+    def _serve_mux(self, conn, client_ip):
+        try:
+            MuxServer(conn, client_ip, self.transfer, self.events).serve()
+        except Exception as e:
+            self.events.error(f"Mux Session Error: {e!r}")
         finally:
+            self._release_mux(conn)
             conn.close()
 
-    def _send_json(self, sock, data):
-        js = json.dumps(data).encode()
-        sock.sendall(struct.pack("!I", len(js)))
-        sock.sendall(js)
+    def _admit_mux(self, conn):
+        """Terima sesi mux jika masih di bawah mux_sessions. Sesi idle tidak
+        dihitung engine.full(), jadi batasnya di sini."""
+        with self._mux_lock:
+            if len(self._mux_conns) < self.mux_sessions:
+                self._mux_conns.add(conn)
+                return True
+        self.metrics.inc("bproto_connections_rejected_total", transport="tcp", reason="mux_limit")
+        self.events.log(f"Sesi mux ditolak: batas {self.mux_sessions} sesi tercapai")
+        return False
 
-    def _get_local_offset(self, header):
-        # FIX FINAL: Logic sederhana & aman
-        if header.get('type') != PacketType.FILE_INIT: return 0
-        
+    def _release_mux(self, conn):
+        with self._mux_lock:
+            self._mux_conns.discard(conn)
+
+    def _handle_next(self, conn, session, header):
+        """Header berikutnya di koneksi keep-alive (sudah dibaca event loop).
+        PING dijawab langsung (health check pool)."""
         try:
-            fname = header['file']['name']
-            fpath = os.path.join(self.transfer.save_dir, fname)
+            msg_type = header.get('type')
+            if msg_type == PacketType.PING:
+                self._send_json(conn, {"status": PacketType.PONG})
+                self._park(conn, session)
+                return
+            if msg_type in (PacketType.FILE_INIT, PacketType.FILE_BATCH):
+                self._send_json(conn, {"status": "OK", **self._negotiate(conn, header)})
+            self._serve(conn, session, header)
+        except Exception as e:
+            self.events.error(f"Client Handle Error: {e}")
+            conn.close()
+
+    def _dispatch(self, conn, client_ip, header):
+        """Proses satu paket. Return False jika koneksi tidak boleh dipakai lagi
+        (transfer gagal di tengah, posisi stream tidak pasti)."""
+        msg_type = header.get('type')
+        
+        if msg_type == PacketType.FILE_INIT:
+            meta = header['file']
+            self.events.debug(f"Menerima file: {meta['name']}")
+            if meta.get('kind') == 'dir':
+                ok = self._receive(client_ip, meta, self.transfer.receive_directory, conn)
+            elif 'range' in meta:
+                ok = self._receive(client_ip, meta, self.transfer.receive_range, conn)
+            else:
+                ok = self._receive(client_ip, meta, self.transfer.receive_stream, conn)
+            if meta.get('ack'):
+                # Konfirmasi akhir: file sudah diverifikasi & ada di nama akhirnya
+                self._send_json(conn, {"ack": True, "ok": bool(ok), "checksum": meta.get('received_checksum'),
+                                       "size": meta.get('received_size')})
+            return ok
+
+        elif msg_type == PacketType.FILE_BATCH:
+            return self._handle_batch(conn, client_ip)
             
-            if os.path.exists(fpath):
-                size = os.path.getsize(fpath)
-                print(f"[DEBUG] File ada, resume dari: {size}")
-                return size
+        elif msg_type == PacketType.MESSAGE:
+            content = header.get('content')
+            self.events.log(f"Chat dari {client_ip}: {content}")
+            self.events.emit("message", client_ip, content)
+            
+        elif msg_type == PacketType.CLIPBOARD:
+            content = header.get('content')
+            success = SystemUtils.copy_to_clipboard(content)
+            self.events.log(f"Clipboard dari {client_ip}: {'Sukses' if success else 'Gagal'}")
+        if header.get('ack') and msg_type in (PacketType.MESSAGE, PacketType.CLIPBOARD):
+            # Pesan lewat koneksi pool: pengirim menunggu konfirmasi
+            self._send_json(conn, {"status": "OK"})
+        return True
+
+    def _send_json(self, sock, data):
+        send_json(sock, data)
+
+    def _receive(self, client_ip, meta, receive, conn):
+        """Jalankan satu fungsi terima TransferManager + catat metriknya.
+        Range transfer paralel hanya menambah byte (satu file = beberapa
+        range, jangan dihitung sebagai beberapa transfer)."""
+        started = time.perf_counter()
+        self.metrics.inc("bproto_transfers_active", direction="in")
+        ok = False
+        try:
+            ok = receive(conn, meta)
+            return ok
+        finally:
+            self.metrics.inc("bproto_transfers_active", -1, direction="in")
+            if 'range' in meta:
+                if ok: self.metrics.inc("bproto_transfer_bytes_total", meta.get('received_size') or 0,
+                                        direction="in", peer=client_ip)
             else:
-                return 0
+                self.metrics.record_transfer("in", client_ip, meta.get('received_size') or 0,
+                                             time.perf_counter() - started, ok)
+
+    def _handle_batch(self, conn, client_ip):
+        """Sesi batch: [header file -> respon negotiate -> stream -> status]
+        berulang sampai pengirim mengirim {"done": true}"""
+        count = 0
+        while True:
+            item = recv_json(conn)
+            if item.get('done'): break
+            meta = item['file']
+            meta.pop('range', None)
+            meta.pop('stream_broken', None)  # Hanya diisi receive_stream
+            meta['delta'] = False
+            resp = self._negotiate(conn, {"type": PacketType.FILE_INIT, "file": meta})
+            self._send_json(conn, {"status": "OK", **resp})
+            ok = self._receive(client_ip, meta, self.transfer.receive_stream, conn)
+            self._send_json(conn, {"name": meta['name'], "ok": bool(ok), "checksum": meta.get('received_checksum'),
+                                   "size": meta.get('received_size')})
+            count += 1
+            if not ok and meta.get('stream_broken'):
+                # Sisa file tidak terbaca di socket: header berikutnya tidak bisa ditemukan
+                self.events.error(f"Batch dari {client_ip} dihentikan setelah {meta['name']}: stream rusak")
+                return False
+        self.events.log(f"Batch dari {client_ip}: {count} file")
+        return True
+
+    def _negotiate(self, conn, header):
+        """Field tambahan untuk respon OK (resume offset + digest prefix).
+        'keepalive' dibalas supaya klien tahu koneksi boleh dimasukkan ke pool,
+        'ack' supaya klien tahu konfirmasi akhir akan dikirim setelah file."""
+        resp = self._negotiate_transfer(conn, header)
+        if header.get('keepalive'): resp['keepalive'] = True
+        # Pengirim baru meminta ack; dibalas supaya tahu harus menunggunya
+        if header.get('type') == PacketType.FILE_INIT and header['file'].get('ack'): resp['ack'] = True
+        return resp
+
+    def _negotiate_transfer(self, conn, header):
+        if header.get('type') == PacketType.FILE_BATCH: return {"resume_offset": 0, "batch": True}
+        if header.get('type') == PacketType.MUX: return {"resume_offset": 0, "mux": self._admit_mux(conn)}
+        if header.get('type') != PacketType.FILE_INIT: return {"resume_offset": 0}
+        try:
+            return self.transfer.negotiate(conn, header['file'])
         except Exception as e:
-            print(f"[DEBUG] Error cek offset: {e}")
-            return 0
\ No newline at end of file
+            self.events.error(f"Error cek resume: {e}")
+            return {"resume_offset": 0}
\ No newline at end of file
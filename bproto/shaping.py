@@ -0,0 +1,143 @@
+# bproto/shaping.py
+# Pembatas bandwidth: token bucket global + per peer, bisa diubah saat jalan.
+# Kelas prioritas: selama ada transfer "interactive" (upload photobooth),
+# transfer "bulk" (sync background) hanya dapat BULK_SHARE dari limit global.
+import time
+import threading
+from contextlib import contextmanager
+from .config import BANDWIDTH_LIMIT, BULK_SHARE, SHAPING_SLICE, SHAPING_BURST
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+class TokenBucket:
+    """rate dalam byte/detik; 0 = tanpa batas"""
+
+    def __init__(self, rate=0):
+        self._cond = threading.Condition()
+        self.rate = 0
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        self.set_rate(rate)
+
+    @property
+    def burst(self):
+        return max(self.rate * SHAPING_BURST, SHAPING_SLICE)
+
+    def set_rate(self, rate):
+        with self._cond:
+            self._refill()
+            was_unlimited = not self.rate
+            self.rate = max(0, int(rate or 0))
+            if was_unlimited:
+                self.tokens = self.burst
+            self.tokens = min(self.tokens, self.burst)
+            self._cond.notify_all()  # Waiter hitung ulang waktu tunggu dengan rate baru
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def consume(self, n):
+        """Blok sampai n byte boleh dikirim"""
+        with self._cond:
+            while self.rate:
+                self._refill()
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                self._cond.wait((n - self.tokens) / self.rate)
+
+class Flow:
+    """Satu transfer yang sedang berjalan (dipakai TransferManager untuk kirim)"""
+
+    def __init__(self, shaper, peer, priority):
+        self.shaper = shaper
+        self.peer = peer
+        self.priority = priority
+        self.sent = 0
+
+    def consume(self, n):
+        for bucket in self.shaper._buckets_for(self.peer, self.priority):
+            bucket.consume(n)
+        self.sent += n
+
+    def sendall(self, sock, data):
+        view = memoryview(data)
+        for off in range(0, len(view), SHAPING_SLICE):
+            piece = view[off:off + SHAPING_SLICE]
+            self.consume(len(piece))
+            sock.sendall(piece)
+
+    def sendfile(self, sock, f, offset, count):
+        """socket.sendfile per potongan; return jumlah byte terkirim"""
+        written = 0
+        while written < count:
+            n = min(SHAPING_SLICE, count - written)
+            self.consume(n)
+            sent = sock.sendfile(f, offset=offset + written, count=n)
+            written += sent
+            if sent != n: break
+        return written
+
+class Shaper:
+    def __init__(self, global_rate=BANDWIDTH_LIMIT):
+        self.global_bucket = TokenBucket(global_rate)
+        self.bulk_bucket = TokenBucket(0)  # Aktif hanya saat ada flow interactive
+        self.peer_buckets = {}
+        self._active = {p: 0 for p in PRIORITIES}
+        self._lock = threading.Lock()
+
+    def set_limit(self, rate, peer=None):
+        """Ubah limit (byte/detik, 0 = tanpa batas). peer=None -> limit global"""
+        with self._lock:
+            if peer is None:
+                self.global_bucket.set_rate(rate)
+                self._update_bulk_rate()
+            elif rate:
+                bucket = self.peer_buckets.get(peer)
+                if bucket: bucket.set_rate(rate)
+                else: self.peer_buckets[peer] = TokenBucket(rate)
+            elif peer in self.peer_buckets:
+                self.peer_buckets.pop(peer).set_rate(0)  # Bangunkan waiter
+
+    def _update_bulk_rate(self):
+        # Dipanggil dengan _lock dipegang
+        share = 0
+        if self._active[PRIORITY_INTERACTIVE] and self.global_bucket.rate:
+            share = max(1, int(self.global_bucket.rate * BULK_SHARE))
+        self.bulk_bucket.set_rate(share)
+
+    def _buckets_for(self, peer, priority):
+        buckets = []
+        if priority == PRIORITY_BULK and self.bulk_bucket.rate:
+            buckets.append(self.bulk_bucket)
+        bucket = self.peer_buckets.get(peer)
+        if bucket: buckets.append(bucket)
+        if self.global_bucket.rate: buckets.append(self.global_bucket)
+        return buckets
+
+    @contextmanager
+    def flow(self, peer, priority=PRIORITY_BULK):
+        priority = priority if priority in PRIORITIES else PRIORITY_BULK
+        with self._lock:
+            self._active[priority] += 1
+            self._update_bulk_rate()
+        try:
+            yield Flow(self, peer, priority)
+        finally:
+            with self._lock:
+                self._active[priority] -= 1
+                self._update_bulk_rate()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "global": self.global_bucket.rate,
+                "bulk_share": BULK_SHARE,
+                "peers": {peer: b.rate for peer, b in self.peer_buckets.items()},
+                "active": dict(self._active)
+            }
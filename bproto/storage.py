@@ -0,0 +1,136 @@
+# bproto/storage.py
+# Jalur tulis penerima: file staging tersembunyi yang dialokasikan di depan,
+# kebijakan durabilitas, lalu rename atomik ke nama akhir.
+#   "none"     -> tidak pernah fsync (serahkan ke page cache OS)
+#   "fsync"    -> fsync file + folder sekali saat selesai (default)
+#   "periodic" -> fdatasync tiap FSYNC_INTERVAL byte + fsync saat selesai
+import os
+import sys
+import errno
+import ctypes
+from .config import FSYNC_INTERVAL, PREALLOCATE
+
+DURABILITY_NONE = "none"
+DURABILITY_COMPLETE = "fsync"
+DURABILITY_PERIODIC = "periodic"
+DURABILITY_MODES = (DURABILITY_NONE, DURABILITY_COMPLETE, DURABILITY_PERIODIC)
+
+FALLOC_FL_KEEP_SIZE = 0x01
+
+def _load_fallocate():
+    """fallocate(2) dari libc Linux; modul os tidak punya flag KEEP_SIZE"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        func = getattr(libc, 'fallocate64', None) or libc.fallocate
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+    func.restype = ctypes.c_int
+    return func
+
+_fallocate = _load_fallocate()
+
+def preallocate(fd, offset, length, keep_size=False):
+    """Pesan blok disk untuk [offset, offset+length) sekaligus supaya file
+    tidak terfragmentasi saat banyak transfer menulis bersamaan. Disk penuh
+    langsung gagal di sini, bukan di tengah transfer.
+
+    keep_size=True: ukuran file tidak ikut diperbesar (FALLOC_FL_KEEP_SIZE),
+    jadi setelah crash ukuran .part tetap = byte yang sudah ditulis dan
+    resume tidak mulai dari 0. Tanpa dukungan KEEP_SIZE tidak dialokasikan."""
+    if not PREALLOCATE or length <= 0:
+        return
+    try:
+        if keep_size:
+            if _fallocate is None:
+                return
+            if _fallocate(fd, FALLOC_FL_KEEP_SIZE, offset, length) != 0:
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err))
+        elif hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, offset, length)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise
+        # Filesystem tidak mendukung (tmpfs lama, FAT, SMB...): tulis biasa saja
+
+def sync_fd(fd):
+    if hasattr(os, 'fdatasync'):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+def sync_dir(path):
+    """fsync folder agar rename ikut tersimpan (tidak ada di Windows)"""
+    if os.name != 'posix':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def commit(part_path, final_path, durability):
+    """Pindahkan file staging yang sudah ditutup (dan di-sync) ke nama akhir"""
+    os.replace(part_path, final_path)
+    if durability != DURABILITY_NONE:
+        sync_dir(os.path.dirname(final_path) or '.')
+
+class StagedFile:
+    """File tujuan yang ditulis di path staging. Isi baru terlihat di nama
+    akhir setelah commit(); abort() membuang atau menyimpannya untuk resume."""
+
+    def __init__(self, part_path, final_path, size, durability=DURABILITY_COMPLETE, offset=0):
+        self.part_path = part_path
+        self.final_path = final_path
+        self.durability = durability if durability in DURABILITY_MODES else DURABILITY_COMPLETE
+        self.position = offset
+        self._unsynced = 0
+
+        self.file = open(part_path, 'r+b' if offset else 'wb')
+        try:
+            if offset:
+                self.file.seek(offset)
+                self.file.truncate()
+            # Ukuran .part harus tetap = byte yang ditulis (dipakai sebagai offset resume)
+            preallocate(self.file.fileno(), offset, size - offset, keep_size=True)
+        except Exception:
+            self.file.close()
+            raise
+
+    def write(self, data):
+        self.file.write(data)
+        self.position += len(data)
+        if self.durability == DURABILITY_PERIODIC:
+            self._unsynced += len(data)
+            if self._unsynced >= FSYNC_INTERVAL:
+                self.file.flush()
+                sync_fd(self.file.fileno())
+                self._unsynced = 0
+
+    def close(self):
+        """Tutup file; ukuran dipotong ke byte yang benar-benar ditulis
+        (sisa preallocation tidak boleh ikut jadi isi file)"""
+        if self.file.closed:
+            return
+        self.file.flush()
+        if os.fstat(self.file.fileno()).st_size != self.position:
+            self.file.truncate(self.position)
+        if self.durability != DURABILITY_NONE:
+            sync_fd(self.file.fileno())
+        self.file.close()
+
+    def commit(self):
+        self.close()
+        commit(self.part_path, self.final_path, self.durability)
+
+    def abort(self, keep=False):
+        """keep=True: file staging dibiarkan (dipotong ke posisi) untuk resume"""
+        if not self.file.closed:
+            self.file.flush()
+            self.file.truncate(self.position)
+            self.file.close()
+        if not keep and os.path.exists(self.part_path):
+            os.remove(self.part_path)
@@ -2,81 +2,336 @@
 import os
 import time
 import socket
-import zipfile
 import hashlib
 import zlib
-from .config import CHUNK_SIZE, VERIFY_INTEGRITY, ENABLE_COMPRESSION, ENABLE_ENCRYPTION
+import json
+import threading
+import mmap
+import queue
+import weakref
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from .config import (CHUNK_SIZE, VERIFY_INTEGRITY, COMPRESSION_MODE, ENABLE_ENCRYPTION, ENABLE_ZERO_COPY,
+                     RANGE_SESSION_TIMEOUT, PIPELINE_WORKERS, PIPELINE_DEPTH, DURABILITY, FSYNC_INTERVAL,
+                     ENABLE_DEDUP, DEDUP_HASH_LIMIT, DEDUP_HARDLINK, CONTENT_INDEX_DIR,
+                     RECV_PIPELINE, RECV_DECODE_WORKERS)
+from .utils import recv_exact, recv_into_exact, recv_json, send_json
+from .cache import ChecksumCache, ContentIndex
+from .compression import FrameCodec, MODES, MODE_OFF, MODE_ZLIB
+from .delta import (DeltaSignature, block_size_for, iter_signature, iter_delta, encode_op, decode_op, OP_COPY,
+                    SIGNATURE_SPAN)
+from .storage import StagedFile, preallocate, sync_fd, commit, DURABILITY_NONE, DURABILITY_PERIODIC
+from .pipeline import ReceivePipeline, PipelineStats
+from .metrics import node_metrics
+
+# Format yang sudah terkompresi: isi folder dikirim apa adanya (store), bukan deflate
+PRECOMPRESSED_EXTENSIONS = {
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'heic', 'avif',
+    'mp4', 'mov', 'mkv', 'avi', 'webm', 'mp3', 'aac', 'm4a', 'ogg', 'flac',
+    'zip', 'gz', 'tgz', 'bz2', 'xz', '7z', 'rar', 'zst', 'apk', 'jar', 'docx', 'xlsx', 'pptx'
+}
+
+# Tipe frame di dalam folder stream: header entry, data, akhir entry (checksum)
+ENTRY_HEADER = b'H'
+ENTRY_DATA = b'D'
+ENTRY_END = b'E'
 
 class TransferManager:
-    def __init__(self, save_dir, events, security_manager=None):
+    PREFIX_CACHE_SIZE = 64  # State hash prefix (resume) yang disimpan antar percobaan
+
+    def __init__(self, save_dir, events, security_manager=None, checksum_cache=None, durability=DURABILITY,
+                 content_index=None, metrics=None):
         self.save_dir = save_dir
+        self.durability = durability  # "none" | "fsync" | "periodic" (lihat storage.py)
         self.events = events
         self.security = security_manager # Referensi ke SecurityManager
+        self.checksum_cache = checksum_cache if checksum_cache is not None else ChecksumCache()
+        if content_index is None:
+            # Satu index per folder tujuan
+            key = hashlib.sha1(os.path.abspath(save_dir).encode()).hexdigest()[:16]
+            content_index = ContentIndex(os.path.join(CONTENT_INDEX_DIR, f"{key}.json"))
+        self.content_index = content_index
+        self._local = threading.local()  # Buffer terima per-thread (dipakai ulang)
+        self._range_sessions = {}  # transfer_id -> state transfer paralel
+        self._range_lock = threading.Lock()
+        # Koneksi -> (part_path, keputusan negotiate()): resume / delta / dedup.
+        # Per koneksi supaya transfer nama sama tidak saling menimpa, dan state
+        # yang tidak terpakai (OK gagal terkirim) hilang bersama koneksinya.
+        self._negotiated = weakref.WeakKeyDictionary()
+        self._negotiated_lock = threading.Lock()
+        # path -> (size, mtime_ns, offset, hasher): hash prefix dari percobaan
+        # sebelumnya, supaya resume berulang tidak meng-hash ulang dari awal
+        self._prefix_cache = {}
+        self._prefix_lock = threading.Lock()
+        self._pool = None  # Worker transform pipeline pengirim (dibuat saat pertama dipakai)
+        self._decode_pool = None  # Worker decode pipeline penerima
+        self._pool_lock = threading.Lock()
+        self.receive_stats = PipelineStats()  # Queue depth & stall per tahap (lihat pipeline.py)
+        self.metrics = metrics if metrics is not None else node_metrics()
+
+    def _get_buffer(self, size):
+        """Ambil memoryview buffer terima milik thread ini, diperbesar jika perlu"""
+        buf = getattr(self._local, 'buffer', None)
+        if buf is None or len(buf) < size:
+            buf = memoryview(bytearray(max(size, CHUNK_SIZE)))
+            self._local.buffer = buf
+        return buf[:size]
+
+    def _checksum_failed(self, detail=None):
+        self.metrics.inc("bproto_checksum_failures_total")
+        self.events.error(f"Integrity Check: FAILED ({detail})" if detail else "Integrity Check: FAILED")
 
     def calculate_checksum(self, filepath):
         sha256_hash = hashlib.sha256()
         with open(filepath, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
+            self._hash_range(f, sha256_hash, os.fstat(f.fileno()).st_size)
         return sha256_hash.hexdigest()
 
+    def _hash_range(self, f, hasher, end):
+        """Update hasher dengan isi file dari posisi sekarang sampai offset end"""
+        left = end - f.tell()
+        while left > 0:
+            block = f.read(min(CHUNK_SIZE, left))
+            if not block: break
+            hasher.update(block)
+            left -= len(block)
+
+    def _prefix_hash(self, path, offset):
+        """Hasher SHA-256 berisi [0, offset) file. State dari percobaan
+        sebelumnya dipakai ulang selama file tidak berubah sejak itu, jadi
+        hanya sisa setelahnya yang dibaca. None jika file lebih pendek."""
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        with self._prefix_lock:
+            cached = self._prefix_cache.get(key)
+        start, hasher = 0, hashlib.sha256()
+        if cached and cached[:2] == (st.st_size, st.st_mtime_ns) and cached[2] <= offset:
+            start, hasher = cached[2], cached[3].copy()
+        with open(path, 'rb') as f:
+            f.seek(start)
+            self._hash_range(f, hasher, offset)
+            if f.tell() != offset:
+                return None
+        self._keep_prefix(key, st, offset, hasher)
+        return hasher
+
+    def _keep_prefix(self, path, st, offset, hasher):
+        """Simpan salinan hasher [0, offset) untuk file dengan stat st"""
+        with self._prefix_lock:
+            self._prefix_cache.pop(path, None)
+            self._prefix_cache[path] = (st.st_size, st.st_mtime_ns, offset, hasher.copy())
+            while len(self._prefix_cache) > self.PREFIX_CACHE_SIZE:
+                self._prefix_cache.pop(next(iter(self._prefix_cache)))
+
+    def _drop_prefix(self, path):
+        with self._prefix_lock:
+            self._prefix_cache.pop(os.path.abspath(path), None)
+
+    def make_codec(self, meta=None):
+        """FrameCodec untuk satu transfer. meta=None -> default config pengirim"""
+        if meta is None:
+            meta = {"compression": COMPRESSION_MODE, "encrypted": ENABLE_ENCRYPTION}
+        mode = meta.get('compression') or (MODE_ZLIB if meta.get('compressed') else MODE_OFF)
+        return FrameCodec(mode, self.security, bool(meta.get('encrypted')))
+
+    def _send_chunk(self, sock, chunk, flag=0, codec=None, tuning=None, throttle=None):
+        # Kirim panjang chunk dulu (agar penerima tahu seberapa banyak baca)
+        # Format: [4 byte length | flag][data]
+        # throttle: Flow dari Shaper (limit bandwidth), payload dikirim per potongan
+        start = time.perf_counter()
+        sock.sendall((len(chunk) | flag).to_bytes(4, byteorder='big'))
+        if throttle: throttle.sendall(sock, chunk)
+        else: sock.sendall(chunk)
+        elapsed = time.perf_counter() - start
+        if codec: codec.record_send(len(chunk) + 4, elapsed)
+        if tuning: tuning.observe(len(chunk) + 4, elapsed)
+
+    def _send_frame(self, sock, payload, codec, throttle=None):
+        """Kompres/enkripsi payload sesuai codec transfer lalu kirim sebagai frame"""
+        data, flag = codec.encode(payload)
+        self._send_chunk(sock, data, flag, codec, throttle=throttle)
+        return len(data)
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="bproto-encode")
+            return self._pool
+
+    def _get_decode_pool(self):
+        with self._pool_lock:
+            if self._decode_pool is None and RECV_DECODE_WORKERS > 1:
+                self._decode_pool = ThreadPoolExecutor(max_workers=RECV_DECODE_WORKERS,
+                                                       thread_name_prefix="bproto-decode")
+            return self._decode_pool
+
+    def _iter_encoded(self, f, limit, codec, hasher=None, tuning=None):
+        """Baca file dari posisi sekarang (maks limit byte, None = sampai EOF) dan
+        yield (ukuran asli, payload, flag) sesuai urutan file.
+
+        Jika codec mengubah data, tahapannya di-pipeline: thread reader membaca &
+        meng-hash, worker pool menjalankan zlib/AES-GCM (keduanya melepas GIL),
+        dan pemanggil (sender) mengirim frame berurutan. Queue dibatasi
+        PIPELINE_DEPTH agar reader berhenti saat jaringan lambat.
+        tuning: TuningSession - ukuran chunk & kedalaman queue ikut profile peer
+        (ukuran chunk bisa berubah di tengah transfer selama auto-tune)."""
+        def read_chunks():
+            left = limit
+            while left is None or left > 0:
+                size = tuning.chunk_size if tuning else CHUNK_SIZE
+                chunk = f.read(size if left is None else min(size, left))
+                if not chunk: return
+                if hasher: hasher.update(chunk)
+                if left is not None: left -= len(chunk)
+                yield chunk
+
+        if codec.is_identity or PIPELINE_WORKERS <= 1:
+            for chunk in read_chunks():
+                yield (len(chunk),) + codec.encode(chunk)
+            return
+
+        pool = self._get_pool()
+        pending = queue.Queue(maxsize=tuning.queue_depth if tuning else PIPELINE_DEPTH)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=0.2)
+                    return
+                except queue.Full:
+                    continue
+
+        def reader():
+            try:
+                for chunk in read_chunks():
+                    if stop.is_set(): return
+                    # Keputusan adaptive diambil di sini sesuai urutan file, worker hanya mengompres
+                    put((len(chunk), pool.submit(codec.encode, chunk, codec.plan(chunk))))
+                put(None)
+            except Exception as e:
+                put(e)
+
+        t = threading.Thread(target=reader, daemon=True)
+        t.start()
+        try:
+            while True:
+                item = pending.get()
+                if item is None: break
+                if isinstance(item, Exception): raise item
+                raw_len, future = item
+                yield (raw_len,) + future.result()
+        finally:
+            stop.set()
+            t.join()
+
+    def _send_trailer(self, sock, digest):
+        """Trailer setelah terminator: [4 byte length][JSON checksum]"""
+        send_json(sock, {"checksum": digest})
+
+    def _part_path(self, name, tag=None):
+        # File parsial disembunyikan (prefix titik) agar tidak dianggap file jadi.
+        # tag: penerima yang tidak ikut resume TCP (mux) memakai nama sendiri
+        if tag:
+            return os.path.join(self.save_dir, f".{name}.{tag}.part")
+        return os.path.join(self.save_dir, f".{name}.part")
+
     def prepare_file(self, filepath):
-        is_zip = False
-        final_path = filepath
-        
         if os.path.isdir(filepath):
-            final_path = f"{filepath}.zip"
-            self._zip_folder(filepath, final_path)
-            is_zip = True
-            
+            return self._prepare_directory(filepath)
+
+        final_path = filepath
         if not os.path.exists(final_path):
             raise FileNotFoundError("File not found")
             
         filesize = os.path.getsize(final_path)
         filename = os.path.basename(final_path)
         
+        # Checksum dihitung sambil streaming (dikirim di trailer),
+        # kecuali sudah ada di cache untuk file yang sama persis
         checksum = None
-        if VERIFY_INTEGRITY:
-            self.events.log(f"Calculating checksum for {filename}...")
+        if VERIFY_INTEGRITY or ENABLE_DEDUP:
+            checksum = self.checksum_cache.get(final_path)
+        if ENABLE_DEDUP and checksum is None and filesize <= DEDUP_HASH_LIMIT:
+            # File kecil: hash di depan supaya bisa ditawarkan untuk dedup
+            st = os.stat(final_path)
             checksum = self.calculate_checksum(final_path)
+            if os.stat(final_path).st_mtime_ns == st.st_mtime_ns:
+                self.checksum_cache.put(final_path, checksum, st)
             
         return {
             "path": final_path,
             "name": filename,
             "size": filesize,
-            "is_zip": is_zip,
+            "kind": "file",
             "checksum": checksum,
-            "compressed": ENABLE_COMPRESSION,
-            "encrypted": ENABLE_ENCRYPTION
+            "trailer": VERIFY_INTEGRITY,
+            "resume": True,
+            "resume_deferred": True,  # Digest prefix penerima boleh menyusul setelah OK
+            "delta_stream": True,  # Signature delta boleh dikirim bertahap
+            "compression": COMPRESSION_MODE,
+            "compressed": COMPRESSION_MODE == MODE_ZLIB,  # Untuk penerima versi lama
+            "encrypted": ENABLE_ENCRYPTION,
+            "dedup": ENABLE_DEDUP and checksum is not None  # Tawarkan hash isi (have/want)
         }
 
-    def stream_file(self, sock, file_path, start_byte, total_size):
+    def prefix_hasher(self, file_path, offset):
+        """Sisi pengirim: hasher prefix [0, offset) file lokal (None jika file
+        lebih pendek), dibandingkan dengan digest file parsial penerima dan
+        diteruskan ke stream_file. Retry hanya meng-hash byte baru."""
+        return self._prefix_hash(file_path, offset)
+
+    def stream_file(self, sock, file_path, start_byte, total_size, checksum=None, prefix_hasher=None, codec=None,
+                    tuning=None, throttle=None):
+        """Kirim isi file sebagai chunk ber-framing, lalu terminator dan (jika
+        VERIFY_INTEGRITY) trailer checksum. Return checksum SHA-256 file.
+        prefix_hasher: hasher yang sudah memuat byte [0, start_byte) (dari prefix_hasher).
+        codec: FrameCodec hasil negosiasi (default: config pengirim).
+        tuning: TuningSession peer tujuan (default: CHUNK_SIZE tetap).
+        throttle: Flow dari Shaper jika bandwidth dibatasi."""
+        codec = codec or self.make_codec()
+        st = os.stat(file_path)
+        if checksum is None and VERIFY_INTEGRITY:
+            checksum = self.checksum_cache.get(file_path, st)
+
+        hasher = None
+        if VERIFY_INTEGRITY and not checksum:
+            hasher = prefix_hasher if (prefix_hasher and start_byte) else hashlib.sha256()
+
+        if ENABLE_ZERO_COPY and codec.is_identity:
+            # Fast path: tanpa transformasi, payload dikirim kernel langsung (sendfile).
+            # Checksum yang belum diketahui di-hash dari page cache per frame.
+            self._stream_file_zero_copy(sock, file_path, start_byte, total_size, tuning, throttle, hasher,
+                                        prefix_hasher)
+        else:
+            self._stream_file_encoded(sock, file_path, start_byte, total_size, codec, tuning, throttle, hasher,
+                                      prefix_hasher)
+
+        if hasher:
+            checksum = hasher.hexdigest()
+            # Simpan ke cache hanya jika file tidak berubah selama dikirim
+            if self.checksum_cache.get(file_path) is None and os.stat(file_path).st_mtime_ns == st.st_mtime_ns:
+                self.checksum_cache.put(file_path, checksum, st)
+        if VERIFY_INTEGRITY:
+            self._send_trailer(sock, checksum)
+        return checksum
+
+    def _stream_file_encoded(self, sock, file_path, start_byte, total_size, codec, tuning=None, throttle=None,
+                             hasher=None, prefix_hasher=None):
+        """Chunk dibaca, di-hash dan di-encode codec (pipeline jika codec mengubah data)"""
         with open(file_path, 'rb') as f:
+            if hasher and start_byte and hasher is not prefix_hasher:
+                # Resume: prefix tetap harus masuk hash file utuh
+                self._hash_range(f, hasher, start_byte)
             f.seek(start_byte)
             sent = start_byte
             start_time = time.time()
             filename = os.path.basename(file_path)
             
-            while True:
-                chunk = f.read(CHUNK_SIZE)
-                if not chunk: break
-                
-                # 1. Kompresi
-                if ENABLE_COMPRESSION:
-                    chunk = zlib.compress(chunk)
-                
-                # 2. Enkripsi (Jika ada security manager dan enabled)
-                if self.security and ENABLE_ENCRYPTION:
-                    chunk = self.security.encrypt_data(chunk)
-
-                # Kirim panjang chunk dulu (agar penerima tahu seberapa banyak baca)
-                # Format: [4 byte length][data]
-                sock.sendall(len(chunk).to_bytes(4, byteorder='big'))
-                sock.sendall(chunk)
-                
-                sent += len(chunk) # Hitung bytes raw yang dikirim (bukan asli)
-                
-                # Progress calc (estimasi kasar karena kompresi mengubah ukuran)
+            for raw_len, data, flag in self._iter_encoded(f, None, codec, hasher, tuning):
+                self._send_chunk(sock, data, flag, codec, tuning, throttle)
+                sent += raw_len # Ukuran asli (kompresi per chunk bisa beda-beda)
+
                 elapsed = time.time() - start_time
                 mbps = (sent - start_byte) / (1024*1024) / (elapsed if elapsed > 0 else 1)
                 self.events.progress(filename, min((sent/total_size)*100, 99), mbps)
@@ -84,69 +339,731 @@ class TransferManager:
         # Kirim terminator ukuran 0
         sock.sendall((0).to_bytes(4, byteorder='big'))
 
+    def _stream_file_zero_copy(self, sock, file_path, start_byte, total_size, tuning=None, throttle=None,
+                               hasher=None, prefix_hasher=None):
+        """Framing sama dengan stream_file ([4 byte length][data]), tapi data
+        dikirim via socket.sendfile sehingga tidak melewati buffer Python.
+        hasher: range yang baru terkirim dibaca ulang dari page cache (masih
+        panas) untuk di-hash; payload ke socket tetap zero-copy."""
+        with open(file_path, 'rb') as f:
+            if hasher and start_byte and hasher is not prefix_hasher:
+                self._hash_range(f, hasher, start_byte)
+            sent = start_byte
+            start_time = time.time()
+            filename = os.path.basename(file_path)
+
+            while sent < total_size:
+                count = min(tuning.chunk_size if tuning else CHUNK_SIZE, total_size - sent)
+                frame_start = time.perf_counter()
+                sock.sendall(count.to_bytes(4, byteorder='big'))
+                # socket.sendfile otomatis fallback ke send() jika os.sendfile tidak tersedia
+                if throttle:
+                    written = throttle.sendfile(sock, f, sent, count)
+                else:
+                    written = sock.sendfile(f, offset=sent, count=count)
+                if written != count:
+                    raise ConnectionError(f"sendfile stopped at {sent + written}/{total_size} bytes")
+                if tuning: tuning.observe(count + 4, time.perf_counter() - frame_start)
+                if hasher: self._hash_sent(f, hasher, sent, count)
+                sent += count
+
+                elapsed = time.time() - start_time
+                mbps = (sent - start_byte) / (1024*1024) / (elapsed if elapsed > 0 else 1)
+                self.events.progress(filename, min((sent/total_size)*100, 99), mbps)
+
+        sock.sendall((0).to_bytes(4, byteorder='big'))
+
+    def _hash_sent(self, f, hasher, offset, count):
+        """Hash [offset, offset+count) yang baru dikirim sendfile. sendfile
+        memindahkan posisi file, jadi posisi diset ulang dulu."""
+        f.seek(offset)
+        self._hash_range(f, hasher, offset + count)
+
+    def _iter_chunks(self, sock, meta):
+        """Baca frame [4 byte length][data] sampai terminator, yield data asli
+        (sudah didekripsi & didekompresi). Data berupa view ke buffer bersama,
+        jadi harus dipakai sebelum iterasi berikutnya."""
+        # Mode dari metadata (hasil negotiate, atau flag 'compressed' pengirim lama)
+        codec = self.make_codec(meta)
+
+        while True:
+            # Baca panjang chunk berikutnya (mode adaptive: bit atas = flag kompresi)
+            raw_len = int.from_bytes(recv_exact(sock, 4), byteorder='big')
+            if raw_len == 0: return # End of stream
+            chunk_len, flag = codec.split_length(raw_len)
+
+            # Baca chunk penuh langsung ke buffer (tanpa concat bytes)
+            chunk_data = self._get_buffer(chunk_len)
+            recv_into_exact(sock, chunk_data)
+
+            # Dekripsi lalu dekompresi (hanya frame yang memang dikompres)
+            yield codec.decode(chunk_data, flag)
+
+    def negotiate(self, conn, meta):
+        """Sisi penerima: putuskan mode transfer sebelum data mengalir.
+        Keputusan disimpan per koneksi untuk receive_stream berikutnya di conn.
+        - kompresi: terima mode yang ditawarkan pengirim (disimpan di meta)
+        - dedup: isi dengan hash yang sama sudah ada -> hard link, payload di-skip
+        - delta: versi lama file sudah ada -> signature-nya dikirim dari
+          receive_stream setelah OK (hash file lama tidak menahan OK)
+        - resume: tawarkan offset + digest prefix file parsial. Pengirim yang
+          mengirim 'resume_deferred' langsung dibalas offset-nya; digest
+          menyusul dari receive_stream setelah OK (hash file parsial besar
+          bisa lebih lama dari batas tunggu pengirim)"""
+        with self._negotiated_lock:
+            self._negotiated.pop(conn, None)  # Sisa transfer sebelumnya yang tidak sampai receive_stream
+        offered = meta.get('compression') or (MODE_ZLIB if meta.get('compressed') else MODE_OFF)
+        meta['compression'] = offered if offered in MODES else MODE_OFF
+        resp = {"resume_offset": 0, "compression": meta['compression']}
+
+        if 'range' in meta:
+            return resp
+        if meta.get('kind') == 'dir':
+            resp['dir_stream'] = True
+            return resp
+
+        part_path = self._part_path(meta['name'])
+        final_path = os.path.join(self.save_dir, meta['name'])
+        if DEDUP_HARDLINK and meta.get('dedup') and meta.get('checksum'):
+            source = self.content_index.lookup(meta['checksum'], meta['size'])
+            if source and self._materialize(source, final_path, meta['checksum']):
+                self._remember(conn, part_path, {'have': source})
+                resp['have'] = True
+                return resp
+
+        if meta.get('delta') and os.path.isfile(final_path) and os.path.getsize(final_path) > 0:
+            # Ada versi lama: pengirim cukup kirim bagian yang berubah
+            self._remember(conn, part_path, {'delta': final_path})
+            resp['delta'] = True
+            return resp
+
+        if not meta.get('resume') or not os.path.exists(part_path):
+            return resp
+        offset = os.path.getsize(part_path)
+        if offset == 0 or offset >= meta['size']:
+            return resp
+
+        if meta.get('resume_deferred'):
+            self._remember(conn, part_path, {'resume': (offset, None)})
+            resp.update({"resume_offset": offset, "resume_deferred": True})
+            return resp
+
+        # Pengirim lama: digest harus ada di OK
+        hasher = self._prefix_hash(part_path, offset)
+        if hasher is None:
+            return resp
+        # Hasher disimpan supaya receive_stream tidak perlu hash ulang prefix
+        self._remember(conn, part_path, {'resume': (offset, hasher)})
+        resp.update({"resume_offset": offset, "resume_digest": hasher.hexdigest()})
+        return resp
+
+    def _remember(self, conn, part_path, state):
+        with self._negotiated_lock:
+            self._negotiated[conn] = (part_path, state)
+
     def receive_stream(self, sock, meta):
         path = os.path.join(self.save_dir, meta['name'])
-        
-        # Deteksi fitur dari metadata pengirim
-        use_compression = meta.get('compressed', False)
-        use_encryption = meta.get('encrypted', False)
+        part_path = self._part_path(meta['name'])
+
+        with self._negotiated_lock:
+            entry = self._negotiated.pop(sock, None)
+        state = entry[1] if entry and entry[0] == part_path else {}
+        if 'delta' in state:
+            return self._receive_delta(sock, meta)
+        if 'have' in state:
+            # Sudah dibuat saat negotiate, pengirim tidak mengirim payload
+            self.events.log(f"File Received: {meta['name']} (dedup dari {os.path.basename(state['have'])})")
+            self.events.progress(meta['name'], 100, 0)
+            self.events.file_received(path, meta['size'])
+            meta['received_checksum'] = meta['checksum']
+            meta['received_size'] = meta['size']
+            return True
 
-        received_total = 0
+        # Hash dihitung sambil menulis, tidak perlu baca ulang file
+        hasher = hashlib.sha256() if VERIFY_INTEGRITY else None
+        offset = 0
+        offered = state.get('resume')
+        if offered:
+            prefix = offered[1]
+            if prefix is None:
+                # Digest menyusul OK; pengirim meng-hash prefix-nya bersamaan
+                try:
+                    prefix = self._prefix_hash(part_path, offered[0])
+                except OSError:
+                    prefix = None  # .part hilang sejak negotiate: kirim dari awal
+                send_json(sock, {"resume_digest": prefix.hexdigest() if prefix else None})
+            # Pengirim membalas offset yang dipakai (0 jika prefix tidak cocok)
+            decision = recv_json(sock).get('resume_offset', 0)
+            if decision and decision == offered[0] and prefix:
+                offset = decision
+                if hasher: hasher = prefix
+                self.events.log(f"Resume {meta['name']} dari byte {offset}")
+        # .part akan ditulis: state hash lamanya tidak berlaku lagi
+        self._drop_prefix(part_path)
+
+        received_total = offset
         total_expected = meta['size']
         start_time = time.time()
 
-        with open(path, 'wb') as f:
-            while True:
-                # Baca panjang chunk berikutnya
-                raw_len = sock.recv(4)
-                if not raw_len: break
-                chunk_len = int.from_bytes(raw_len, byteorder='big')
-                if chunk_len == 0: break # End of stream
-
-                # Baca chunk penuh
-                chunk_data = b""
-                while len(chunk_data) < chunk_len:
-                    packet = sock.recv(chunk_len - len(chunk_data))
-                    if not packet: break
-                    chunk_data += packet
-                
-                # 1. Dekripsi
-                if use_encryption and self.security:
-                    try:
-                        chunk_data = self.security.decrypt_data(chunk_data)
-                    except Exception as e:
-                        self.events.error("Decryption error during transfer")
-                        break
-
-                # 2. Dekompresi
-                if use_compression:
-                    try:
-                        chunk_data = zlib.decompress(chunk_data)
-                    except Exception:
-                        self.events.error("Decompression error")
-                        break
-                
-                f.write(chunk_data)
-                received_total += len(chunk_data) # Ukuran asli
-                
-                elapsed = time.time() - start_time
-                mbps = (received_total) / (1024*1024) / (elapsed if elapsed > 0 else 1)
-                self.events.progress(meta['name'], (received_total/total_expected)*100, mbps)
-        
+        out = StagedFile(part_path, path, total_expected, self.durability, offset)
+
+        def sink(chunk_data):
+            nonlocal received_total
+            if hasher: hasher.update(chunk_data)
+            received_total += len(chunk_data) # Ukuran asli
+
+            elapsed = time.time() - start_time
+            mbps = (received_total - offset) / (1024*1024) / (elapsed if elapsed > 0 else 1)
+            self.events.progress(meta['name'], (received_total/total_expected)*100, mbps)
+
+        try:
+            if RECV_PIPELINE:
+                # Decode & tulis disk di luar thread socket (lihat pipeline.py)
+                pipeline = ReceivePipeline(self.make_codec(meta), out.write, sink, self.receive_stats,
+                                           self._get_decode_pool())
+                pipeline.run(sock)
+            else:
+                for chunk_data in self._iter_chunks(sock, meta):
+                    out.write(chunk_data)
+                    sink(chunk_data)
+
+            # Pengirim baru mengirim checksum di trailer setelah terminator
+            expected = meta.get('checksum')
+            if meta.get('trailer'):
+                expected = recv_json(sock).get('checksum') or expected
+        except ValueError as e:
+            self.events.error(str(e))
+            out.abort()  # Data rusak, jangan dipakai untuk resume
+            meta['stream_broken'] = True  # Gagal di tengah stream: posisi socket tidak pasti
+            return False
+        except BaseException:
+            # Koneksi putus: .part dipotong ke byte yang sudah diterima untuk resume berikutnya
+            out.abort(keep=True)
+            if hasher and received_total == out.position and os.path.exists(part_path):
+                # Resume berikutnya memakai state hash ini, tidak membaca ulang .part
+                self._keep_prefix(os.path.abspath(part_path), os.stat(part_path), out.position, hasher)
+            raise
+
         self.events.log(f"File Received: {meta['name']}")
         
-        if VERIFY_INTEGRITY and 'checksum' in meta and meta['checksum']:
+        if hasher and expected:
             self.events.log("Verifying checksum...")
-            local_hash = self.calculate_checksum(path)
-            if local_hash == meta['checksum']:
+            if hasher.hexdigest() == expected:
                 self.events.log("Integrity Check: PASSED")
             else:
-                self.events.error("Integrity Check: FAILED")
+                self._checksum_failed()
+                out.abort()
+                return False
+
+        out.commit()
+        meta['received_checksum'] = hasher.hexdigest() if hasher else None
+        meta['received_size'] = received_total
+        self._file_received(path, received_total, meta['received_checksum'])
+        return True
+
+    def receive_bytes(self, meta, data):
+        """File utuh dalam satu buffer (WebSocket): verifikasi, staging lalu
+        rename atomik seperti receive_stream. Blocking (hash + disk)."""
+        path = os.path.join(self.save_dir, meta['name'])
+        digest = hashlib.sha256(data).hexdigest() if VERIFY_INTEGRITY else None
+        if digest and meta.get('checksum') and digest != meta['checksum']:
+            self._checksum_failed()
+            return False
+
+        out = StagedFile(self._part_path(meta['name']), path, len(data), self.durability)
+        try:
+            out.write(data)
+        except BaseException:
+            out.abort()
+            raise
+        out.commit()
+        self._file_received(path, len(data), digest)
+        return True
+
+    def _file_received(self, path, size, digest=None):
+        """File sudah di nama akhirnya: catat di content index lalu emit event.
+        digest hanya diisi jika isinya sudah diverifikasi saat diterima."""
+        if digest:
+            self.content_index.add(path, digest)
+        self.events.file_received(path, size)
+
+    def _materialize(self, source, final_path, digest):
+        """Buat final_path berisi sama dengan source lewat hard link + rename.
+        Dipanggil sebelum OK terkirim, jadi tidak pernah meng-copy isi file
+        (copy file besar melewati timeout pengirim). Return False jika link
+        tidak bisa dibuat (beda filesystem / tidak didukung) -> terima penuh."""
+        if os.path.abspath(source) == os.path.abspath(final_path):
+            return True
+        staging_path = os.path.join(self.save_dir, f".{os.path.basename(final_path)}.link")
+        try:
+            if os.path.lexists(staging_path): os.remove(staging_path)
+            os.link(source, staging_path)
+            commit(staging_path, final_path, self.durability)
+        except OSError as e:
+            self.events.log(f"Dedup dilewati ({e}), terima penuh")
+            return False
+        self.content_index.add(final_path, digest)
+        return True
+
+    # --- DELTA TRANSFER (RSYNC-STYLE) ---
+
+    def stream_delta(self, sock, file_meta, throttle=None):
+        """Terima signature file lama dari penerima, lalu kirim hanya literal
+        dan referensi blok. Framing & trailer sama dengan stream_file."""
+        info = recv_json(sock)
+        if info.get('streamed'):
+            # Potongan signature [4 byte length][entry...] sampai terminator 0
+            parts = []
+            while True:
+                length = int.from_bytes(recv_exact(sock, 4), byteorder='big')
+                if length == 0: break
+                if length > SIGNATURE_SPAN:
+                    raise ValueError(f"Signature frame too large: {length} bytes")
+                parts.append(recv_exact(sock, length))
+            sig_data = b"".join(parts)
+        else:
+            sig_len = int.from_bytes(recv_exact(sock, 4), byteorder='big')
+            sig_data = recv_exact(sock, sig_len)
+        sig = DeltaSignature.from_bytes(sig_data, info['block_size'], info['base_size'])
+
+        codec = self.make_codec(file_meta)
+        file_path = file_meta['path']
+        checksum = file_meta.get('checksum')
+        hasher = hashlib.sha256() if VERIFY_INTEGRITY and not checksum else None
+        filename = os.path.basename(file_path)
+        total_size = file_meta['size']
+        pos = literal = 0
+        start_time = time.time()
+
+        with open(file_path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if total_size else b""
+            view = memoryview(data)
+            ops = iter_delta(data, sig, CHUNK_SIZE)
+            op = None
+            try:
+                for op in ops:
+                    if op[0] == OP_COPY:
+                        span = sig.block_span(op[1], op[2])[1]
+                    else:
+                        span = len(op[1])
+                        literal += span
+                    if hasher: hasher.update(view[pos:pos + span])
+                    pos += span
+                    self._send_frame(sock, encode_op(op), codec, throttle)
+
+                    elapsed = time.time() - start_time
+                    mbps = pos / (1024*1024) / (elapsed if elapsed > 0 else 1)
+                    self.events.progress(filename, min((pos/total_size)*100, 99), mbps)
+            finally:
+                # Semua view ke mmap harus dilepas sebelum mmap bisa ditutup
+                del op
+                ops.close()
+                view.release()
+                if total_size: data.close()
+
+        sock.sendall((0).to_bytes(4, byteorder='big'))
+        if hasher:
+            checksum = hasher.hexdigest()
+        if VERIFY_INTEGRITY:
+            self._send_trailer(sock, checksum)
+        self.events.log(f"Delta {filename}: {literal} dari {total_size} bytes dikirim sebagai literal")
+        return checksum
+
+    def _receive_delta(self, sock, meta):
+        """Kirim signature file lama, lalu bangun ulang file dari file lama +
+        delta ke file staging di sebelahnya dan tukar secara atomik.
+        Pengirim baru menerima signature bertahap selagi di-hash, pengirim
+        lama dalam satu chunk."""
+        path = os.path.join(self.save_dir, meta['name'])
+        staging_path = os.path.join(self.save_dir, f".{meta['name']}.delta")
+        base_size = os.path.getsize(path)
+        block_size = block_size_for(base_size)
+        streamed = bool(meta.get('delta_stream'))
+        send_json(sock, {"block_size": block_size, "base_size": base_size, "streamed": streamed})
+        parts = []
+        for part in iter_signature(path, block_size):
+            if streamed: self._send_chunk(sock, part)
+            else: parts.append(part)
+        if streamed:
+            sock.sendall((0).to_bytes(4, byteorder='big'))
+        else:
+            self._send_chunk(sock, b"".join(parts))
+        sig = DeltaSignature(block_size, base_size, ())  # Di sisi ini cukup untuk block_span
+
+        hasher = hashlib.sha256() if VERIFY_INTEGRITY else None
+        written = 0
+        total_expected = meta['size']
+        start_time = time.time()
+
+        out = StagedFile(staging_path, path, total_expected, self.durability)
+        try:
+            with open(path, 'rb') as base:
+                for frame in self._iter_chunks(sock, meta):
+                    op = decode_op(frame)
+                    if op[0] == OP_COPY:
+                        offset, length = sig.block_span(op[1], op[2])
+                        base.seek(offset)
+                        while length > 0:
+                            block = base.read(min(CHUNK_SIZE, length))
+                            if not block: raise ValueError("Delta references missing base data")
+                            out.write(block)
+                            if hasher: hasher.update(block)
+                            written += len(block)
+                            length -= len(block)
+                    else:
+                        out.write(op[1])
+                        if hasher: hasher.update(op[1])
+                        written += len(op[1])
+
+                    elapsed = time.time() - start_time
+                    mbps = written / (1024*1024) / (elapsed if elapsed > 0 else 1)
+                    self.events.progress(meta['name'], min((written/total_expected)*100, 99), mbps)
+
+            expected = meta.get('checksum')
+            if meta.get('trailer'):
+                expected = recv_json(sock).get('checksum') or expected
+        except ValueError as e:
+            self.events.error(str(e))
+            out.abort()
+            return False
+        except BaseException:
+            out.abort()
+            raise
+
+        self.events.log(f"File Received: {meta['name']} (delta)")
+        if hasher and expected:
+            if hasher.hexdigest() != expected:
+                self._checksum_failed()
+                out.abort()
+                return False
+            self.events.log("Integrity Check: PASSED")
+
+        out.commit()
+        self.events.progress(meta['name'], 100, 0)
+        meta['received_checksum'] = hasher.hexdigest() if hasher else None
+        meta['received_size'] = written
+        self._file_received(path, written, meta['received_checksum'])
+        return True
+
+    # --- TRANSFER PARALEL (BYTE RANGE) ---
+
+    def stream_range(self, sock, file_path, offset, length, on_progress=None, codec=None, tuning=None,
+                     throttle=None):
+        """Kirim byte range [offset, offset+length) sebagai chunk ber-framing.
+        Trailer berisi checksum range ini (bukan file utuh)."""
+        codec = codec or self.make_codec()
+        hasher = hashlib.sha256() if VERIFY_INTEGRITY else None
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            sent = 0
+            for raw_len, data, flag in self._iter_encoded(f, length, codec, hasher, tuning):
+                self._send_chunk(sock, data, flag, codec, tuning, throttle)
+                sent += raw_len
+                if on_progress: on_progress(raw_len)
+            if sent < length:
+                raise IOError(f"File shrank while sending range at {offset + sent}")
+
+        sock.sendall((0).to_bytes(4, byteorder='big'))
+        if hasher:
+            self._send_trailer(sock, hasher.hexdigest())
+
+    def _open_range_session(self, meta):
+        rng = meta['range']
+        now = time.time()
+        with self._range_lock:
+            # Buang sesi yang ditinggal pengirim (koneksi putus sebelum semua range tiba)
+            for tid, sess in list(self._range_sessions.items()):
+                if now - sess['updated'] > RANGE_SESSION_TIMEOUT:
+                    self._close_range_session(tid, keep=False)
 
-    def _zip_folder(self, path, zip_name):
+            sess = self._range_sessions.get(rng['id'])
+            if sess is None:
+                final_path = os.path.join(self.save_dir, meta['name'])
+                part_path = os.path.join(self.save_dir, f".{meta['name']}.{rng['id'][:8]}.part")
+                fd = os.open(part_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0))
+                try:
+                    # Alokasi ukuran akhir sekali di depan (blok disk, bukan sparse)
+                    preallocate(fd, 0, meta['size'])
+                    os.ftruncate(fd, meta['size'])
+                except OSError:
+                    os.close(fd)
+                    os.remove(part_path)
+                    raise
+                sess = {
+                    'fd': fd, 'path': final_path, 'part': part_path,
+                    'count': rng['count'], 'done': {}, 'received': 0, 'unsynced': 0,
+                    'size': meta['size'], 'started': now, 'updated': now,
+                    'lock': threading.Lock()
+                }
+                self._range_sessions[rng['id']] = sess
+            return sess
+
+    def _close_range_session(self, transfer_id, keep):
+        # Dipanggil dengan _range_lock sudah dipegang
+        sess = self._range_sessions.pop(transfer_id)
+        try:
+            if keep and self.durability != DURABILITY_NONE:
+                sync_fd(sess['fd'])
+        finally:
+            os.close(sess['fd'])
+        if keep:
+            commit(sess['part'], sess['path'], self.durability)
+        elif os.path.exists(sess['part']):
+            os.remove(sess['part'])
+
+    def _pwrite(self, sess, data, offset):
+        if hasattr(os, 'pwrite'):
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(sess['fd'], view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            # Windows: tidak ada pwrite, seek + write harus atomik per range
+            with sess['lock']:
+                os.lseek(sess['fd'], offset, os.SEEK_SET)
+                os.write(sess['fd'], data)
+
+    def receive_range(self, sock, meta):
+        """Terima satu range dan tulis di offset-nya (pwrite) ke file bersama.
+        File baru dipindah ke nama akhir setelah SEMUA range lolos verifikasi."""
+        rng = meta['range']
+        sess = self._open_range_session(meta)
+        hasher = hashlib.sha256() if VERIFY_INTEGRITY else None
+        pos = rng['offset']
+        end = pos + rng['length']
+
+        try:
+            for chunk_data in self._iter_chunks(sock, meta):
+                if pos + len(chunk_data) > end:
+                    raise ValueError("Range overflow")
+                self._pwrite(sess, chunk_data, pos)
+                if hasher: hasher.update(chunk_data)
+                pos += len(chunk_data)
+
+                with sess['lock']:
+                    sess['received'] += len(chunk_data)
+                    sess['updated'] = time.time()
+                    received = sess['received']
+                    sess['unsynced'] += len(chunk_data)
+                    flush = self.durability == DURABILITY_PERIODIC and sess['unsynced'] >= FSYNC_INTERVAL
+                    if flush: sess['unsynced'] = 0
+                if flush: sync_fd(sess['fd'])
+                elapsed = time.time() - sess['started']
+                mbps = received / (1024*1024) / (elapsed if elapsed > 0 else 1)
+                self.events.progress(meta['name'], min((received/sess['size'])*100, 99), mbps)
+
+            expected = recv_json(sock).get('checksum') if meta.get('trailer') else None
+            ok = pos == end and not (hasher and expected and hasher.hexdigest() != expected)
+            meta['received_size'] = pos - rng['offset']
+            if not ok:
+                self._checksum_failed(f"range {rng['index']}")
+        except Exception as e:
+            self.events.error(f"Range {rng['index']} error: {e}")
+            ok = False
+
+        with self._range_lock:
+            if rng['id'] not in self._range_sessions: return False
+            sess['done'][rng['index']] = ok
+            if len(sess['done']) < sess['count']:
+                return ok
+
+            all_ok = all(sess['done'].values())
+            self._close_range_session(rng['id'], keep=all_ok)
+
+        if all_ok:
+            self.events.progress(meta['name'], 100, 0)
+            self.events.log(f"File Received: {meta['name']} ({sess['count']} streams)")
+            if hasher: self.events.log("Integrity Check: PASSED")
+            self._file_received(sess['path'], sess['size'])
+        else:
+            self.events.error(f"Parallel transfer failed: {meta['name']}")
+        return ok
+
+
+    # --- FOLDER STREAMING (TANPA ZIP SEMENTARA) ---
+
+    def _prepare_directory(self, dirpath):
+        root = os.path.normpath(os.path.abspath(dirpath))
+        total = count = 0
+        for dirpath_, _, files in os.walk(root):
+            for name in files:
+                total += os.path.getsize(os.path.join(dirpath_, name))
+                count += 1
+        return {
+            "path": root,
+            "name": os.path.basename(root),
+            "size": total,
+            "kind": "dir",
+            "entries": count,
+            "checksum": None,
+            "trailer": VERIFY_INTEGRITY,
+            "compression": COMPRESSION_MODE,
+            "compressed": COMPRESSION_MODE == MODE_ZLIB,
+            "encrypted": ENABLE_ENCRYPTION
+        }
+
+    def stream_directory(self, sock, meta, throttle=None):
+        """Kirim isi folder sebagai rangkaian entry (header, data, checksum)
+        langsung ke socket. Tidak ada file zip sementara di disk."""
+        codec = self.make_codec(meta)
+        root = meta['path']
+        total_size = meta['size'] or 1
+        # Jika kompresi per chunk aktif, jangan deflate dua kali
+        allow_deflate = codec.mode == MODE_OFF
+        sent = count = 0
+        start_time = time.time()
+
+        for dirpath, dirnames, files in os.walk(root):
+            dirnames.sort()
+            rel_dir = os.path.relpath(dirpath, root)
+            if rel_dir != '.' and not files and not dirnames:
+                header = {"path": rel_dir.replace(os.sep, '/'), "type": "dir"}
+                self._send_frame(sock, ENTRY_HEADER + json.dumps(header).encode(), codec, throttle)
+                continue
+
+            for name in sorted(files):
+                full_path = os.path.join(dirpath, name)
+                st = os.stat(full_path)
+                ext = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+                entry_codec = "deflate" if allow_deflate and ext not in PRECOMPRESSED_EXTENSIONS else "store"
+                header = {
+                    "path": os.path.relpath(full_path, root).replace(os.sep, '/'),
+                    "type": "file", "size": st.st_size, "mtime_ns": st.st_mtime_ns, "codec": entry_codec
+                }
+                self._send_frame(sock, ENTRY_HEADER + json.dumps(header).encode(), codec, throttle)
+
+                hasher = hashlib.sha256() if VERIFY_INTEGRITY else None
+                deflater = zlib.compressobj(6) if entry_codec == "deflate" else None
+                with open(full_path, 'rb') as f:
+                    while True:
+                        chunk = f.read(CHUNK_SIZE)
+                        if not chunk: break
+                        if hasher: hasher.update(chunk)
+                        data = deflater.compress(chunk) if deflater else chunk
+                        if data:
+                            self._send_frame(sock, ENTRY_DATA + data, codec, throttle)
+                        sent += len(chunk)
+
+                        elapsed = time.time() - start_time
+                        mbps = sent / (1024*1024) / (elapsed if elapsed > 0 else 1)
+                        self.events.progress(meta['name'], min((sent/total_size)*100, 99), mbps)
+                if deflater:
+                    data = deflater.flush()
+                    if data:
+                        self._send_frame(sock, ENTRY_DATA + data, codec, throttle)
+
+                end = {"checksum": hasher.hexdigest() if hasher else None}
+                self._send_frame(sock, ENTRY_END + json.dumps(end).encode(), codec, throttle)
+                count += 1
+
+        sock.sendall((0).to_bytes(4, byteorder='big'))
+        if VERIFY_INTEGRITY:
+            send_json(sock, {"checksum": None, "entries": count})
+        return count
+
+    def zip_folder(self, path, zip_path):
+        """Zip folder untuk penerima lama yang belum mengenal folder stream.
+        Nama entry diawali nama folder, sama dengan protokol lama."""
         self.events.log("Zipping folder...")
-        with zipfile.ZipFile(zip_name, 'w', zipfile.ZIP_DEFLATED) as z:
-            for root, _, files in os.walk(path):
-                for file in files:
-                    z.write(os.path.join(root, file), 
-                            os.path.relpath(os.path.join(root, file), os.path.dirname(path)))
\ No newline at end of file
+        parent = os.path.dirname(path)
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as z:
+            for dirpath, _, files in os.walk(path):
+                for name in files:
+                    full_path = os.path.join(dirpath, name)
+                    ext = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+                    method = zipfile.ZIP_STORED if ext in PRECOMPRESSED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                    z.write(full_path, os.path.relpath(full_path, parent), method)
+
+    def _safe_join(self, root, rel_path):
+        """Gabungkan path relatif dari pengirim, tolak path keluar dari root"""
+        target = os.path.normpath(os.path.join(root, *rel_path.split('/')))
+        if os.path.isabs(rel_path) or os.path.commonpath([root, target]) != root:
+            raise ValueError(f"Unsafe path in folder stream: {rel_path}")
+        return target
+
+    def receive_directory(self, sock, meta):
+        """Bongkar folder stream sambil diterima. Tiap file ditulis ke .part
+        lalu di-rename setelah checksum entry-nya cocok."""
+        root = os.path.join(self.save_dir, os.path.basename(meta['name']))
+        os.makedirs(root, exist_ok=True)
+        total_expected = meta['size'] or 1
+        received = files = 0
+        failed = []
+        start_time = time.time()
+        entry = None
+
+        try:
+            for frame in self._iter_chunks(sock, meta):
+                kind = bytes(frame[:1])
+                if kind == ENTRY_HEADER:
+                    info = json.loads(bytes(frame[1:]))
+                    target = self._safe_join(root, info['path'])
+                    if info.get('type') == 'dir':
+                        os.makedirs(target, exist_ok=True)
+                        continue
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    part_path = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.part")
+                    entry = {
+                        'info': info, 'target': target, 'part': part_path,
+                        'file': StagedFile(part_path, target, info.get('size', 0), self.durability),
+                        'hasher': hashlib.sha256() if VERIFY_INTEGRITY else None,
+                        'inflater': zlib.decompressobj() if info.get('codec') == "deflate" else None
+                    }
+
+                elif kind == ENTRY_DATA:
+                    if entry is None: raise ValueError("Folder stream: data before header")
+                    data = frame[1:]
+                    if entry['inflater']:
+                        data = entry['inflater'].decompress(data)
+                    entry['file'].write(data)
+                    if entry['hasher']: entry['hasher'].update(data)
+                    received += len(data)
+
+                    elapsed = time.time() - start_time
+                    mbps = received / (1024*1024) / (elapsed if elapsed > 0 else 1)
+                    self.events.progress(meta['name'], min((received/total_expected)*100, 99), mbps)
+
+                elif kind == ENTRY_END:
+                    if entry is None: raise ValueError("Folder stream: end before header")
+                    if entry['inflater']:
+                        data = entry['inflater'].flush()
+                        entry['file'].write(data)
+                        if entry['hasher']: entry['hasher'].update(data)
+
+                    expected = json.loads(bytes(frame[1:])).get('checksum')
+                    if entry['hasher'] and expected and entry['hasher'].hexdigest() != expected:
+                        self._checksum_failed(entry['info']['path'])
+                        entry['file'].abort()
+                        failed.append(entry['info']['path'])
+                    else:
+                        entry['file'].commit()
+                        mtime_ns = entry['info'].get('mtime_ns')
+                        if mtime_ns: os.utime(entry['target'], ns=(mtime_ns, mtime_ns))
+                        files += 1
+                        self._file_received(entry['target'], entry['file'].position,
+                                            entry['hasher'].hexdigest() if entry['hasher'] else None)
+                    entry = None
+                else:
+                    raise ValueError(f"Folder stream: unknown frame {kind!r}")
+        except (ValueError, zlib.error) as e:
+            self.events.error(str(e))
+            return False
+        finally:
+            if entry:
+                entry['file'].abort()
+
+        if meta.get('trailer'):
+            entries = recv_json(sock).get('entries')
+            if entries is not None and entries != files + len(failed):
+                self.events.error(f"Folder stream incomplete: {files + len(failed)}/{entries} entries")
+                return False
+
+        self.events.progress(meta['name'], 100, 0)
+        self.events.log(f"Folder Received: {meta['name']} ({files} files)")
+        meta['received_size'] = received
+        if failed:
+            return False
+        if VERIFY_INTEGRITY:
+            self.events.log("Integrity Check: PASSED")
+        return True
@@ -0,0 +1,184 @@
+# bproto/tuning.py
+# Profile transfer per instance/peer: ukuran chunk, buffer socket, TCP_NODELAY,
+# kedalaman queue pipeline. AutoTuner mengukur throughput & RTT di detik-detik
+# awal transfer lalu menyimpan profile hasilnya per peer.
+import time
+import socket
+import threading
+from .config import CHUNK_SIZE, PIPELINE_DEPTH, TUNE_WINDOW, TUNE_FRAME_TIME
+
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 16 * 1024 * 1024
+MIN_SOCK_BUF = 64 * 1024
+MAX_SOCK_BUF = 16 * 1024 * 1024
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+def _pow2(value):
+    """Bulatkan ke bawah ke pangkat 2 (ukuran chunk rapi untuk alokasi buffer)"""
+    return 1 << max(0, int(round(value)).bit_length() - 1)
+
+class TransferProfile:
+    def __init__(self, chunk_size=CHUNK_SIZE, sndbuf=None, rcvbuf=None, nodelay=True, queue_depth=PIPELINE_DEPTH):
+        self.chunk_size = min(chunk_size, MAX_CHUNK)  # Penerima menolak frame di atas RECV_MAX_FRAME
+        self.sndbuf = sndbuf    # None = biarkan autotuning kernel
+        self.rcvbuf = rcvbuf
+        self.nodelay = nodelay
+        self.queue_depth = queue_depth
+
+    def copy(self, **changes):
+        data = self.to_dict()
+        data.update(changes)
+        return TransferProfile(**data)
+
+    def to_dict(self):
+        return {
+            "chunk_size": self.chunk_size, "sndbuf": self.sndbuf, "rcvbuf": self.rcvbuf,
+            "nodelay": self.nodelay, "queue_depth": self.queue_depth
+        }
+
+    def apply(self, sock):
+        """Set opsi socket. Panggil sebelum connect agar window scaling ikut buffer."""
+        try:
+            if self.sndbuf: sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+            if self.rcvbuf: sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if self.nodelay else 0)
+        except OSError:
+            pass  # Opsi tidak didukung platform / socket bukan TCP
+
+    def __repr__(self):
+        return f"TransferProfile({self.to_dict()})"
+
+PROFILES = {
+    # Raspberry Pi booth: progress halus, memori kecil
+    "low_memory": TransferProfile(chunk_size=256 * 1024, sndbuf=256 * 1024, rcvbuf=256 * 1024, queue_depth=2),
+    "default": TransferProfile(),
+    # Server ke server (10 GbE): frame besar, buffer besar
+    "high_throughput": TransferProfile(chunk_size=16 * 1024 * 1024, sndbuf=8 * 1024 * 1024,
+                                       rcvbuf=8 * 1024 * 1024, queue_depth=8),
+}
+
+def resolve_profile(profile):
+    if profile is None:
+        return PROFILES["default"].copy()
+    if isinstance(profile, str):
+        return PROFILES[profile].copy()
+    if isinstance(profile, dict):
+        return TransferProfile(**profile)
+    return profile
+
+class TuningSession:
+    """Satu transfer ke satu peer. Selama TUNE_WINDOW detik pertama, ukuran chunk
+    diarahkan supaya satu frame butuh ~TUNE_FRAME_TIME di jaringan, dan buffer
+    kirim disesuaikan dengan bandwidth-delay product."""
+
+    ALPHA = 0.3
+
+    def __init__(self, tuner, peer, profile, rtt, enabled=True):
+        self.tuner = tuner
+        self.peer = peer
+        self.profile = profile.copy()
+        self.rtt = rtt
+        self.enabled = enabled
+        self.throughput = None
+        self.samples = 0
+        self.started = time.time()
+        self.sock = None
+        self.kernel_sndbuf = 0
+
+    @property
+    def chunk_size(self):
+        return self.profile.chunk_size
+
+    @property
+    def queue_depth(self):
+        return self.profile.queue_depth
+
+    def attach(self, sock):
+        self.sock = sock
+        try:
+            self.kernel_sndbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+        except OSError:
+            pass
+
+    def observe(self, nbytes, seconds):
+        """Dipanggil tiap frame terkirim (ukuran wire, durasi sendall)"""
+        if not self.enabled or seconds <= 0 or nbytes <= 0:
+            return
+        if time.time() - self.started > TUNE_WINDOW:
+            return
+        rate = nbytes / seconds
+        self.throughput = rate if self.throughput is None else self.throughput + self.ALPHA * (rate - self.throughput)
+        self.samples += 1
+
+        # Naik/turun maksimal 2x per frame supaya tidak berosilasi
+        target = _clamp(self.throughput * TUNE_FRAME_TIME, MIN_CHUNK, MAX_CHUNK)
+        current = self.profile.chunk_size
+        self.profile.chunk_size = _pow2(_clamp(target, current / 2, current * 2))
+
+        if self.rtt:
+            bdp = self.throughput * self.rtt
+            sndbuf = _pow2(_clamp(bdp * 2, MIN_SOCK_BUF, MAX_SOCK_BUF))
+            # Set SO_SNDBUF mematikan autotuning kernel, jadi hanya jika lebih besar
+            if sndbuf != self.profile.sndbuf and sndbuf > self.kernel_sndbuf:
+                self.profile.sndbuf = sndbuf
+                self.profile.rcvbuf = sndbuf
+                if self.sock:
+                    try:
+                        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+                    except OSError:
+                        pass
+
+    def finish(self):
+        """Simpan profile hasil tuning untuk koneksi berikutnya ke peer ini"""
+        if self.enabled and self.samples >= 3:
+            self.tuner.store(self.peer, self.profile, self.throughput)
+
+class AutoTuner:
+    def __init__(self, base_profile=None, enabled=True):
+        self.base = resolve_profile(base_profile)
+        self.enabled = enabled
+        self._peers = {}  # peer -> {'profile', 'throughput', 'rtt', 'manual'}
+        self._lock = threading.Lock()
+
+    def profile_for(self, peer):
+        with self._lock:
+            entry = self._peers.get(peer)
+            return (entry['profile'] if entry and entry.get('profile') else self.base).copy()
+
+    def set_profile(self, peer, profile):
+        """Profile manual untuk satu peer (tidak ditimpa auto-tune)"""
+        with self._lock:
+            entry = self._peers.setdefault(peer, {})
+            entry['profile'] = resolve_profile(profile)
+            entry['manual'] = True
+
+    def record_rtt(self, peer, rtt):
+        with self._lock:
+            entry = self._peers.setdefault(peer, {})
+            old = entry.get('rtt')
+            entry['rtt'] = rtt if old is None else old + 0.3 * (rtt - old)
+
+    def start(self, peer):
+        with self._lock:
+            entry = self._peers.get(peer, {})
+            manual = entry.get('manual', False)
+            rtt = entry.get('rtt')
+        return TuningSession(self, peer, self.profile_for(peer), rtt, enabled=self.enabled and not manual)
+
+    def store(self, peer, profile, throughput):
+        with self._lock:
+            entry = self._peers.setdefault(peer, {})
+            if entry.get('manual'): return
+            entry['profile'] = profile.copy()
+            entry['throughput'] = throughput
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                peer: {
+                    "profile": e['profile'].to_dict() if e.get('profile') else None,
+                    "throughput": e.get('throughput'), "rtt": e.get('rtt'), "manual": e.get('manual', False)
+                } for peer, e in self._peers.items()
+            }
@@ -1,7 +1,70 @@
 # bproto/utils.py
 import socket
+import struct
+import json
 import platform
 import subprocess
+from . import frame
+
+def recv_into_exact(sock, view):
+    """Isi memoryview sampai penuh. recv() boleh mengembalikan data parsial,
+    jadi ulangi recv_into sampai semua byte diterima."""
+    received = 0
+    total = len(view)
+    while received < total:
+        n = sock.recv_into(view[received:], total - received)
+        if n == 0:
+            raise ConnectionError(f"Connection closed ({received}/{total} bytes)")
+        received += n
+    return total
+
+def recv_exact(sock, n):
+    """Baca tepat n byte dari socket (raise ConnectionError jika putus)"""
+    buf = bytearray(n)
+    recv_into_exact(sock, memoryview(buf))
+    return bytes(buf)
+
+def send_json(sock, data):
+    """Kirim pesan kontrol: [4 byte length][JSON], atau frame biner jika
+    koneksi ini sudah memakai V3 (lihat frame.py)"""
+    sock.sendall(frame.encode_message(data, frame.wire_version(sock)))
+
+def recv_json(sock):
+    """Baca pesan kontrol V2 atau V3 (dideteksi dari byte pertama). Koneksi
+    yang mengirim V3 ditandai, jadi balasan kita juga V3."""
+    head = recv_exact(sock, 4)
+    if head[0] == frame.MAGIC:
+        frame_type, _, _, length = frame.parse_header(head + recv_exact(sock, frame.HEADER.size - 4))
+        frame.set_version(sock, frame.VERSION_V3)
+        return frame.decode_control(frame_type, recv_exact(sock, length))
+    length = struct.unpack("!I", head)[0]
+    return json.loads(recv_exact(sock, length).decode())
+
+def recv_json_wait(sock, timeout):
+    """recv_json dengan batas tunggu minimal timeout detik, untuk balasan yang
+    didahului kerja berat di peer (verifikasi, fsync, hash file besar)"""
+    previous = sock.gettimeout()
+    sock.settimeout(None if previous is None else max(previous, timeout))
+    try:
+        return recv_json(sock)
+    finally:
+        sock.settimeout(previous)
+
+def send_proof(sock, proof):
+    """Proof handshake. V2 mengirimnya mentah (tanpa length), V3 sebagai frame"""
+    if frame.wire_version(sock) >= frame.VERSION_V3:
+        sock.sendall(frame.encode_frame(frame.FRAME_PROOF, proof.encode()))
+    else:
+        sock.sendall(proof.encode())
+
+def recv_proof(sock):
+    if frame.wire_version(sock) >= frame.VERSION_V3:
+        frame_type, _, _, length = frame.parse_header(recv_exact(sock, frame.HEADER.size))
+        if frame_type != frame.FRAME_PROOF:
+            raise frame.FrameError(f"Diharapkan proof, diterima tipe frame {frame_type}")
+        return recv_exact(sock, length).decode(errors='replace')
+    # Klien V2: proof mentah, dibaca dengan satu recv
+    return sock.recv(1024).decode().strip()
 
 class SystemUtils:
     @staticmethod
@@ -27,4 +90,4 @@ class SystemUtils:
             subprocess.run(cmd.split(), input=text.encode('utf-8'), check=True)
             return True
         except: 
-            return False
\ No newline at end of file
+            return False
@@ -1,49 +1,74 @@
 # bproto/websocket.py
+# Front-end WebSocket di ServerEngine: berjalan di event loop yang sama dengan
+# server TCP, memakai handshake, session store (SecurityManager) dan
+# TransferManager yang sama. Tulis file & callback event lewat executor engine.
+import time
 import asyncio
 import websockets
 import json
-import threading
-import os
 from .protocol import PacketType
+from .engine import ServerEngine, authenticate
 
 class WebSocketManager:
-    def __init__(self, port, security, events, transfer):
+    def __init__(self, port, security, events, transfer, engine=None, metrics=None):
         self.port = port + 100
         self.security = security
         self.events = events
         self.transfer = transfer
-        self.loop = None
+        self.engine = engine or ServerEngine(events)
+        self.metrics = metrics if metrics is not None else transfer.metrics
 
     def start(self):
-        """Jalankan WS server di thread terpisah"""
-        t = threading.Thread(target=self._run_async_server, daemon=True)
-        t.start()
-
-    def _run_async_server(self):
-        # 1. Setup Loop Baru untuk Thread ini
-        self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
-
-        # 2. Definisikan Coroutine Utama
-        async def runner():
-            self.events.log(f"WebSocket Server running on port {self.port}")
-            # Gunakan Context Manager untuk menjaga server tetap hidup
-            # Catatan: Handler di websockets v11+ hanya menerima 1 argumen (websocket)
-            async with websockets.serve(self._handle_client, "0.0.0.0", self.port):
-                await asyncio.Future() # Run forever (tunggu selamanya)
+        """Daftarkan WS server sebagai front-end engine"""
+        self.engine.add(self)
+        self.engine.start()
 
-        # 3. Jalankan Loop
+    def stop(self):
+        self.engine.remove(self)
+
+    async def serve(self, engine):
         try:
-            self.loop.run_until_complete(runner())
+            # Catatan: Handler di websockets v11+ hanya menerima 1 argumen (websocket)
+            async with websockets.serve(self._handle_client, "0.0.0.0", self.port):
+                self.events.log(f"WebSocket Server running on port {self.port}")
+                await asyncio.Future() # Sampai di-cancel (stop)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             self.events.error(f"WebSocket Server Crash: {e}")
-        finally:
-            self.loop.close()
+
+    async def _auth(self, websocket, client_ip, data):
+        """AUTH: handshake yang sama dengan TCP (token sesi / CHALLENGE + proof).
+        Klien lama mengirim 'proof' langsung (proof dari nonce kosong)."""
+        if 'proof' in data:
+            if data['proof'] != self.security.create_proof(""):
+                return False, None
+            return True, self.security.create_session_for(client_ip)
+
+        async def ask_proof(nonce):
+            await websocket.send(json.dumps({"type": "CHALLENGE", "nonce": nonce}))
+            while True:
+                reply = await websocket.recv()
+                if isinstance(reply, str):
+                    try:
+                        return json.loads(reply).get('proof', "")
+                    except (json.JSONDecodeError, AttributeError):
+                        return ""
+
+        return await authenticate(self.security, client_ip, data.get('auth', {}), ask_proof, self.events)
+
+    async def _reject_unauthenticated(self, websocket):
+        self.metrics.inc("bproto_connections_rejected_total", transport="ws", reason="auth")
+        await websocket.send(json.dumps({"type": "AUTH_REQUIRED"}))
 
     async def _handle_client(self, websocket):
         # Websockets terbaru tidak lagi mengirim 'path' sebagai argumen kedua
         client_ip = websocket.remote_address[0]
         self.events.log(f"New WS Connection from {client_ip}")
+        self.metrics.inc("bproto_connections_accepted_total", transport="ws")
+        connected = time.perf_counter()
+        file_meta = None
+        authed = False  # Sama dengan TCP: tidak ada paket yang diproses sebelum auth berhasil
 
         try:
             async for message in websocket:
@@ -56,51 +81,58 @@ class WebSocketManager:
 
                     msg_type = data.get('type')
 
+                    if msg_type != 'AUTH' and not authed:
+                        await self._reject_unauthenticated(websocket)
+                        return
+
                     # AUTH HANDLER
                     if msg_type == 'AUTH':
-                        client_proof = data.get('proof')
-                        # Validasi Proof (SHA256 dari secret kosong atau logic lain)
-                        expected = self.security.create_proof("") 
-                        
-                        if client_proof == expected:
-                            token = self.security.create_session_for(client_ip)
+                        ok, token = await self._auth(websocket, client_ip, data)
+                        if ok:
+                            authed = True
+                            self.metrics.observe("bproto_handshake_seconds", time.perf_counter() - connected,
+                                                 transport="ws")
                             await websocket.send(json.dumps({"type": "AUTH_OK", "token": token}))
                         else:
+                            self.metrics.inc("bproto_connections_rejected_total", transport="ws", reason="auth")
                             await websocket.send(json.dumps({"type": "AUTH_FAIL"}))
                             return
 
-                    # CHAT / COMMANDS
+                    # CHAT / COMMANDS (listener bisa blocking: jalankan di executor)
                     elif msg_type == PacketType.MESSAGE:
-                        self.events.emit("message", client_ip, data.get('content'))
+                        await self.engine.run_blocking(self.events.emit, "message", client_ip, data.get('content'))
                         await websocket.send(json.dumps({"status": "RECEIVED"}))
-                    
+
                     elif msg_type == PacketType.CLIPBOARD:
-                        self.events.emit("clipboard", data.get('content'))
-                    
+                        await self.engine.run_blocking(self.events.emit, "clipboard", data.get('content'))
+
                     # PREPARE FILE TRANSFER
                     elif msg_type == PacketType.FILE_INIT:
-                         websocket.file_meta = data.get('file')
-                         await websocket.send(json.dumps({"status": "READY_FOR_STREAM"}))
+                        file_meta = data.get('file')
+                        await websocket.send(json.dumps({"status": "READY_FOR_STREAM"}))
 
                 elif isinstance(message, bytes):
                     # --- HANDLE BINARY (FILE) ---
-                    if hasattr(websocket, 'file_meta'):
-                        meta = websocket.file_meta
-                        save_path = os.path.join(self.transfer.save_dir, meta['name'])
-                        
-                        # Tulis langsung (Append binary)
-                        with open(save_path, "ab") as f:
-                            f.write(message)
-                        
+                    if not authed:
+                        await self._reject_unauthenticated(websocket)
+                        return
+                    if file_meta:
+                        meta, file_meta = file_meta, None
+                        # Staging + rename atomik lewat TransferManager (sama dengan TCP)
+                        started = time.perf_counter()
+                        saved = await self.engine.run_blocking(self.transfer.receive_bytes, meta, message)
+                        self.metrics.record_transfer("in", client_ip, len(message), time.perf_counter() - started,
+                                                     saved)
+                        if not saved:
+                            await websocket.send(json.dumps({"status": "FILE_FAILED"}))
+                            continue
+
                         # Simple progress update (langsung 100% karena WS streaming beda logic)
                         self.events.progress(meta['name'], 100, 0)
                         self.events.log(f"File received via WS: {meta['name']}")
-                        
-                        # Bersihkan meta setelah selesai
-                        del websocket.file_meta
                         await websocket.send(json.dumps({"status": "FILE_SAVED"}))
 
         except websockets.exceptions.ConnectionClosed:
             pass # Koneksi putus wajar
         except Exception as e:
-            self.events.error(f"WS Handler Error: {e}")
\ No newline at end of file
+            self.events.error(f"WS Handler Error: {e}")
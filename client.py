@@ -35,6 +35,18 @@ STATE["client"] = BProto(
 
 STATE["client"].start()
 
+def on_outbox(status, item):
+    # File temp baru dihapus setelah outbox berhasil mengirimnya
+    if status == "done":
+        add_log(f"✅ Terkirim (antrean): {item['name']}", "success")
+        if os.path.dirname(item['path']) == os.path.abspath(UPLOAD_FOLDER):
+            try: os.remove(item['path'])
+            except: pass
+    elif status == "failed":
+        add_log(f"❌ Gagal permanen: {item['name']} ({item['last_error']})", "error")
+
+STATE["client"].events.on("outbox", on_outbox)
+
 def add_log(msg, type="info"):
     t = time.strftime("%H:%M:%S")
     entry = {"time": t, "msg": msg, "type": type}
@@ -56,8 +68,11 @@ def send_sync(filepath, filename):
     # --- UBAH BAGIAN INI ---
     try:
         # Panggil fungsi internal bproto untuk melihat error aslinya
-        sukses = STATE["client"].send_file(target, filepath)
+        # Upload photobooth = interactive: didahulukan dari trafik bulk saat bandwidth dibatasi
+        sukses = STATE["client"].send_file(target, filepath, priority="interactive")
         
+        # True = penerima sudah mengonfirmasi (ack: checksum cocok, file sudah di
+        # nama akhirnya), baru aman menghapus foto temp
         if sukses:
             add_log(f"✅ Terkirim: {filename}", "success")
             try: os.remove(filepath)
@@ -66,13 +81,55 @@ def send_sync(filepath, filename):
         else:
             # Ini akan muncul jika bproto menangkap error tapi me-return False
             add_log(f"❌ Ditolak Server: {filename}", "error")
+            queue_retry(target, [(filepath, filename)])
             return False
             
     except Exception as e:
         # INI YANG PENTING: Menampilkan error spesifik (misal: TypeError)
         add_log(f"CRASH: {str(e)}", "error")
         print(f"DEBUG ERROR DETAIL: {e}") # Cek terminal
+        queue_retry(target, [(filepath, filename)])
         return False
+
+def queue_retry(target, items):
+    """Masukkan foto yang gagal ke outbox bproto (dicoba ulang di background,
+    tetap ada setelah restart). Return list filename yang tidak bisa diantrekan."""
+    lost = []
+    for save_path, filename in items:
+        try:
+            STATE["client"].queue_file(target, save_path, priority="interactive")
+            add_log(f"⏳ Antre kirim ulang: {filename}", "info")
+        except Exception as e:
+            add_log(f"❌ Gagal antre: {filename} ({e})", "error")
+            lost.append(filename)
+    return lost
+
+def send_batch(items):
+    """items: list (save_path, filename). Semua foto dikirim dalam satu sesi.
+    Return list filename yang gagal."""
+    target = STATE["target_ip"]
+    if not target:
+        add_log("Gagal: Server belum diset!", "error")
+        return [name for _, name in items]
+
+    add_log(f"Mengirim {len(items)} foto -> {target}...", "info")
+    failed = []
+    try:
+        results = STATE["client"].send_files(target, [path for path, _ in items], priority="interactive")
+    except Exception as e:
+        add_log(f"CRASH: {str(e)}", "error")
+        return [name for _, name in items]
+
+    for (save_path, filename), res in zip(items, results):
+        # ok hanya dari status penerima per file (setelah verifikasi & rename)
+        if res['ok']:
+            add_log(f"✅ Terkirim: {filename}", "success")
+            try: os.remove(save_path)
+            except: pass
+        else:
+            add_log(f"❌ Ditolak Server: {filename} ({res['error']})", "error")
+            failed.append(filename)
+    return failed
     
 # --- ROUTES ---
 @app.route('/')
@@ -109,8 +166,7 @@ def api_upload():
     if not STATE["target_ip"]:
         return jsonify({"error": "⚠️ Server Tujuan Belum Dipilih!"}), 400
 
-    success_count = 0
-    errors = []
+    items = []
 
     for file in files:
         if file.filename == '': continue
@@ -120,28 +176,32 @@ def api_upload():
         
         save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(save_path)
-        
-        # --- PERUBAHAN UTAMA DI SINI ---
-        # Kita panggil langsung (tanpa Threading) dan cek hasilnya
-        if send_sync(save_path, filename):
-            success_count += 1
-        else:
-            errors.append(filename)
-            # Jika gagal, file temp mungkin perlu dihapus atau dibiarkan untuk debug
-            # try: os.remove(save_path) 
-            # except: pass
+        items.append((save_path, filename))
+
+    # Satu sesi untuk semua foto (tanpa connect + auth per foto)
+    # Yang gagal masuk outbox dan dikirim ulang otomatis
+    errors = send_batch(items)
+    success_count = len(items) - len(errors)
+    lost = queue_retry(STATE["target_ip"], [item for item in items if item[1] in errors]) if errors else []
 
     # Logika Response ke Web
-    if len(errors) > 0:
-        # Jika ada yang gagal, kirim status Error (500) supaya JS menampilkan notif MERAH
+    if lost:
+        # Tidak bisa diantrekan: kirim status Error (500) supaya JS menampilkan notif MERAH
         return jsonify({
             "status": "error", 
-            "message": f"Gagal mengirim {len(errors)} file. Cek Server!",
-            "failed_files": errors
+            "error": f"Gagal mengirim {len(lost)} file. Cek Server!",
+            "failed_files": lost
         }), 500
+    if errors:
+        return jsonify({"status": "queued", "count": success_count, "queued": len(errors)}), 202
         
     return jsonify({"status": "ok", "count": success_count})
 
+@app.route('/api/outbox')
+def api_outbox():
+    """Backlog kirim ulang untuk UI: jumlah antre, item tertua, jumlah gagal"""
+    return jsonify(STATE["client"].outbox_stats())
+
 @app.route('/api/logs')
 def api_logs():
     return jsonify({"logs": STATE["logs"]})
@@ -106,6 +106,12 @@ async function uploadAllPhotos() {
             APP.photos = []; 
             renderGallery();
             slide(1);
+        } else if(res.ok && data.status === 'queued') {
+            // Foto sudah aman di antrean, dikirim ulang otomatis saat server kembali
+            showToast(`${data.count} terkirim, ${data.queued} foto masuk antrean kirim ulang.`, 'info');
+            APP.photos = [];
+            renderGallery();
+            slide(1);
         } else {
             throw new Error(data.error || 'Server menolak file');
         }
@@ -141,6 +141,21 @@ class SyncWebHandler(http.server.SimpleHTTPRequestHandler):
             elif action == 'toggle_delete':
                 STATE.config['allow_delete'] = not STATE.config['allow_delete']
                 STATE.add_log(f"Config: Allow Delete -> {STATE.config['allow_delete']}")
+            elif action == 'set_bandwidth':
+                try:
+                    # Input dalam KB/s, 0 / kosong = tanpa batas
+                    kbps = int(params.get('limit_kbps', ['0'])[0].strip() or 0)
+                    peer_ip = params.get('peer_ip', [''])[0].strip() or None
+                    if STATE.app_instance:
+                        STATE.app_instance.bp.set_bandwidth_limit(kbps * 1024, peer_ip)
+                    target = peer_ip or "global"
+                    STATE.add_log(f"Config: Limit {target} -> {kbps} KB/s" if kbps else f"Config: Limit {target} -> tanpa batas")
+                except Exception as e:
+                    STATE.add_log(f"Error Set Limit: {e}")
+            elif action == 'retry_outbox':
+                if STATE.app_instance:
+                    count = STATE.app_instance.bp.outbox.retry_failed()
+                    STATE.add_log(f"Outbox: {count} item gagal dicoba lagi")
             elif action == 'manual_add_peer':
                 try:
                     target_ip = params['target_ip'][0].strip()
@@ -169,6 +184,16 @@ class SyncWebHandler(http.server.SimpleHTTPRequestHandler):
 
         log_rows = "\n".join(STATE.logs[-10:])
 
+        fmt_rate = lambda r: f"{r // 1024} KB/s" if r else "Tanpa batas"
+        limits = STATE.app_instance.bp.get_bandwidth_limits() if STATE.app_instance else {"global": 0, "peers": {}, "active": {}}
+        limit_rows = f"<tr><td>Global</td><td><b>{fmt_rate(limits['global'])}</b></td></tr>"
+        for ip, rate in limits['peers'].items():
+            limit_rows += f"<tr><td>{ip}</td><td>{fmt_rate(rate)}</td></tr>"
+        active = limits['active']
+
+        outbox = STATE.app_instance.bp.outbox_stats() if STATE.app_instance else {"pending": 0, "inflight": 0, "failed": 0, "oldest_age": 0, "failures": 0}
+        oldest = f"{int(outbox['oldest_age'] // 60)} menit" if outbox['pending'] else "-"
+
         # [FIX 2] Menggunakan JavaScript untuk Refresh (Smart Reload)
         # Halaman hanya akan refresh jika user TIDAK sedang mengetik di input box.
         html = f"""
@@ -235,6 +260,35 @@ class SyncWebHandler(http.server.SimpleHTTPRequestHandler):
                 </form>
             </div>
 
+            <div class="card">
+                <h3>🚦 Bandwidth</h3>
+                <table>
+                    <tr><th width="30%">Target</th><th>Limit Kirim</th></tr>
+                    {limit_rows}
+                    <tr><td>Transfer Aktif</td><td>interactive: {active.get('interactive', 0)}, bulk: {active.get('bulk', 0)}</td></tr>
+                </table>
+                <br>
+                <form method="POST">
+                    <input type="hidden" name="action" value="set_bandwidth">
+                    Limit (KB/s, 0 = bebas): <input type="number" name="limit_kbps" value="0" min="0" size="8">
+                    IP Peer (kosong = global): <input type="text" name="peer_ip" size="15">
+                    <button type="submit">SET</button>
+                </form>
+            </div>
+
+            <div class="card">
+                <h3>📤 Antrean Kirim Ulang</h3>
+                <table>
+                    <tr><td width="30%">Antre</td><td><b>{outbox['pending']}</b> (sedang dikirim: {outbox['inflight']})</td></tr>
+                    <tr><td>Tertua</td><td>{oldest}</td></tr>
+                    <tr><td>Gagal</td><td>{outbox['failed']} item, {outbox['failures']} percobaan gagal</td></tr>
+                </table>
+                <br>
+                <form method="POST">
+                    <button type="submit" name="action" value="retry_outbox">Coba Lagi yang Gagal</button>
+                </form>
+            </div>
+
             <div class="card">
                 <h3>👥 Peers (Terhubung)</h3>
                 <table>
@@ -304,7 +358,8 @@ class SyncHandler(FileSystemEventHandler):
     def on_modified(self, event):
         if fname := self._process_event(event):
             STATE.add_log(f"FS: File Diubah -> {fname}")
-            self.app.sync_file(event.src_path)
+            # Peer sudah punya versi lama: cukup kirim bagian yang berubah
+            self.app.sync_file(event.src_path, delta=True)
             self.app.loop_preventer.update_signature(event.src_path)
 
     def on_deleted(self, event):
@@ -408,18 +463,32 @@ class BProtoSync:
             time.sleep(0.5)
             self.loop_preventer.update_signature(os.path.join(self.folder_path, filename))
 
-    def sync_file(self, filepath):
+    def _peer_ips(self):
+        with STATE.lock:
+            return [info['ip'] for info in STATE.peers.values()]
+
+    def sync_file(self, filepath, delta=False):
         filename = os.path.basename(filepath)
-        for info in STATE.peers.values():
-            peer_ip = info['ip']
-            STATE.add_log(f"Action: Mengirim {filename} ke {peer_ip}:{info['port']}")
-            STATE.add_history("Kirim File", filename, f"to {peer_ip}")
-            self.bp.send_file(peer_ip, filepath)
+        peers = self._peer_ips()
+        if not peers: return
+        STATE.add_log(f"Action: Mengirim {filename} ke {len(peers)} peer")
+        # Semua peer dikirim paralel; peer lambat/mati tidak menahan yang lain
+        results = self.bp.broadcast_file([filepath], peers, delta=delta, priority="bulk")
+        for peer_ip, res in results.items():
+            attempts = res['files'][filepath]['attempts']
+            detail = f"to {peer_ip}" + (f" ({attempts}x)" if attempts > 1 else "")
+            if not res["ok"] and os.path.exists(filepath):
+                # Peer offline / putus: outbox mencoba lagi di background
+                self.bp.queue_file(peer_ip, filepath, priority="bulk", delta=delta)
+                detail += ", antre kirim ulang"
+            STATE.add_history("Kirim File" if res["ok"] else "Gagal", filename, detail)
 
     def sync_delete(self, filename):
         payload = json.dumps({"cmd": SYNC_CMD_DELETE, "file": filename})
-        for info in STATE.peers.values():
-            self.bp.send_message(info['ip'], payload)
+        results = self.bp.broadcast_message(payload, self._peer_ips())
+        failed = [ip for ip, res in results.items() if not res['ok']]
+        if failed:
+            STATE.add_log(f"Error: Hapus {filename} gagal dikirim ke {', '.join(failed)}")
 
 if __name__ == "__main__":
     folder_arg = "SyncFolder"